@@ -0,0 +1,153 @@
+import os
+import struct
+import threading
+import time
+
+import pygame
+
+GAME_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# ============================================
+# DECODED AUDIO CACHE
+# ============================================
+#
+# One file per sound under AUDIO_CACHE_DIR:
+# header <4sHihHQq  magic, format version, mixer frequency, format and channels,
+#                   source file size and mtime (ns)
+# samples           as Sound.get_raw() returns them, ready for Sound(buffer=...)
+#
+# A cache file is used only while its header matches the mixer and the source
+# file exactly, so a new mixer setup or an edited sound decodes again.
+
+MAGIC = b'CQPC'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sHihHQq')
+
+AUDIO_CACHE_DIR = 'audio_cache'
+
+def find_asset(paths):
+    """First of the candidate paths that exists, relative to the working directory or
+    else to the game's own directory; None if there's none"""
+    for path in paths:
+        for candidate in (path, os.path.join(GAME_DIR, path)):
+            if os.path.exists(candidate):
+                return candidate
+    return None
+
+def load_sound(path, cache_dir=AUDIO_CACHE_DIR):
+    """(Sound, from_cache) for an audio file, skipping the decode if the cache has its samples"""
+    stat = os.stat(path)
+    frequency, size, channels = pygame.mixer.get_init()
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, frequency, size, channels, stat.st_size, stat.st_mtime_ns)
+    cache_path = os.path.join(cache_dir, os.path.basename(path) + '.pcm')
+    try:
+        with open(cache_path, 'rb') as f:
+            if f.read(HEADER.size) == header:
+                return pygame.mixer.Sound(buffer=f.read()), True
+    except OSError:
+        pass
+    sound = pygame.mixer.Sound(path)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        temp_path = cache_path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(header)
+            f.write(sound.get_raw())
+        os.replace(temp_path, cache_path)
+    except OSError as e:
+        print(f"Could not cache {path}: {e}")
+    return sound, False
+
+# ============================================
+# BACKGROUND LOADER
+# ============================================
+
+class AssetLoader:
+    """Loads sound effects, images and the music on a worker thread while the game starts.
+
+    sound() and image() return None until that asset is ready (or if it
+    failed to load), so callers just skip it. The music is opened last and
+    only starts once start_music(), called every frame, finds it ready.
+    `sound_files` maps names to paths; `image_files` maps names to
+    (candidate paths, size to scale to or None).
+    """
+    def __init__(self, sound_files, image_files=None, music_path=None,
+                 sound_volume=0.5, music_volume=0.3, cache_dir=AUDIO_CACHE_DIR):
+        self.sounds = {}  # Name -> Sound, filled in as each one loads
+        self.images = {}  # Name -> Surface as loaded; converted on first use by image()
+        self.converted = {}
+        self.sound_volume, self.music_volume = sound_volume, music_volume
+        self.cache_dir = cache_dir
+        self.music_ready = self.music_started = False
+        self.from_cache = self.decoded = 0
+        self.start = time.perf_counter()
+        self.ready_time = None  # Seconds from start until everything was loaded
+        self.thread = threading.Thread(target=self._run, args=(sound_files, image_files or {}, music_path),
+                                       name="asset-loader", daemon=True)
+        self.thread.start()
+
+    def _run(self, sound_files, image_files, music_path):
+        for name, path in sound_files.items():
+            try:
+                sound, cached = load_sound(find_asset((path,)) or path, self.cache_dir)
+            except Exception as e:
+                print(f"Could not load {path}: {e}")
+                continue
+            sound.set_volume(self.sound_volume)
+            self.sounds[name] = sound
+            if cached:
+                self.from_cache += 1
+            else:
+                self.decoded += 1
+
+        for name, (paths, size) in image_files.items():
+            path = find_asset(paths)
+            if path is None:
+                print(f"Could not find {name} image at any of: {', '.join(paths)}")
+                continue
+            try:
+                image = pygame.image.load(path)
+            except Exception as e:
+                print(f"Could not load {path}: {e}")
+                continue
+            self.images[name] = pygame.transform.scale(image, size) if size else image
+
+        if music_path:
+            try:
+                pygame.mixer.music.load(find_asset((music_path,)) or music_path)
+                self.music_ready = True
+            except Exception as e:
+                print(f"Could not load background music: {e}")
+        self.ready_time = time.perf_counter() - self.start
+
+    def sound(self, name):
+        return self.sounds.get(name)
+
+    def image(self, name):
+        image = self.converted.get(name)
+        if image is None:
+            image = self.images.get(name)
+            if image is not None:
+                image = self.converted[name] = image.convert_alpha()  # On the main thread, which owns the display
+        return image
+
+    def start_music(self):
+        """Start the looping music if it has loaded and isn't playing yet"""
+        if self.music_ready and not self.music_started:
+            self.music_started = True
+            pygame.mixer.music.set_volume(self.music_volume)
+            pygame.mixer.music.play(-1)
+
+    def stats(self):
+        return {
+            'sounds': len(self.sounds),
+            'from_cache': self.from_cache,
+            'decoded': self.decoded,
+            'images': len(self.images),
+            'music': self.music_ready,
+            'ready_ms': None if self.ready_time is None else self.ready_time * 1000,
+        }
+
+    def close(self):
+        """Wait for the loader to finish (it can't be stopped partway through a file)"""
+        self.thread.join()
@@ -0,0 +1,87 @@
+import time
+
+import pygame
+
+# ============================================
+# SOUND DISPATCH
+# ============================================
+
+VOICES = 4  # Mixer channels reserved for sound effects
+COALESCE_MS = 80  # A cue repeated within this long of its last play is merged into it
+CUE_PRIORITY = {'quest': 3, 'treasure': 3, 'key': 2, 'purchase': 2, 'dog': 1, 'coin': 0}  # Higher wins a voice
+
+class SoundDispatcher:
+    """Plays sound cues on a fixed set of reserved mixer channels, a tick's worth at a time.
+
+    request() queues a cue; flush(), once per tick, plays the queue most
+    important first. Requests for the same cue in one tick, and repeats
+    within `window_ms` of its last play, are merged into a single voice, so
+    a magnet sweeping up twenty coins sounds one coin. When every voice is
+    busy a cue takes the voice of a less important one, or is dropped.
+    `get_sound` maps a cue name to a Sound, or None while it's not loaded.
+    """
+    def __init__(self, get_sound, voices=VOICES, window_ms=COALESCE_MS, priorities=CUE_PRIORITY):
+        pygame.mixer.set_num_channels(max(pygame.mixer.get_num_channels(), voices))
+        pygame.mixer.set_reserved(voices)  # Sound.play() elsewhere never lands on these
+        self.channels = [pygame.mixer.Channel(i) for i in range(voices)]
+        self.voice_cues = [None] * voices  # Cue each channel was last given
+        self.get_sound = get_sound
+        self.window = window_ms / 1000
+        self.priorities = priorities
+        self.queue = {}  # Cue -> times requested since the last flush()
+        self.last_played = {}  # Cue -> time.perf_counter() of its last play
+        self.requested = self.played = self.merged = self.dropped = self.stolen = 0
+
+    def request(self, cue):
+        self.queue[cue] = self.queue.get(cue, 0) + 1
+        self.requested += 1
+
+    def flush(self, now=None):
+        """Play this tick's cues"""
+        if not self.queue:
+            return
+        now = time.perf_counter() if now is None else now
+        priorities = self.priorities
+        for cue in sorted(self.queue, key=lambda cue: -priorities.get(cue, 0)):
+            self.merged += self.queue[cue] - 1
+            sound = self.get_sound(cue)
+            if sound is None:
+                self.dropped += 1
+                continue
+            last = self.last_played.get(cue)
+            if last is not None and now - last < self.window:
+                self.merged += 1
+                continue
+            voice = self._voice(priorities.get(cue, 0))
+            if voice is None:
+                self.dropped += 1
+                continue
+            self.channels[voice].play(sound)
+            self.voice_cues[voice] = cue
+            self.last_played[cue] = now
+            self.played += 1
+        self.queue.clear()
+
+    def _voice(self, priority):
+        """An idle channel, else the busy one with the least important cue below `priority`"""
+        lowest = None
+        for i, channel in enumerate(self.channels):
+            if not channel.get_busy():
+                return i
+            cue_priority = self.priorities.get(self.voice_cues[i], 0)
+            if cue_priority < priority and (lowest is None or cue_priority < lowest[1]):
+                lowest = (i, cue_priority)
+        if lowest is None:
+            return None
+        self.stolen += 1
+        return lowest[0]
+
+    def stats(self):
+        return {
+            'requested': self.requested,
+            'played': self.played,
+            'merged': self.merged,
+            'dropped': self.dropped,
+            'stolen': self.stolen,
+            'voices': len(self.channels),
+        }
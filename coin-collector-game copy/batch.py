@@ -0,0 +1,268 @@
+from collections import deque
+
+import numpy as np
+
+from settings import SCREEN_WIDTH, SCREEN_HEIGHT, TILE_SIZE
+from pathfinding import find_walkable_goal, NEIGHBOR_OFFSETS
+from world import World, MOVE_LEFT, MOVE_RIGHT, MOVE_UP, MOVE_DOWN
+
+# ============================================
+# STATIC MAP TABLES
+# ============================================
+
+# Player positions are checked before clamping, so the collision table reaches
+# this far past the screen edges (more than the fastest step of 4px)
+POSITION_PAD = 8
+MIDNIGHT_COINS = 5
+
+class BatchMap:
+    """Lookup tables for one map layout, shared by every world in a batch.
+
+    Built from a template World: a table of player positions that collide with a
+    solid object, and an all-pairs next-step table equivalent to the chasers' flow field.
+    """
+    def __init__(self, template):
+        grid = template.collision_grid
+        self.grid_w, self.grid_h = grid.grid_w, grid.grid_h
+        self.blocked_positions = self._build_blocked_positions(
+            template.trees + template.houses + template.pushable_blocks)
+        self.goal_tile, self.next_step = self._build_next_steps(grid)
+
+    def _build_blocked_positions(self, solids):
+        """blocked[y + PAD, x + PAD] is True if a player at (x, y) overlaps a solid object"""
+        pad = POSITION_PAD
+        blocked = np.zeros((SCREEN_HEIGHT - TILE_SIZE + 2 * pad + 1,
+                            SCREEN_WIDTH - TILE_SIZE + 2 * pad + 1), dtype=bool)
+        for obj in solids:
+            if not obj.solid:
+                continue
+            rect = obj.rect
+            # Same overlap test as Rect.colliderect for a TILE_SIZE player rect
+            x0 = max(rect.left - TILE_SIZE + 1 + pad, 0)
+            y0 = max(rect.top - TILE_SIZE + 1 + pad, 0)
+            blocked[y0:rect.bottom + pad, x0:rect.right + pad] = True
+        return blocked
+
+    def _build_next_steps(self, grid):
+        """goal_tile[player tile] and next_step[goal tile, npc tile] (flat tile indices, -1 = stay)"""
+        grid_w, grid_h, cells = grid.grid_w, grid.grid_h, grid.cells
+        tiles = grid_w * grid_h
+
+        goal_tile = np.empty(tiles, dtype=np.int32)
+        for gy in range(grid_h):
+            for gx in range(grid_w):
+                goal_gx, goal_gy = find_walkable_goal(grid, gx, gy)
+                goal_tile[gy * grid_w + gx] = goal_gy * grid_w + goal_gx
+
+        # Neighbor tile of every tile in NEIGHBOR_OFFSETS order, -1 off the grid
+        tile_x = np.arange(tiles) % grid_w
+        tile_y = np.arange(tiles) // grid_w
+        neighbors = np.full((len(NEIGHBOR_OFFSETS), tiles), -1, dtype=np.int64)
+        for k, (dx, dy) in enumerate(NEIGHBOR_OFFSETS):
+            nx, ny = tile_x + dx, tile_y + dy
+            inside = (nx >= 0) & (nx < grid_w) & (ny >= 0) & (ny < grid_h)
+            neighbors[k, inside] = (ny * grid_w + nx)[inside]
+
+        unreachable = np.iinfo(np.int32).max
+        next_step = np.full((tiles, tiles), -1, dtype=np.int32)
+        for goal in range(tiles):
+            distance = self._bfs(cells, grid_w, grid_h, goal)
+            # Same choice as FlowField.next_waypoint: the first neighbor with the lowest distance
+            neighbor_distance = np.where(neighbors >= 0, distance[neighbors], -1)
+            neighbor_distance = np.where(neighbor_distance == -1, unreachable, neighbor_distance)
+            best_k = neighbor_distance.argmin(axis=0)
+            best = neighbor_distance[best_k, np.arange(tiles)]
+            valid = (best != unreachable) & (distance != 0) & ((distance == -1) | (best < distance))
+            next_step[goal, valid] = neighbors[best_k, np.arange(tiles)][valid]
+        return goal_tile, next_step
+
+    @staticmethod
+    def _bfs(cells, grid_w, grid_h, start):
+        """Step counts from start over walkable tiles (-1 = unreachable), as FlowField builds them"""
+        distance = np.full(grid_w * grid_h, -1, dtype=np.int32)
+        if cells[start] != 0:
+            return distance
+        distance[start] = 0
+        queue = deque([start])
+        while queue:
+            current = queue.popleft()
+            cy, cx = divmod(current, grid_w)
+            for dx, dy in NEIGHBOR_OFFSETS:
+                nx, ny = cx + dx, cy + dy
+                if 0 <= nx < grid_w and 0 <= ny < grid_h:
+                    neighbor = ny * grid_w + nx
+                    if cells[neighbor] == 0 and distance[neighbor] == -1:
+                        distance[neighbor] = distance[current] + 1
+                        queue.append(neighbor)
+        return distance
+
+# ============================================
+# BATCHED WORLDS
+# ============================================
+
+class BatchWorld:
+    """N independent Coin Quest worlds advanced in lock-step with NumPy.
+
+    Covers what agents train against: player movement and collision, coin
+    pickup (with the magnet), midnight coins, the chase guards and the
+    dist < 30 catch test. Dialogue, quests, keys, the shop and block pushing
+    are left out (blocks act as fixed walls), so use World for full games.
+    A world stops updating once it is won or lost until reset() is called.
+    """
+    def __init__(self, n_worlds, seed=None, speed_boots=False, magnet=False, batch_map=None):
+        template = World()
+        self.map = batch_map or BatchMap(template)
+        self.n = n_worlds
+        self.rng = np.random.default_rng(seed)
+        self.n_coins = len(template.coins)
+
+        chasers = [npc for npc in template.npcs if npc.ai_type == 'chase' and getattr(npc, 'is_enemy', False)]
+        self.chaser_start = np.array([[npc.x, npc.y] for npc in chasers], dtype=np.float64).reshape(-1, 2)
+        self.chaser_speed = np.array([npc.speed for npc in chasers], dtype=np.float64)
+        self.detection_range = np.array([npc.detection_range for npc in chasers], dtype=np.float64)
+        self.player_start = (template.player_x, template.player_y)
+
+        n, slots, n_chasers = n_worlds, self.n_coins + MIDNIGHT_COINS, len(chasers)
+        self.speed = np.full(n, template.base_speed * (2 if speed_boots else 1), dtype=np.int64)
+        self.magnet = np.full(n, magnet, dtype=bool)
+        self.player_x = np.zeros(n, dtype=np.int64)
+        self.player_y = np.zeros(n, dtype=np.int64)
+        self.coin_x = np.zeros((n, slots), dtype=np.int64)
+        self.coin_y = np.zeros((n, slots), dtype=np.int64)
+        self.coin_active = np.zeros((n, slots), dtype=bool)  # Midnight slots are only active at night
+        self.coin_collected = np.zeros((n, slots), dtype=bool)
+        self.midnight_spawned = np.zeros(n, dtype=bool)
+        self.npc_x = np.zeros((n, n_chasers), dtype=np.float64)
+        self.npc_y = np.zeros((n, n_chasers), dtype=np.float64)
+        self.npc_target_x = np.zeros((n, n_chasers), dtype=np.float64)
+        self.npc_target_y = np.zeros((n, n_chasers), dtype=np.float64)
+        self.npc_has_target = np.zeros((n, n_chasers), dtype=bool)
+        self.coins_collected = np.zeros(n, dtype=np.int64)
+        self.game_time = np.zeros(n, dtype=np.float64)
+        self.frame_count = np.zeros(n, dtype=np.int64)
+        self.game_over = np.zeros(n, dtype=bool)
+        self.game_won = np.zeros(n, dtype=bool)
+        self.reset()
+
+    def reset(self, mask=None):
+        """Start new episodes in the worlds selected by mask (default: all)"""
+        if mask is None:
+            mask = np.ones(self.n, dtype=bool)
+        count = int(np.count_nonzero(mask))
+        if count == 0:
+            return
+        n_coins = self.n_coins
+        self.player_x[mask], self.player_y[mask] = self.player_start
+        self.coin_x[mask, :n_coins] = self.rng.integers(50, SCREEN_WIDTH - 50, (count, n_coins), endpoint=True)
+        self.coin_y[mask, :n_coins] = self.rng.integers(50, SCREEN_HEIGHT - 50, (count, n_coins), endpoint=True)
+        self.coin_active[mask] = False
+        self.coin_active[mask, :n_coins] = True
+        self.coin_collected[mask] = False
+        self.midnight_spawned[mask] = False
+        self.npc_x[mask] = self.chaser_start[:, 0]
+        self.npc_y[mask] = self.chaser_start[:, 1]
+        self.npc_has_target[mask] = False
+        self.coins_collected[mask] = 0
+        self.game_time[mask] = 0
+        self.frame_count[mask] = 0
+        self.game_over[mask] = False
+        self.game_won[mask] = False
+
+    @property
+    def done(self):
+        return self.game_over | self.game_won
+
+    def step(self, actions, n_ticks=1):
+        """Advance every running world n_ticks. `actions` is one movement bitmask
+        (world.MOVE_*) for all worlds or an array with one per world."""
+        actions = np.broadcast_to(np.asarray(actions, dtype=np.int64), (self.n,))
+        for _ in range(n_ticks):
+            self.tick(actions)
+
+    def tick(self, actions):
+        alive = ~self.done
+        self.frame_count += alive
+        self.game_time = np.where(alive, (self.game_time + 0.5) % 1440, self.game_time)
+        self._update_midnight_coins(alive)
+        self._update_chasers(alive)
+        self._update_players(alive & ~self.game_over, actions)
+
+    def _update_midnight_coins(self, alive):
+        game_time = self.game_time
+        night = (game_time < 360) | (game_time >= 1140)
+        spawn = alive & night & (game_time > 1200) & ~self.midnight_spawned
+        count = int(np.count_nonzero(spawn))
+        if count:
+            n_coins = self.n_coins
+            self.coin_x[spawn, n_coins:] = self.rng.integers(50, 750, (count, MIDNIGHT_COINS), endpoint=True)
+            self.coin_y[spawn, n_coins:] = self.rng.integers(50, 550, (count, MIDNIGHT_COINS), endpoint=True)
+            self.coin_active[spawn, n_coins:] = True
+            self.coin_collected[spawn, n_coins:] = False
+            self.midnight_spawned[spawn] = True
+        cleared = alive & ~night
+        self.coin_active[cleared, self.n_coins:] = False
+        self.midnight_spawned[cleared] = False
+
+    def _update_chasers(self, alive):
+        """Flow-field chase and the catch test, for every chaser in every world"""
+        batch_map = self.map
+        grid_w = batch_map.grid_w
+        px = self.player_x[:, None].astype(np.float64)
+        py = self.player_y[:, None].astype(np.float64)
+        npc_x, npc_y = self.npc_x, self.npc_y
+
+        dist = np.sqrt((npc_x - px)**2 + (npc_y - py)**2)
+        in_range = alive[:, None] & (dist < self.detection_range)
+        self.npc_has_target &= in_range | ~alive[:, None]
+
+        # Chasers without a waypoint look up the next tile toward the player
+        need = in_range & ~self.npc_has_target
+        if need.any():
+            player_tile = (self.player_y // TILE_SIZE) * grid_w + self.player_x // TILE_SIZE
+            goal = batch_map.goal_tile[player_tile][:, None]
+            tile_x = np.floor_divide(npc_x, TILE_SIZE).astype(np.int64)
+            tile_y = np.floor_divide(npc_y, TILE_SIZE).astype(np.int64)
+            inside = (tile_x >= 0) & (tile_x < grid_w) & (tile_y >= 0) & (tile_y < batch_map.grid_h)
+            npc_tile = np.where(inside, tile_y * grid_w + tile_x, 0)
+            step = np.where(inside, batch_map.next_step[np.broadcast_to(goal, npc_tile.shape), npc_tile], -1)
+            found = need & (step >= 0)
+            half = TILE_SIZE // 2
+            self.npc_target_x = np.where(found, (step % grid_w) * TILE_SIZE + half, self.npc_target_x)
+            self.npc_target_y = np.where(found, (step // grid_w) * TILE_SIZE + half, self.npc_target_y)
+            self.npc_has_target |= found
+
+        moving = in_range & self.npc_has_target
+        dx = self.npc_target_x - npc_x
+        dy = self.npc_target_y - npc_y
+        dist_to_target = np.sqrt(dx**2 + dy**2)
+        reached = moving & (dist_to_target < 5)
+        self.npc_has_target &= ~reached
+        step_on = moving & ~reached
+        safe = np.where(step_on, dist_to_target, 1.0)
+        self.npc_x = np.where(step_on, npc_x + dx / safe * self.chaser_speed, npc_x)
+        self.npc_y = np.where(step_on, npc_y + dy / safe * self.chaser_speed, npc_y)
+
+        caught = np.sqrt((self.npc_x - px)**2 + (self.npc_y - py)**2) < 30
+        self.game_over |= alive & caught.any(axis=1)
+
+    def _update_players(self, active, actions):
+        speed = self.speed
+        new_x = self.player_x - speed * ((actions & MOVE_LEFT) != 0) + speed * ((actions & MOVE_RIGHT) != 0)
+        new_y = self.player_y - speed * ((actions & MOVE_UP) != 0) + speed * ((actions & MOVE_DOWN) != 0)
+
+        pad = POSITION_PAD
+        free = ~self.map.blocked_positions[new_y + pad, new_x + pad]
+        move = active & free
+        self.player_x = np.where(move, new_x, self.player_x).clip(0, SCREEN_WIDTH - TILE_SIZE)
+        self.player_y = np.where(move, new_y, self.player_y).clip(0, SCREEN_HEIGHT - TILE_SIZE)
+
+        # Collect coins: magnet range or rect overlap
+        px, py = self.player_x[:, None], self.player_y[:, None]
+        coin_x, coin_y = self.coin_x, self.coin_y
+        live = active[:, None] & self.coin_active & ~self.coin_collected
+        overlap = (coin_x < px + TILE_SIZE) & (px < coin_x + 16) & (coin_y < py + TILE_SIZE) & (py < coin_y + 16)
+        magnet = self.magnet[:, None] & (np.sqrt((coin_x - px)**2 + (coin_y - py)**2) < 80)
+        taken = live & (overlap | magnet)
+        self.coin_collected |= taken
+        self.coins_collected += taken.sum(axis=1)
+        self.game_won |= active & (self.coins_collected >= 100)
@@ -0,0 +1,67 @@
+"""Batch simulation benchmark: aggregate ticks/sec of BatchWorld against N separate Worlds in a loop.
+
+Usage: python bench_batch.py [--worlds 1,64,1024] [--ticks N] [--seed N]
+"""
+import argparse
+import os
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import numpy as np
+
+from world import World
+from batch import BatchWorld, BatchMap
+
+def random_actions(rng, n_worlds, n_ticks):
+    """One movement bitmask per world per tick, held for ~20 ticks like a player would"""
+    actions = rng.integers(0, 16, (n_ticks, n_worlds))
+    held = rng.random((n_ticks, n_worlds)) < 0.95
+    for t in range(1, n_ticks):
+        actions[t] = np.where(held[t], actions[t - 1], actions[t])
+    return actions
+
+def batch_ticks_per_second(batch_map, n_worlds, actions, seed):
+    batch = BatchWorld(n_worlds, seed=seed, batch_map=batch_map)
+    start = time.perf_counter()
+    for tick_actions in actions:
+        batch.step(tick_actions)
+        done = batch.done
+        if done.any():
+            batch.reset(done)
+    elapsed = time.perf_counter() - start
+    return len(actions) * n_worlds / elapsed
+
+def world_loop_ticks_per_second(n_worlds, actions, seed):
+    worlds = [World(seed=seed + i) for i in range(n_worlds)]
+    start = time.perf_counter()
+    for tick_actions in actions:
+        for i, world in enumerate(worlds):
+            world.step(int(tick_actions[i]))
+            if world.game_over or world.game_won:
+                world.restart()
+    elapsed = time.perf_counter() - start
+    return len(actions) * n_worlds / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--worlds', default="1,64,1024")
+    parser.add_argument('--ticks', type=int, default=600, help="ticks per measurement")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    batch_map = BatchMap(World())
+    print(f"map tables built in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    for n_worlds in (int(v) for v in args.worlds.split(',')):
+        actions = random_actions(np.random.default_rng(args.seed), n_worlds, args.ticks)
+        batch_rate = batch_ticks_per_second(batch_map, n_worlds, actions, args.seed)
+        # Looping Worlds scales linearly, so a slice of the ticks is enough to time it
+        loop_ticks = max(1, args.ticks * 64 // max(n_worlds, 64))
+        loop_rate = world_loop_ticks_per_second(n_worlds, actions[:loop_ticks], args.seed)
+        print(f"{n_worlds:>6} worlds: BatchWorld {batch_rate:12.0f} ticks/sec | "
+              f"World loop {loop_rate:10.0f} ticks/sec | speedup {batch_rate / loop_rate:6.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,292 @@
+"""Pathfinding benchmark: searches/sec and grid build cost on the game map size and on large grids.
+
+Usage: python bench_pathfinding.py [--seconds N] [--no-legacy] [--sizes 25x18,256x256]
+
+Grids big enough for HPA* also get a line comparing it with the flat search.
+Before timing, each size checks the heap search against the legacy one (where
+that finishes) and PathScheduler's sliced searches against astar_path.
+"""
+import argparse
+import random
+import sys
+import time
+
+from settings import TILE_SIZE
+from pathfinding import (create_collision_grid, astar_path, world_to_grid, grid_to_world, get_hierarchy,
+                         PathScheduler, HPA_MIN_TILES)
+
+# ============================================
+# REFERENCE IMPLEMENTATION
+# ============================================
+
+def legacy_astar_path(grid, start, goal):
+    """The original sort-and-pop(0) A*, kept to check results and compare speed"""
+    if not grid:
+        return []
+
+    grid_w = len(grid)
+    grid_h = len(grid[0])
+
+    start_gx, start_gy = world_to_grid(start[0], start[1])
+    goal_gx, goal_gy = world_to_grid(goal[0], goal[1])
+
+    if not (0 <= start_gx < grid_w and 0 <= start_gy < grid_h):
+        return []
+    if not (0 <= goal_gx < grid_w and 0 <= goal_gy < grid_h):
+        return []
+
+    if grid[goal_gx][goal_gy] == 1:
+        for r in range(1, 5):
+            found = False
+            for dx in range(-r, r+1):
+                for dy in range(-r, r+1):
+                    ngx, ngy = goal_gx + dx, goal_gy + dy
+                    if 0 <= ngx < grid_w and 0 <= ngy < grid_h and grid[ngx][ngy] == 0:
+                        goal_gx, goal_gy = ngx, ngy
+                        found = True
+                        break
+                if found:
+                    break
+            if found:
+                break
+
+    def heuristic(a, b):
+        return abs(a[0] - b[0]) + abs(a[1] - b[1])
+
+    start_node = (start_gx, start_gy)
+    goal_node = (goal_gx, goal_gy)
+
+    frontier = [(0, start_node)]
+    came_from = {start_node: None}
+    cost_so_far = {start_node: 0}
+
+    while frontier:
+        frontier.sort(key=lambda x: x[0])
+        current_cost, current = frontier.pop(0)
+
+        if current == goal_node:
+            path = []
+            while current:
+                wx, wy = grid_to_world(current[0], current[1])
+                path.append((wx + TILE_SIZE//2, wy + TILE_SIZE//2))
+                current = came_from[current]
+            path.reverse()
+            return path[1:]
+
+        for dx, dy in [(0, 1), (1, 0), (0, -1), (-1, 0)]:
+            nx, ny = current[0] + dx, current[1] + dy
+            if 0 <= nx < grid_w and 0 <= ny < grid_h and grid[nx][ny] == 0:
+                neighbor = (nx, ny)
+                new_cost = cost_so_far[current] + 1
+                if neighbor not in cost_so_far or new_cost < cost_so_far[neighbor]:
+                    cost_so_far[neighbor] = new_cost
+                    priority = new_cost + heuristic(neighbor, goal_node)
+                    frontier.append((priority, neighbor))
+                    came_from[neighbor] = current
+
+    return []
+
+def legacy_create_collision_grid(obstacles, width, height):
+    """The original list-of-lists grid with nested-loop stamping"""
+    grid_w = width // TILE_SIZE
+    grid_h = height // TILE_SIZE
+    grid = [[0 for _ in range(grid_h)] for _ in range(grid_w)]
+
+    for obj in obstacles:
+        if obj.solid:
+            gx, gy = world_to_grid(obj.x, obj.y)
+            for dx in range(-1, 3):
+                for dy in range(-1, 3):
+                    ngx, ngy = gx + dx, gy + dy
+                    if 0 <= ngx < grid_w and 0 <= ngy < grid_h:
+                        grid[ngx][ngy] = 1
+    return grid
+
+# ============================================
+# SCENARIOS
+# ============================================
+
+class Obstacle:
+    """Minimal stand-in for a solid GameObject"""
+    def __init__(self, x, y):
+        self.x, self.y, self.solid = x, y, True
+
+def make_obstacles(tiles_w, tiles_h, rng, density=0.04):
+    """Scatter solid obstacles at about the same density as the game map (17 per 450 tiles)"""
+    count = int(tiles_w * tiles_h * density)
+    return [Obstacle(rng.randrange(tiles_w) * TILE_SIZE, rng.randrange(tiles_h) * TILE_SIZE)
+            for _ in range(count)]
+
+def make_grid(tiles_w, tiles_h, rng, density=0.04):
+    obstacles = make_obstacles(tiles_w, tiles_h, rng, density)
+    return create_collision_grid(obstacles, tiles_w * TILE_SIZE, tiles_h * TILE_SIZE)
+
+def legacy_grid(grid):
+    """The old list-of-lists 0/1 layout of a CollisionGrid, as legacy_astar_path expects"""
+    return [[1 if grid.is_blocked(gx, gy) else 0 for gy in range(grid.grid_h)]
+            for gx in range(grid.grid_w)]
+
+def make_queries(grid, count, rng):
+    """Random start/goal pixel positions; starts are walkable, goals may be blocked"""
+    grid_w, grid_h = grid.grid_w, grid.grid_h
+    queries = []
+    while len(queries) < count:
+        sx, sy = rng.randrange(grid_w), rng.randrange(grid_h)
+        if grid.is_blocked(sx, sy):
+            continue
+        gx, gy = rng.randrange(grid_w), rng.randrange(grid_h)
+        queries.append(((sx * TILE_SIZE + 4, sy * TILE_SIZE + 4), (gx * TILE_SIZE + 4, gy * TILE_SIZE + 4)))
+    return queries
+
+def flat_astar_path(grid, start, goal):
+    return astar_path(grid, start, goal, hierarchical=False)
+
+def searches_per_second(path_fn, grid, queries, seconds):
+    """Run queries round-robin for about `seconds`; returns (searches/sec, searches run)"""
+    path_fn(grid, *queries[0])  # Warm up (first search on a grid size allocates its buffers)
+    done = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < seconds:
+        s, g = queries[done % len(queries)]
+        path_fn(grid, s, g)
+        done += 1
+        elapsed = time.perf_counter() - start
+    return done / elapsed, done
+
+def verify(grid, queries):
+    """Check that the heap engine returns exactly the legacy paths"""
+    old_grid = legacy_grid(grid)
+    for s, g in queries:
+        if flat_astar_path(grid, s, g) != legacy_astar_path(old_grid, s, g):
+            raise AssertionError(f"path mismatch for start={s} goal={g}")
+
+class _Waiter:
+    """A path owner for verify_scheduler: checks each path it's handed against astar_path"""
+    def __init__(self, grid, start, goal):
+        self.grid, self.start, self.goal = grid, start, goal
+        self.paths = 0
+
+    def set_path(self, path):
+        # Checked on delivery, against the grid as it is then: a search the grid
+        # changed under must have started over
+        if path != astar_path(self.grid, self.start, self.goal, cached=False):
+            raise AssertionError(f"scheduled path mismatch for start={self.start} goal={self.goal}")
+        self.paths += 1
+
+def verify_scheduler(grid, queries, rng, budget_us=100):
+    """Check that PathScheduler hands out exactly astar_path's paths when searches are
+    sliced over many ticks, queued by priority and restarted by grid changes"""
+    scheduler = PathScheduler(budget_us)
+    waiters = [_Waiter(grid, s, g) for s, g in queries]
+    for waiter in waiters:
+        scheduler.request(waiter, grid, waiter.start, waiter.goal, rng.randrange(4))
+    blocks = []
+    while scheduler.queue:
+        scheduler.begin_tick()
+        # Now and then lift a block, or drop one on the route of a search that's part-done
+        if scheduler.queue and rng.random() < 0.1:
+            if blocks and rng.random() < 0.3:
+                grid.remove(blocks.pop(rng.randrange(len(blocks))))
+            else:
+                waiter = rng.choice(scheduler.queue)[2].owner
+                route = astar_path(grid, waiter.start, waiter.goal, cached=False)
+                if route:
+                    x, y = rng.choice(route)
+                    blocks.append(Obstacle(x // TILE_SIZE * TILE_SIZE, y // TILE_SIZE * TILE_SIZE))
+                    grid.add(blocks[-1])
+    for block in blocks:
+        grid.remove(block)
+    if any(waiter.paths != 1 for waiter in waiters):
+        raise AssertionError("a scheduled request was never answered, or answered twice")
+
+def grid_build_report(tiles_w, tiles_h, rng):
+    """Build time and bytes per tile of the legacy list-of-lists grid vs CollisionGrid"""
+    obstacles = make_obstacles(tiles_w, tiles_h, rng)
+    width, height = tiles_w * TILE_SIZE, tiles_h * TILE_SIZE
+
+    start = time.perf_counter()
+    old = legacy_create_collision_grid(obstacles, width, height)
+    legacy_ms = (time.perf_counter() - start) * 1000
+    legacy_bytes = sys.getsizeof(old) + sum(sys.getsizeof(column) for column in old)
+
+    start = time.perf_counter()
+    new = create_collision_grid(obstacles, width, height)
+    new_ms = (time.perf_counter() - start) * 1000
+    new_bytes = sys.getsizeof(new.cells)
+
+    tiles = tiles_w * tiles_h
+    return (f"grid build legacy {legacy_ms:8.1f} ms, {legacy_bytes / tiles:5.2f} B/tile | "
+            f"CollisionGrid {new_ms:8.1f} ms, {new_bytes / tiles:5.2f} B/tile")
+
+def check_path(grid, start, path):
+    """Check that a path is a walk of single walkable steps from the start tile"""
+    x, y = world_to_grid(*start)
+    for px, py in path:
+        nx, ny = world_to_grid(px, py)
+        if abs(nx - x) + abs(ny - y) != 1 or grid.is_blocked(nx, ny):
+            raise AssertionError(f"bad step {(x, y)} -> {(nx, ny)} from start={start}")
+        x, y = nx, ny
+
+def hpa_report(grid, queries, flat_rate, seconds, rng):
+    """HPA* on a fresh grid (clusters worked out as searches reach them), once every
+    cluster is known, and right after a local change, against the flat search"""
+    grid.hierarchy = None
+    start = time.perf_counter()
+    for s, g in queries[:20]:
+        check_path(grid, s, astar_path(grid, s, g))
+    cold_us = (time.perf_counter() - start) / 20 * 1e6
+
+    hierarchy = get_hierarchy(grid)
+    hierarchy.reset()
+    start = time.perf_counter()
+    hierarchy.build_all()
+    build_ms = (time.perf_counter() - start) * 1000
+    rate, _ = searches_per_second(astar_path, grid, queries, seconds)
+
+    # Drop a block somewhere, search, take it away again: each costs only the clusters around it
+    start = time.perf_counter()
+    changes = 50
+    for i in range(changes):
+        block = Obstacle(rng.randrange(grid.grid_w) * TILE_SIZE, rng.randrange(grid.grid_h) * TILE_SIZE)
+        grid.add(block)
+        astar_path(grid, *queries[i % len(queries)])
+        grid.remove(block)
+    changed_us = (time.perf_counter() - start) / changes * 1e6
+
+    return (f"HPA* {1e6 / rate:8.0f} us/search ({rate / flat_rate:5.1f}x flat) | first searches {cold_us:8.0f} us | "
+            f"after a block change {changed_us:8.0f} us | all {hierarchy.cols * hierarchy.rows} clusters {build_ms:6.0f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=2.0, help="time budget per measurement")
+    parser.add_argument('--sizes', default="25x18,256x256,1024x1024")
+    parser.add_argument('--no-legacy', action='store_true', help="skip the legacy A* timings")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    for size in args.sizes.split(','):
+        tiles_w, tiles_h = (int(v) for v in size.split('x'))
+        rng = random.Random(args.seed)
+        grid = make_grid(tiles_w, tiles_h, rng)
+        queries = make_queries(grid, 200, rng)
+
+        # The legacy search is quadratic in frontier size; only check/time it where it finishes
+        run_legacy = not args.no_legacy and tiles_w * tiles_h <= 256 * 256
+        if run_legacy:
+            verify(grid, queries[:50 if tiles_w * tiles_h <= 2000 else 5])
+
+        verify_scheduler(grid, queries[:20], random.Random(args.seed))
+
+        rate, n = searches_per_second(flat_astar_path, grid, queries, args.seconds)
+        line = f"{size:>10}: heap A* {rate:10.1f} searches/sec ({n} runs)"
+        if run_legacy:
+            legacy_rate, _ = searches_per_second(legacy_astar_path, legacy_grid(grid), queries, args.seconds)
+            line += f" | legacy {legacy_rate:10.1f} searches/sec | speedup {rate / legacy_rate:6.1f}x"
+        print(line)
+        if tiles_w * tiles_h >= HPA_MIN_TILES:
+            print(f"{'':>10}  {hpa_report(grid, queries, rate, args.seconds, rng)}")
+        print(f"{'':>10}  {grid_build_report(tiles_w, tiles_h, rng)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,471 @@
+"""Benchmark suite for the hot paths, on the game map and on larger synthetic scenarios.
+
+Usage: python bench_suite.py [--scenarios game,medium,large] [--scenario NAME:WxH:DENSITY:NPCS:COINS]
+                             [--only astar_path,render_frame] [--seconds N]
+                             [--json results.json] [--baseline bench_baseline.json] [--tolerance 0.25]
+
+Each result is the time of one call in microseconds (median, mean and the
+fastest sample). With --baseline, any benchmark whose fastest sample is slower
+than the baseline's by more than the tolerance is reported and the exit
+status is 1; the fastest sample is the one least disturbed by other load.
+
+Before timing, each scenario checks CoinStore's nearest-coin search against
+a brute-force one, and runs the crowd as NPC objects and as an NPCStore side
+by side, reporting how many NPCs ended up apart.
+"""
+import argparse
+import gc
+import json
+import math
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+from settings import TILE_SIZE
+from pathfinding import PathCache, PathScheduler, create_collision_grid, astar_path, FlowField
+from spatial import SpatialHash
+from world import World, GameObject, NPC, check_collision, MOVE_RIGHT, MOVE_DOWN
+from bench_pathfinding import make_queries
+from npcstore import NPCStore
+from coins import MIDNIGHT
+
+# ============================================
+# SCENARIOS
+# ============================================
+
+# name -> (tiles_w, tiles_h, obstacle density, NPC count, coin count); 'game' is the real map
+SCENARIOS = {
+    'game': (25, 18, None, None, None),
+    'medium': (64, 64, 0.05, 40, 400),
+    'large': (256, 256, 0.05, 200, 5000),
+}
+AI_TYPES = ('static', 'chase', 'patrol', 'wander')
+
+def parse_scenario(text):
+    name, size, density, npcs, coins = text.split(':')
+    tiles_w, tiles_h = (int(v) for v in size.split('x'))
+    return name, (tiles_w, tiles_h, float(density), int(npcs), int(coins))
+
+def make_npc(ai_type, x, y, rng, width, height):
+    npc = NPC(x, y, ai_type.upper(), None, ai_type, rng)
+    if ai_type == 'chase':
+        npc.speed, npc.is_enemy = 2.0, True
+    elif ai_type == 'patrol':
+        npc.speed = 1.5
+        npc.patrol_points = [(rng.randrange(width - TILE_SIZE), rng.randrange(height - TILE_SIZE)) for _ in range(4)]
+    return npc
+
+def scenario_world(spec, seed=1):
+    """A World on the scenario's map, with its NPCs and coins (the game map is left as is)"""
+    world = World(seed)
+    tiles_w, tiles_h, density, npc_count, coin_count = spec
+    if density is None:
+        return world
+    rng = random.Random(seed)
+    width, height = tiles_w * TILE_SIZE, tiles_h * TILE_SIZE
+
+    count = int(tiles_w * tiles_h * density)
+    world.trees = [GameObject(rng.randrange(tiles_w) * TILE_SIZE, rng.randrange(tiles_h) * TILE_SIZE, None, True)
+                   for _ in range(count)]
+    world.houses, world.pushable_blocks, world.block_starts = [], [], []
+    world.all_obstacles = world.trees + [world.chest]
+    world.collision_grid = create_collision_grid(world.all_obstacles, width, height)
+    world.collision_grid.path_cache = PathCache()
+    world.solid_objects = SpatialHash()
+    for obj in world.trees:
+        world.solid_objects.insert(obj)
+
+    def free_spot():
+        while True:
+            x, y = rng.randrange(width - TILE_SIZE), rng.randrange(height - TILE_SIZE)
+            if world.collision_grid.area_clear(x, y, TILE_SIZE, TILE_SIZE):
+                return x, y
+
+    world.npcs = [make_npc(AI_TYPES[i % len(AI_TYPES)], *free_spot(), rng, width, height)
+                  for i in range(npc_count)]
+    world.coin_store.clear()
+    world.coins = [world.coin_store.spawn(rng.randrange(width - 16), rng.randrange(height - 16), rng)
+                   for _ in range(coin_count)]
+    world.player_x, world.player_y = free_spot()
+    world.width, world.height = width, height
+    world.refile()
+    return world
+
+# ============================================
+# BENCHMARKS
+# ============================================
+# Each takes (world, rng) and returns a zero-argument function to time. Every
+# call does the same work (state is reset first), so samples are comparable
+# run to run; `run.calls` is how many operations one call covers.
+
+def bench_astar_path(world, rng):
+    queries = make_queries(world.collision_grid, 20, rng)
+    grid = world.collision_grid
+    def run():
+        for start, goal in queries:
+            astar_path(grid, start, goal, cached=False)
+    run.calls = len(queries)
+    return run
+
+def bench_create_collision_grid(world, rng):
+    grid = world.collision_grid
+    obstacles = world.all_obstacles
+    width, height = grid.grid_w * TILE_SIZE, grid.grid_h * TILE_SIZE
+    return lambda: create_collision_grid(obstacles, width, height)
+
+def bench_check_collision(world, rng):
+    grid = world.collision_grid
+    points = [(rng.randrange(grid.grid_w * TILE_SIZE - TILE_SIZE), rng.randrange(grid.grid_h * TILE_SIZE - TILE_SIZE))
+              for _ in range(1000)]
+    solid_objects = world.solid_objects
+    def run():
+        for x, y in points:
+            check_collision(x, y, solid_objects, grid)
+    run.calls = len(points)
+    return run
+
+def bench_find_nearest_coin(world, rng):
+    return world.find_nearest_coin
+
+def check_nearest_coin(world, rng, queries=200):
+    """CoinStore.nearest's ring search against a look at every coin, from random points,
+    with all the scenario's coins and again with a third of them collected"""
+    store = world.coin_store
+    xs, ys, kinds = store.xs, store.ys, store.kinds
+    held = rng.sample(world.coins, len(world.coins) // 3)
+    for collected in (False, True):
+        store.set_collected(held, collected)
+        for _ in range(queries):
+            x, y = rng.uniform(0, world.width), rng.uniform(0, world.height)
+            dists = {slot: math.sqrt((xs[slot] - x)**2 + (ys[slot] - y)**2) for slot in range(store.high)
+                     if not store.collected[slot] and kinds[slot] != MIDNIGHT}
+            closest = min(dists.values(), default=None)
+            expected = sorted(slot for slot, dist in dists.items() if dist == closest)
+            assert store.nearest(x, y) == expected, f"nearest coin mismatch at ({x:.1f}, {y:.1f})"
+    store.set_collected(held, False)
+
+def bench_coin_collection(world, rng):
+    """update_player with no input: the pickup loop over every coin, plus keys and treasure"""
+    def run():
+        world.update_player(0)
+    return run
+
+AI_TICKS = 90  # Two patrol re-plans (every 45 ticks) per timed call
+AI_NPCS = 20
+
+def make_ai_bench(ai_type):
+    def bench(world, rng):
+        ai_rng = random.Random(rng.random())
+        npcs = [make_npc(ai_type, npc.x, npc.y, ai_rng, world.width, world.height) for npc in world.npcs[:AI_NPCS]]
+        start_state = world.snapshot()
+        rng_state = ai_rng.getstate()
+        flow_field = FlowField()
+        grid, obstacles = world.collision_grid, world.all_obstacles
+        def run():
+            for npc, state in zip(npcs, start_state['npcs']):
+                npc.x, npc.y = state[0], state[1]
+                npc.path, npc.path_index, npc.ai_update_cooldown = [], 0, 0
+                npc.wander_timer, npc.flow_target, npc.current_patrol_target = 0, None, 0
+            ai_rng.setstate(rng_state)
+            grid.path_cache.clear()
+            player_pos = (world.player_x, world.player_y)
+            for _ in range(AI_TICKS):
+                flow_field.update(grid, player_pos)
+                for npc in npcs:
+                    npc.update_ai(player_pos, obstacles, grid, flow_field)
+        run.calls = AI_TICKS * len(npcs)
+        return run
+    bench.__doc__ = f"NPC.update_ai with every NPC set to '{ai_type}' (per NPC per tick)"
+    return bench
+
+def make_burst_bench(scheduled):
+    def bench(world, rng):
+        burst_rng = random.Random(rng.random())
+        width, height = world.width, world.height
+        npcs = [make_npc('patrol', npc.x, npc.y, burst_rng, width, height) for npc in world.npcs]
+        starts = [(npc.x, npc.y) for npc in npcs]
+        scheduler = PathScheduler() if scheduled else None
+        grid, obstacles = world.collision_grid, world.all_obstacles
+        player_pos = (world.player_x, world.player_y)
+        def run():
+            grid.path_cache.clear()
+            if scheduler:
+                scheduler.clear()
+                scheduler.begin_tick()
+            for npc, (x, y) in zip(npcs, starts):
+                npc.x, npc.y, npc.ai_update_cooldown, npc.current_patrol_target = x, y, 0, 0
+                npc.update_ai(player_pos, obstacles, grid, None, scheduler)
+        return run
+    if scheduled:
+        bench.__doc__ = "replan_burst through a PathScheduler: only the budget's worth of searching happens on the tick"
+    else:
+        bench.__doc__ = "One tick in which every NPC, set to 'patrol', re-plans to a waypoint anywhere on the map"
+    return bench
+
+CROWD_TICKS = 30
+CROWD_NPCS = 5000
+
+def make_crowd(world, rng):
+    """CROWD_NPCS NPCs repeating the scenario's mix, and a function putting them back to their start"""
+    width, height = world.width, world.height
+    npcs = []
+    while len(npcs) < CROWD_NPCS:
+        for npc in world.npcs[:CROWD_NPCS - len(npcs)]:
+            npcs.append(make_npc(npc.ai_type, npc.x, npc.y, random.Random(rng.random()), width, height))
+    starts = [(npc.x, npc.y, npc.rng.getstate()) for npc in npcs]
+    def reset():
+        for npc, (x, y, rng_state) in zip(npcs, starts):
+            npc.x, npc.y = x, y
+            npc.path, npc.path_index, npc.ai_update_cooldown = [], 0, 0
+            npc.wander_timer, npc.flow_target, npc.current_patrol_target = 0, None, 0
+            npc.wander_target = (x, y)
+            npc.rng.setstate(rng_state)
+        world.collision_grid.path_cache.clear()
+    return npcs, reset
+
+def check_crowd_store(world, rng):
+    """Run the same crowd as objects and as an NPCStore for CROWD_TICKS ticks.
+    Returns how many NPCs end up elsewhere in the store, and the largest gap in pixels.
+    The store's NumPy distances can be an ulp off NPC.update_ai's (x**2 is libm pow
+    in Python, x*x in NumPy), so an NPC right on a range boundary may take another turn."""
+    npcs, reset = make_crowd(world, random.Random(rng.random()))
+    grid, obstacles = world.collision_grid, world.all_obstacles
+    player_pos = (world.player_x, world.player_y)
+    reset()
+    store = NPCStore.from_npcs(npcs)
+    scheduler, flow_field = PathScheduler(), FlowField()
+    for _ in range(CROWD_TICKS):
+        flow_field.update(grid, player_pos)
+        scheduler.begin_tick()
+        store.update(player_pos, grid, flow_field, scheduler)
+    reset()
+    scheduler, flow_field = PathScheduler(), FlowField()
+    for _ in range(CROWD_TICKS):
+        flow_field.update(grid, player_pos)
+        scheduler.begin_tick()
+        for npc in npcs:
+            npc.update_ai(player_pos, obstacles, grid, flow_field, scheduler)
+    gaps = [max(abs(npc.x - store.x[i]), abs(npc.y - store.y[i])) for i, npc in enumerate(npcs)]
+    return sum(gap > 0 for gap in gaps), float(max(gaps))
+
+def make_crowd_bench(stored):
+    def bench(world, rng):
+        npcs, reset = make_crowd(world, random.Random(rng.random()))
+        scheduler, flow_field = PathScheduler(), FlowField()
+        grid, obstacles = world.collision_grid, world.all_obstacles
+        player_pos = (world.player_x, world.player_y)
+        def run():
+            reset()
+            scheduler.clear()
+            if stored:
+                store = NPCStore.from_npcs(npcs)
+            for _ in range(CROWD_TICKS):
+                flow_field.update(grid, player_pos)
+                scheduler.begin_tick()
+                if stored:
+                    store.update(player_pos, grid, flow_field, scheduler)
+                else:
+                    for npc in npcs:
+                        npc.update_ai(player_pos, obstacles, grid, flow_field, scheduler)
+        run.calls = CROWD_TICKS
+        return run
+    if stored:
+        bench.__doc__ = "crowd_objects with the NPCs in an NPCStore, building it included (per tick)"
+    else:
+        bench.__doc__ = f"{CROWD_NPCS} NPCs of the scenario's mix as objects, with flow field and PathScheduler (per tick)"
+    return bench
+
+HEADLESS_TICKS = 60
+
+def bench_headless_frame(world, rng):
+    """World.step from the same snapshot each call (the restore is included)"""
+    start_state = world.snapshot()
+    def run():
+        world.restore(start_state)
+        for tick in range(HEADLESS_TICKS):
+            world.step(MOVE_RIGHT if tick < HEADLESS_TICKS // 2 else MOVE_DOWN)
+    run.calls = HEADLESS_TICKS
+    return run
+
+BENCHMARKS = {
+    'astar_path': bench_astar_path,
+    'create_collision_grid': bench_create_collision_grid,
+    'check_collision': bench_check_collision,
+    'find_nearest_coin': bench_find_nearest_coin,
+    'coin_collection': bench_coin_collection,
+}
+for _ai_type in AI_TYPES:
+    BENCHMARKS[f'update_ai_{_ai_type}'] = make_ai_bench(_ai_type)
+BENCHMARKS['replan_burst'] = make_burst_bench(False)
+BENCHMARKS['replan_burst_scheduled'] = make_burst_bench(True)
+BENCHMARKS['crowd_objects'] = make_crowd_bench(False)
+BENCHMARKS['crowd_store'] = make_crowd_bench(True)
+BENCHMARKS['headless_frame'] = bench_headless_frame
+
+def measure(fn, seconds):
+    """Median/mean/min microseconds per call; fn.calls says how many calls one run() makes.
+    The garbage collector is off while timing, as in timeit."""
+    calls = getattr(fn, 'calls', 1)
+    gc.collect()
+    gc.disable()
+    try:
+        return _measure(fn, calls, seconds)
+    finally:
+        gc.enable()
+
+def _measure(fn, calls, seconds):
+    fn()  # Warm up caches and search buffers
+    # Batch fast functions so each sample is at least ~1ms of work
+    start = time.perf_counter()
+    fn()
+    one = max(time.perf_counter() - start, 1e-7)
+    inner = max(1, int(0.001 / one))
+    samples = []
+    deadline = time.perf_counter() + seconds
+    while len(samples) < 5 or time.perf_counter() < deadline:
+        start = time.perf_counter()
+        for _ in range(inner):
+            fn()
+        samples.append((time.perf_counter() - start) / (inner * calls) * 1e6)
+    return {
+        'median_us': statistics.median(samples),
+        'mean_us': statistics.fmean(samples),
+        'min_us': min(samples),
+        'samples': len(samples),
+        'calls_per_sample': inner * calls,
+    }
+
+def measure_render_frame(seconds):
+    """Whole frames of main.py (simulation + drawing + present) on the dummy SDL driver,
+    timed by main.py itself so startup isn't counted"""
+    game_dir = os.path.dirname(os.path.abspath(__file__))
+    frames = max(120, min(1200, int(seconds * 600)))  # Under 1800, so no autosave is written
+    command = [sys.executable, 'main.py', '--seed', '1', '--record=', '--uncapped', '--max-frames', str(frames)]
+    samples = []
+    for _ in range(3):
+        output = subprocess.run(command, cwd=game_dir, check=True, capture_output=True, text=True).stdout
+        match = re.search(r"(\d+) frames in ([\d.]+)s", output)
+        samples.append(float(match.group(2)) / int(match.group(1)) * 1e6)
+    return {
+        'median_us': statistics.median(samples),
+        'mean_us': statistics.fmean(samples),
+        'min_us': min(samples),
+        'samples': len(samples),
+        'calls_per_sample': frames,
+    }
+
+def measure_startup(seconds):
+    """Launch of main.py until its first frame is presented, as main.py reports it
+    (asset caches warm, since the first launch fills them)"""
+    game_dir = os.path.dirname(os.path.abspath(__file__))
+    command = [sys.executable, 'main.py', '--seed', '1', '--record=', '--uncapped', '--max-frames', '1']
+    samples = []
+    for _ in range(max(3, min(10, int(seconds * 10)))):
+        output = subprocess.run(command, cwd=game_dir, check=True, capture_output=True, text=True).stdout
+        samples.append(float(re.search(r"first frame after ([\d.]+) ms", output).group(1)) * 1000)
+    samples = samples[1:]  # The first launch may be baking the sprite atlas and filling the audio cache
+    return {
+        'median_us': statistics.median(samples),
+        'mean_us': statistics.fmean(samples),
+        'min_us': min(samples),
+        'samples': len(samples),
+        'calls_per_sample': 1,
+    }
+
+# ============================================
+# REPORTING
+# ============================================
+
+def compare(results, baseline, tolerance):
+    """Return (name, baseline min, current min) for every regression, and the names
+    of the benchmarks the baseline has no result for"""
+    regressions, missing = [], []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            missing.append(name)
+        elif result['min_us'] > base['min_us'] * (1 + tolerance):
+            regressions.append((name, base['min_us'], result['min_us']))
+    return regressions, missing
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenarios', default="game,medium,large")
+    parser.add_argument('--scenario', action='append', default=[], help="extra scenario NAME:WxH:DENSITY:NPCS:COINS")
+    parser.add_argument('--only', default="", help="comma-separated benchmark names")
+    parser.add_argument('--seconds', type=float, default=0.5, help="time budget per benchmark")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help="write results to this file")
+    parser.add_argument('--baseline', help="compare with results saved by --json")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed slowdown before failing")
+    args = parser.parse_args()
+
+    scenarios = {name: SCENARIOS[name] for name in args.scenarios.split(',') if name}
+    scenarios.update(parse_scenario(text) for text in args.scenario)
+    only = set(filter(None, args.only.split(',')))
+
+    results = {}
+    for scenario, spec in scenarios.items():
+        if not only or 'find_nearest_coin' in only:
+            check_nearest_coin(scenario_world(spec, args.seed), random.Random(args.seed))
+        if not only or 'crowd_store' in only:
+            moved, gap = check_crowd_store(scenario_world(spec, args.seed), random.Random(args.seed))
+            print(f"{scenario + '/crowd_store':<36} {moved} of {CROWD_NPCS} NPCs apart from the objects "
+                  f"after {CROWD_TICKS} ticks (largest gap {gap:.3g} px)")
+        for name, bench in BENCHMARKS.items():
+            if only and name not in only:
+                continue
+            world = scenario_world(spec, args.seed)
+            result = measure(bench(world, random.Random(args.seed)), args.seconds)
+            result['scenario'] = scenario
+            results[f"{scenario}/{name}"] = result
+            print(f"{scenario + '/' + name:<36} {result['median_us']:12.2f} us (min {result['min_us']:.2f})")
+    if (not only or 'render_frame' in only) and 'game' in scenarios:
+        result = measure_render_frame(args.seconds)
+        result['scenario'] = 'game'
+        results['game/render_frame'] = result
+        print(f"{'game/render_frame':<36} {result['median_us']:12.2f} us (min {result['min_us']:.2f})")
+    if (not only or 'startup' in only) and 'game' in scenarios:
+        result = measure_startup(args.seconds)
+        result['scenario'] = 'game'
+        results['game/startup'] = result
+        print(f"{'game/startup':<36} {result['median_us']:12.2f} us (min {result['min_us']:.2f})")
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'scenarios': {name: list(spec) for name, spec in scenarios.items()},
+        },
+        'results': results,
+    }
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions, missing = compare(results, baseline, args.tolerance)
+        for name in missing:
+            print(f"NOT IN BASELINE {name}: not compared (record a new baseline with --json)")
+        for name, before, after in regressions:
+            print(f"REGRESSION {name}: {before:.2f} us -> {after:.2f} us ({after / before - 1:+.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions against {args.baseline} (tolerance {args.tolerance:.0%})"
+              + (f", {len(missing)} not in the baseline" if missing else ""))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+import threading
+from collections import deque
+
+import pygame
+
+from settings import TILE_SIZE, CHUNK_TILES
+
+CHUNK_SIZE = CHUNK_TILES * TILE_SIZE  # Chunk side in pixels
+
+# ============================================
+# CHUNK MAP
+# ============================================
+
+class Chunk:
+    """One square of the world and the objects filed in it, by kind"""
+    __slots__ = ('cx', 'cy', 'objects')
+
+    def __init__(self, cx, cy):
+        self.cx, self.cy = cx, cy
+        self.objects = {}  # kind ('trees', 'coins', 'npcs', ...) -> list
+
+class ChunkMap:
+    """The world split into fixed-size square chunks, so per-frame work only looks at
+    the chunks near the view however big the map is.
+
+    Objects are filed under the chunk holding their top-left corner. Nothing is
+    bigger than `margin` pixels, so whatever overlaps a rect is filed in the
+    chunks overlapping the rect stretched `margin` up and left.
+    """
+    def __init__(self, width, height, chunk_size=CHUNK_SIZE, margin=TILE_SIZE * 2):
+        self.width, self.height = width, height
+        self.chunk_size = chunk_size
+        self.margin = margin
+        self.cols = -(-width // chunk_size)
+        self.rows = -(-height // chunk_size)
+        self.chunks = {}  # (cx, cy) -> Chunk, created when something is first filed there
+        self.filed = {}  # (kind, id(obj)) -> chunk the object is filed under
+        self.counts = {}  # kind -> number of objects filed
+
+    def key_at(self, x, y):
+        """Chunk holding a world position (positions off the map go to the edge chunks)"""
+        size = self.chunk_size
+        cx = min(max(int(x // size), 0), self.cols - 1)
+        cy = min(max(int(y // size), 0), self.rows - 1)
+        return cx, cy
+
+    def span(self, left, top, right, bottom):
+        """(cx0, cy0, cx1, cy1): the chunks overlapping a pixel box, clipped to the map"""
+        size = self.chunk_size
+        return (max(left // size, 0), max(top // size, 0),
+                min((right - 1) // size, self.cols - 1), min((bottom - 1) // size, self.rows - 1))
+
+    def keys_in_rect(self, rect):
+        """Keys of the chunks overlapping a pygame.Rect, row by row"""
+        cx0, cy0, cx1, cy1 = self.span(rect.left, rect.top, rect.right, rect.bottom)
+        return [(cx, cy) for cy in range(cy0, cy1 + 1) for cx in range(cx0, cx1 + 1)]
+
+    def count(self, kind):
+        return self.counts.get(kind, 0)
+
+    def add(self, kind, obj):
+        if (kind, id(obj)) in self.filed:
+            return
+        key = self.key_at(obj.x, obj.y)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            chunk = self.chunks[key] = Chunk(*key)
+        chunk.objects.setdefault(kind, []).append(obj)
+        self.filed[kind, id(obj)] = chunk
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+
+    def remove(self, kind, obj):
+        chunk = self.filed.pop((kind, id(obj)), None)
+        if chunk is not None:
+            chunk.objects[kind].remove(obj)
+            self.counts[kind] -= 1
+
+    def move(self, kind, obj):
+        """Re-file an object after it moved (cheap when it stayed in the same chunk)"""
+        chunk = self.filed.get((kind, id(obj)))
+        if chunk is not None and (chunk.cx, chunk.cy) == self.key_at(obj.x, obj.y):
+            return
+        self.remove(kind, obj)
+        self.add(kind, obj)
+
+    def query(self, kind, rect):
+        """Objects of `kind` that may overlap rect (candidates only, in a new list)"""
+        margin = self.margin
+        cx0, cy0, cx1, cy1 = self.span(rect.left - margin, rect.top - margin, rect.right, rect.bottom)
+        chunks = self.chunks
+        if cx0 == cx1 and cy0 == cy1:
+            chunk = chunks.get((cx0, cy0))
+            return list(chunk.objects.get(kind, ())) if chunk is not None else []
+        found = []
+        for cy in range(cy0, cy1 + 1):
+            for cx in range(cx0, cx1 + 1):
+                chunk = chunks.get((cx, cy))
+                if chunk is not None:
+                    found += chunk.objects.get(kind, ())
+        return found
+
+    def ring(self, kind, cx, cy, radius):
+        """Objects of `kind` in the chunks exactly `radius` chunks (Chebyshev) from (cx, cy)"""
+        found = []
+        chunks = self.chunks
+        for y in range(cy - radius, cy + radius + 1):
+            if not 0 <= y < self.rows:
+                continue
+            edge = y == cy - radius or y == cy + radius
+            xs = range(cx - radius, cx + radius + 1) if edge else (cx - radius, cx + radius)
+            for x in xs:
+                chunk = chunks.get((x, y)) if 0 <= x < self.cols else None
+                if chunk is not None:
+                    found += chunk.objects.get(kind, ())
+        return found
+
+# ============================================
+# STREAMING
+# ============================================
+
+class ChunkStreamer:
+    """Reads chunk records from a MapFile ahead of need on a worker thread.
+
+    prefetch() queues keys for the worker; take() hands over a record, reading
+    it on the spot if the worker hasn't got to it. Records are pure file data,
+    so the simulation sees the same thing whichever thread read them.
+    """
+    def __init__(self, map_file, max_ready=64):
+        self.map_file = map_file
+        self.max_ready = max_ready  # Prefetched records kept waiting at most
+        self.queue = deque()
+        self.queued = set()
+        self.ready = {}  # key -> ChunkData read by the worker, not yet taken
+        self.prefetched = self.misses = 0
+        self.closing = False
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="chunk-streamer", daemon=True)
+        self.thread.start()
+
+    def prefetch(self, keys):
+        """Queue records to read in the background, most wanted first (replaces the old queue)"""
+        with self.lock:
+            self.queue = deque(key for key in keys if key not in self.ready)
+            self.queued = set(self.queue)
+        if self.queue:
+            self.wake.set()
+
+    def take(self, key):
+        with self.lock:
+            data = self.ready.pop(key, None)
+            if key in self.queued:
+                self.queued.discard(key)
+                self.queue.remove(key)
+        if data is None:
+            self.misses += 1
+            data = self.map_file.read_chunk(key)
+        else:
+            self.prefetched += 1
+        return data
+
+    def _run(self):
+        while True:
+            self.wake.wait()
+            self.wake.clear()
+            while True:
+                with self.lock:
+                    if self.closing:
+                        return
+                    if not self.queue or len(self.ready) >= self.max_ready:
+                        break
+                    key = self.queue.popleft()
+                    self.queued.discard(key)
+                data = self.map_file.read_chunk(key)
+                with self.lock:
+                    self.ready[key] = data
+
+    def discard(self, keep):
+        """Drop prefetched records for chunks no longer wanted"""
+        with self.lock:
+            for key in [key for key in self.ready if key not in keep]:
+                del self.ready[key]
+
+    def close(self):
+        with self.lock:
+            self.closing = True
+        self.wake.set()
+        self.thread.join()
+        self.map_file.close()
+
+# ============================================
+# CAMERA
+# ============================================
+
+class Camera:
+    """Top-left corner of the view in world pixels. It keeps the target centred but
+    never shows past the edges of the world."""
+    def __init__(self, view_w, view_h, world_w, world_h):
+        self.view_w, self.view_h = view_w, view_h
+        self.world_w, self.world_h = world_w, world_h
+        self.x = self.y = 0
+
+    def follow(self, x, y):
+        """Centre the view on a world position; returns True if the view moved"""
+        new_x = min(max(int(x) - self.view_w // 2, 0), max(self.world_w - self.view_w, 0))
+        new_y = min(max(int(y) - self.view_h // 2, 0), max(self.world_h - self.view_h, 0))
+        moved = (new_x, new_y) != (self.x, self.y)
+        self.x, self.y = new_x, new_y
+        return moved
+
+    @property
+    def rect(self):
+        return pygame.Rect(self.x, self.y, self.view_w, self.view_h)
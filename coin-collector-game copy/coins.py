@@ -0,0 +1,243 @@
+import math
+import random
+
+import numpy as np
+
+from settings import TILE_SIZE
+
+# ============================================
+# COIN STORE
+# ============================================
+
+COIN_SIZE = 16
+# A coin's rect overlaps the player's when its corner is less than TOUCH_REACH
+# from the player's corner + TOUCH_OFFSET on both axes
+TOUCH_OFFSET = (TILE_SIZE - COIN_SIZE) // 2
+TOUCH_REACH = (TILE_SIZE + COIN_SIZE) // 2
+VILLAGE, MIDNIGHT, WILD = range(3)  # Where a coin came from; the detector doesn't look for midnight coins
+CELL_SIZE = TILE_SIZE * 4  # Side of the squares uncollected coins are filed under, in pixels
+SCAN_ALL = 64  # With no more coins than this, the detector looks at them all instead of ring by ring
+
+# name -> dtype of every per-slot array
+FIELDS = {
+    'x': np.int64, 'y': np.int64,
+    'bob_offset': np.float64,
+    'collected': bool,  # Set on free slots too, so "not collected" always means a coin to pick up
+    'quest': bool,
+    'kind': np.int8,
+}
+
+class CoinStore:
+    """Every coin in the world, one slot each in preallocated parallel arrays.
+
+    Coins that go away (midnight coins at dawn, the coins of an unloaded
+    wilderness chunk) give their slots back to a free list, and new coins
+    take slots from it before the arrays grow, so the nightly respawn reuses
+    the same slots. The slots of uncollected coins are also filed under the
+    CELL_SIZE square holding their corner, so pickup, the detector's search
+    and drawing only look at the coins in the squares nearby rather than at
+    every slot. Positions live only in the arrays; xs, ys and kinds are
+    memoryviews of them that read back plain ints. Queries return scratch
+    buffers kept by the store, good until the next call of the same query.
+    """
+    def __init__(self, capacity=64):
+        self.capacity = 0
+        self.high = 0  # Slots from here on have never been used
+        self.free = []  # Released slots below `high`, reused last released first
+        self.cells = {}  # (cx, cy) -> set of the uncollected coins' slots with their corner in that square
+        self.filed = 0  # Coins in `cells`
+        self.found = []  # Scratch: slots gathered from several squares
+        self.hits = []  # Scratch: collect()'s result
+        self.closest = []  # Scratch: nearest()'s result
+        self.ring = []  # Scratch: the squares of one ring of nearest()'s search
+        self._resize(capacity)
+
+    def _resize(self, capacity):
+        for name, dtype in FIELDS.items():
+            array = np.zeros(capacity, dtype=dtype)
+            if self.high:
+                array[:self.high] = getattr(self, name)[:self.high]
+            setattr(self, name, array)
+        self.xs, self.ys, self.kinds = memoryview(self.x), memoryview(self.y), memoryview(self.kind)
+        # Scratch for visible() and bob(); never more coins show than there are slots
+        self.shown, self.lift = np.zeros(capacity, np.int64), np.zeros(capacity, np.int64)
+        self.phase = np.zeros(capacity)
+        self.shown_view, self.lift_view = memoryview(self.shown), memoryview(self.lift)
+        self.capacity = capacity
+
+    def _file(self, slot):
+        self.cells.setdefault((self.xs[slot] // CELL_SIZE, self.ys[slot] // CELL_SIZE), set()).add(slot)
+        self.filed += 1
+
+    def _unfile(self, slot):
+        key = (self.xs[slot] // CELL_SIZE, self.ys[slot] // CELL_SIZE)
+        cell = self.cells[key]
+        cell.remove(slot)
+        if not cell:
+            del self.cells[key]
+        self.filed -= 1
+
+    def spawn(self, x, y, rng=None, kind=VILLAGE):
+        """A new uncollected coin, bobbing from a phase drawn from rng; returns its slot"""
+        if self.free:
+            slot = self.free.pop()
+        else:
+            if self.high == self.capacity:
+                self._resize(self.capacity * 2)
+            slot = self.high
+            self.high += 1
+        self.x[slot], self.y[slot] = x, y
+        self.bob_offset[slot] = (rng or random).uniform(0, 6.28)
+        self.collected[slot] = self.quest[slot] = False
+        self.kind[slot] = kind
+        self._file(slot)
+        return slot
+
+    def release(self, slots):
+        self.set_collected(slots, True)
+        self.free += slots
+
+    def clear(self):
+        self.high = 0
+        self.free = []
+        self.cells = {}
+        self.filed = 0
+
+    def set_collected(self, slots, collected):
+        """Mark coins collected or not, filing or unfiling them to match"""
+        for slot in slots:
+            if self.collected[slot] != collected:
+                self.collected[slot] = collected
+                if collected:
+                    self._unfile(slot)
+                else:
+                    self._file(slot)
+
+    def _gather(self, left, top, right, bottom):
+        """Slots of the coins filed in the squares overlapping a pixel box"""
+        cells = self.cells
+        cx0, cy0 = left // CELL_SIZE, top // CELL_SIZE
+        cx1, cy1 = (right - 1) // CELL_SIZE, (bottom - 1) // CELL_SIZE
+        if cx0 == cx1 and cy0 == cy1:
+            return cells.get((cx0, cy0), ())
+        found = self.found
+        found.clear()
+        for cy in range(cy0, cy1 + 1):
+            for cx in range(cx0, cx1 + 1):
+                cell = cells.get((cx, cy))
+                if cell:
+                    found += cell
+        return found
+
+    def states(self, slots):
+        """(x, y, collected, bob_offset, quest_coin) per slot, as plain Python values"""
+        return tuple(zip(self.x[slots].tolist(), self.y[slots].tolist(), self.collected[slots].tolist(),
+                         self.bob_offset[slots].tolist(), self.quest[slots].tolist()))
+
+    def set_states(self, slots, states):
+        if not len(slots):
+            return
+        slots = np.array(slots, dtype=np.int64)
+        x, y, collected, bob_offset, quest = zip(*states)
+        x, y, collected = np.array(x), np.array(y), np.array(collected, dtype=bool)
+        # Only coins that move or change collected are filed again, unfiled while they move
+        changed = (self.x[slots] != x) | (self.y[slots] != y) | (self.collected[slots] != collected)
+        self.set_collected(slots[changed].tolist(), True)
+        self.x[slots], self.y[slots], self.bob_offset[slots], self.quest[slots] = x, y, bob_offset, quest
+        self.set_collected(slots[changed & ~collected].tolist(), False)
+
+    def collect(self, player_x, player_y, magnet_range=0):
+        """Mark every coin the player touches, or that is within magnet range, collected;
+        returns their slots in slot order"""
+        # Rects overlap, with the player's truncated to whole pixels as pygame.Rect does
+        px, py = int(player_x) + TOUCH_OFFSET, int(player_y) + TOUCH_OFFSET
+        # Coins are filed by their corner, so the box reaches a coin's width up and left of the player
+        reach = max(magnet_range, TILE_SIZE) + COIN_SIZE
+        xs, ys, hits = self.xs, self.ys, self.hits
+        hits.clear()
+        for slot in self._gather(px - reach, py - reach, px + reach, py + reach):
+            x, y = xs[slot], ys[slot]
+            if abs(x - px) < TOUCH_REACH and abs(y - py) < TOUCH_REACH:
+                hits.append(slot)
+            elif magnet_range > 0 and math.sqrt((x - player_x)**2 + (y - player_y)**2) < magnet_range:
+                hits.append(slot)
+        if hits:
+            hits.sort()
+            self.set_collected(hits, True)
+        return hits
+
+    def nearest(self, x, y):
+        """Slots of the uncollected non-midnight coins nearest (x, y), all of them if tied, in
+        slot order. Searches outward a ring of squares at a time, stopping once no farther
+        ring can hold anything as close."""
+        cells = self.cells
+        self.closest.clear()
+        if self.filed <= SCAN_ALL:
+            self._closer(cells.values(), x, y, float('inf'))
+        else:
+            cx, cy = int(x) // CELL_SIZE, int(y) // CELL_SIZE
+            ring = self.ring
+            remaining = self.filed
+            min_dist = float('inf')
+            radius = 0
+            while remaining:
+                # The filed squares exactly `radius` squares (Chebyshev) from the one holding (x, y)
+                ring.clear()
+                for ry in range(cy - radius, cy + radius + 1):
+                    edge = ry == cy - radius or ry == cy + radius
+                    for rx in (range(cx - radius, cx + radius + 1) if edge else (cx - radius, cx + radius)):
+                        cell = cells.get((rx, ry))
+                        if cell:
+                            ring.append(cell)
+                            remaining -= len(cell)
+                min_dist = self._closer(ring, x, y, min_dist)
+                # Anything in the next ring is more than `radius` squares away
+                if min_dist <= radius * CELL_SIZE:
+                    break
+                radius += 1
+        self.closest.sort()
+        return self.closest
+
+    def _closer(self, cells, x, y, min_dist):
+        """Keep in `closest` the non-midnight coins of cells at least as near as min_dist; returns the new minimum"""
+        xs, ys, kinds, closest, sqrt = self.xs, self.ys, self.kinds, self.closest, math.sqrt
+        for cell in cells:
+            for slot in cell:
+                if kinds[slot] == MIDNIGHT:
+                    continue
+                dist = sqrt((xs[slot] - x)**2 + (ys[slot] - y)**2)
+                if dist < min_dist:
+                    closest.clear()
+                    closest.append(slot)
+                    min_dist = dist
+                elif dist == min_dist:
+                    closest.append(slot)
+        return min_dist
+
+    def visible(self, rect):
+        """Slots of uncollected coins that may show in rect, allowing for the bob, in slot order"""
+        left, top, right, bottom = rect.left, rect.top, rect.right, rect.bottom
+        xs, ys, shown = self.xs, self.ys, self.shown_view
+        count = 0
+        for slot in self._gather(left - COIN_SIZE, top - COIN_SIZE, right, bottom + 2):
+            x, y = xs[slot], ys[slot]
+            if x < right and x + COIN_SIZE > left and y - 2 < bottom and y + COIN_SIZE > top:
+                shown[count] = slot
+                count += 1
+        self.shown[:count].sort()
+        return shown[:count]
+
+    def bob(self, frame_count, slots):
+        """How many pixels each coin is raised this frame (0 to 2, each on its own phase)"""
+        count = len(slots)
+        phase = self.phase[:count]
+        np.take(self.bob_offset, slots, out=phase, mode='clip')  # 'raise' would buffer `out`
+        phase *= 10
+        phase += frame_count
+        np.remainder(phase, 60, out=phase)
+        phase -= 30
+        np.abs(phase, out=phase)
+        phase *= 2
+        phase /= 30
+        np.copyto(self.lift[:count], phase, casting='unsafe')  # Truncates, as astype does
+        return self.lift_view[:count]
@@ -0,0 +1,219 @@
+"""Map files: the wilderness of a big world, one fixed-size record per chunk, read through mmap.
+
+Usage: python mapfile.py OUTPUT --size WxH [--map-seed N]
+
+A file is a header (magic, format version, map width and height in pixels,
+chunk tiles, map seed) followed by one record per chunk, row by row:
+
+  tiles  CHUNK_TILES x CHUNK_TILES bytes of collision stamp counts (0 = walkable),
+         laid out like CollisionGrid.cells and including stamps that spill over
+         from trees in neighbouring chunks
+  trees  count byte, then WILD_TREES (tx, ty) tile offsets inside the chunk
+  coins  count byte, then WILD_COINS (x, y) uint16 pixel offsets inside the chunk
+"""
+import argparse
+import mmap
+import os
+import random
+import struct
+import time
+
+import pygame
+
+from settings import SCREEN_WIDTH, SCREEN_HEIGHT, TILE_SIZE, CHUNK_TILES
+from chunks import CHUNK_SIZE
+
+MAGIC = b'CQMP'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sHIIHQ')
+
+# The hand-made map every world starts with. Bigger worlds surround it with wilderness.
+VILLAGE = pygame.Rect(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT)
+WILD_CLEARING = VILLAGE.inflate(4 * TILE_SIZE, 4 * TILE_SIZE)  # Nothing is generated in here
+WILD_TREES = 6  # Tree placement attempts per wilderness chunk
+WILD_COINS = 3  # Coin placement attempts per wilderness chunk
+
+CHUNK_TILE_BYTES = CHUNK_TILES * CHUNK_TILES
+RECORD = struct.Struct(f'<{CHUNK_TILE_BYTES}sB{2 * WILD_TREES}sB{4 * WILD_COINS}s')
+TREE_SPOTS = [struct.Struct(f'<{2 * n}B') for n in range(WILD_TREES + 1)]
+COIN_SPOTS = [struct.Struct(f'<{2 * n}H') for n in range(WILD_COINS + 1)]
+
+MAP_DIR = 'maps'
+
+class MapFileError(Exception):
+    pass
+
+def default_map_path(width, height, map_seed):
+    """Where a World keeps the map file for its size and map seed"""
+    return os.path.join(MAP_DIR, f"{width}x{height}-{map_seed}.cqm")
+
+# ============================================
+# GENERATION
+# ============================================
+
+def _wild_spot(rng, key, size, width, height):
+    """A random rect in chunk `key`, or None if it falls off the map or near the village"""
+    step = TILE_SIZE if size == TILE_SIZE else 1
+    x = key[0] * CHUNK_SIZE + rng.randrange(0, CHUNK_SIZE - size + 1, step)
+    y = key[1] * CHUNK_SIZE + rng.randrange(0, CHUNK_SIZE - size + 1, step)
+    rect = pygame.Rect(x, y, size, size)
+    if rect.right > width or rect.bottom > height or rect.colliderect(WILD_CLEARING):
+        return None
+    return rect
+
+def generate_trees(key, width, height, map_seed):
+    """Tree rects for one chunk"""
+    rng = random.Random(f"{map_seed}:trees:{key[0]}:{key[1]}")
+    trees = []
+    for _ in range(WILD_TREES):
+        rect = _wild_spot(rng, key, TILE_SIZE, width, height)
+        if rect is not None:
+            trees.append(rect)
+    return trees
+
+def generate_coins(key, trees, width, height, map_seed):
+    """Coin rects for one chunk, clear of the chunk's own trees"""
+    rng = random.Random(f"{map_seed}:coins:{key[0]}:{key[1]}")
+    coins = []
+    for _ in range(WILD_COINS):
+        rect = _wild_spot(rng, key, 16, width, height)
+        if rect is not None and rect.collidelist(trees) == -1:
+            coins.append(rect)
+    return coins
+
+# Same saturating +1 table as CollisionGrid uses for obstacle stamps
+_INCREMENT = bytes(range(1, 256)) + b'\xff'
+
+def build_map_file(path, width, height, map_seed=0):
+    """Generate the wilderness of a width x height map and write it to `path`"""
+    cols, rows = -(-width // CHUNK_SIZE), -(-height // CHUNK_SIZE)
+    band_w = cols * CHUNK_TILES
+    tree_rows = {}  # cy -> trees of each chunk in that row, generated once
+
+    def row_trees(cy):
+        if cy not in tree_rows:
+            tree_rows[cy] = [generate_trees((cx, cy), width, height, map_seed) for cx in range(cols)]
+        return tree_rows[cy]
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, width, height, CHUNK_TILES, map_seed))
+        for cy in range(rows):
+            # Stamp counts for this row of chunks, as one band of CHUNK_TILES tile rows.
+            # A tree stamps the 4x4 tiles around it, so trees in the rows above and below reach in too.
+            band = bytearray(band_w * CHUNK_TILES)
+            top = cy * CHUNK_TILES
+            for trees_row in (row_trees(cy - 1) if cy else []) + row_trees(cy) + (row_trees(cy + 1) if cy + 1 < rows else []):
+                for rect in trees_row:
+                    gx, gy = rect.x // TILE_SIZE, rect.y // TILE_SIZE
+                    x0, x1 = max(gx - 1, 0), min(gx + 3, band_w)
+                    for ty in range(max(gy - 1 - top, 0), min(gy + 3 - top, CHUNK_TILES)):
+                        start = ty * band_w
+                        band[start + x0:start + x1] = band[start + x0:start + x1].translate(_INCREMENT)
+            tree_rows.pop(cy - 1, None)
+
+            for cx, trees in enumerate(row_trees(cy)):
+                left = cx * CHUNK_TILES
+                tiles = b''.join(band[ty * band_w + left:ty * band_w + left + CHUNK_TILES] for ty in range(CHUNK_TILES))
+                coins = generate_coins((cx, cy), trees, width, height, map_seed)
+                base_x, base_y = cx * CHUNK_SIZE, cy * CHUNK_SIZE
+                tree_spots = [n for rect in trees for n in ((rect.x - base_x) // TILE_SIZE, (rect.y - base_y) // TILE_SIZE)]
+                coin_spots = [n for rect in coins for n in (rect.x - base_x, rect.y - base_y)]
+                f.write(RECORD.pack(tiles, len(trees), TREE_SPOTS[len(trees)].pack(*tree_spots),
+                                    len(coins), COIN_SPOTS[len(coins)].pack(*coin_spots)))
+    os.replace(temp_path, path)
+
+# ============================================
+# READING
+# ============================================
+
+class ChunkData:
+    """One chunk's record, decoded: tile stamp counts plus world positions of trees and coins"""
+    __slots__ = ('key', 'tiles', 'trees', 'coins')
+
+    def __init__(self, key, tiles, trees, coins):
+        self.key, self.tiles, self.trees, self.coins = key, tiles, trees, coins
+
+class MapFile:
+    """A map file mapped read-only. Records are copied out as they are read and their
+    pages handed back to the OS, so the mapping itself doesn't stay resident."""
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError as e:  # Empty file
+            self.file.close()
+            raise MapFileError("not a map file") from e
+        if len(self.map) < HEADER.size:
+            self.close()
+            raise MapFileError("not a map file")
+        magic, version, self.width, self.height, chunk_tiles, self.map_seed = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            self.close()
+            raise MapFileError("not a map file")
+        if version != FORMAT_VERSION or chunk_tiles != CHUNK_TILES:
+            self.close()
+            raise MapFileError(f"unsupported map file (version {version}, {chunk_tiles} tile chunks)")
+        self.cols, self.rows = -(-self.width // CHUNK_SIZE), -(-self.height // CHUNK_SIZE)
+        if len(self.map) < HEADER.size + self.cols * self.rows * RECORD.size:
+            self.close()
+            raise MapFileError("truncated map file")
+        self.can_release = hasattr(mmap, 'MADV_DONTNEED')
+        self.reads = 0
+
+    def read_chunk(self, key):
+        """Decode one chunk's record (safe to call from any thread)"""
+        cx, cy = key
+        offset = HEADER.size + (cy * self.cols + cx) * RECORD.size
+        tiles, tree_count, tree_spots, coin_count, coin_spots = RECORD.unpack_from(self.map, offset)
+        if self.can_release:
+            # The record is copied out; let the kernel drop the mapped pages from our resident set
+            start = offset - offset % mmap.PAGESIZE
+            self.map.madvise(mmap.MADV_DONTNEED, start, offset + RECORD.size - start)
+        self.reads += 1
+        base_x, base_y = cx * CHUNK_SIZE, cy * CHUNK_SIZE
+        tree_spots = TREE_SPOTS[tree_count].unpack_from(tree_spots)
+        coin_spots = COIN_SPOTS[coin_count].unpack_from(coin_spots)
+        trees = tuple((base_x + tree_spots[i] * TILE_SIZE, base_y + tree_spots[i + 1] * TILE_SIZE)
+                      for i in range(0, 2 * tree_count, 2))
+        coins = tuple((base_x + coin_spots[i], base_y + coin_spots[i + 1]) for i in range(0, 2 * coin_count, 2))
+        return ChunkData(key, tiles, trees, coins)
+
+    def close(self):
+        if getattr(self, 'map', None) is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+def open_map_file(width, height, map_seed=None, path=None):
+    """Open the map file for a world, generating it first if it doesn't exist yet.
+    A file made with a map seed other than `map_seed` is refused, unless that's None."""
+    path = path or default_map_path(width, height, map_seed or 0)
+    if not os.path.exists(path):
+        build_map_file(path, width, height, map_seed or 0)
+    map_file = MapFile(path)
+    if (map_file.width, map_file.height) != (width, height):
+        map_file.close()
+        raise MapFileError(f"{path} is a {map_file.width}x{map_file.height} map, not {width}x{height}")
+    if map_seed is not None and map_file.map_seed != map_seed:
+        map_file.close()
+        raise MapFileError(f"{path} was made with map seed {map_file.map_seed}, not {map_seed}")
+    return map_file
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('output')
+    parser.add_argument('--size', required=True, help="map size in tiles as WxH")
+    parser.add_argument('--map-seed', type=int, default=0)
+    args = parser.parse_args()
+
+    tiles_w, tiles_h = (int(n) for n in args.size.lower().split('x'))
+    start = time.perf_counter()
+    build_map_file(args.output, tiles_w * TILE_SIZE, tiles_h * TILE_SIZE, args.map_seed)
+    print(f"wrote {args.output}: {os.path.getsize(args.output) / 2**20:.1f} MB "
+          f"in {time.perf_counter() - start:.1f}s")
+
+if __name__ == '__main__':
+    main()
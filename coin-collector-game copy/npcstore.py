@@ -0,0 +1,241 @@
+import random
+
+import numpy as np
+
+from settings import SCREEN_WIDTH, SCREEN_HEIGHT
+from pathfinding import astar_path
+
+# ============================================
+# NPC STORE
+# ============================================
+
+STATIC, CHASE, PATROL, WANDER = range(4)
+AI_CODES = {'static': STATIC, 'chase': CHASE, 'patrol': PATROL, 'wander': WANDER}
+CATCH_DISTANCE = 30  # Same catch test as World.step
+
+# name -> dtype of every per-NPC array (patrol_x/patrol_y have a column per patrol point)
+FIELDS = {
+    'x': np.float64, 'y': np.float64, 'speed': np.float64,
+    'code': np.int8, 'visible': bool, 'enemy': bool,
+    'detection_range': np.float64,
+    'cooldown': np.int64,
+    'path_index': np.int64, 'path_len': np.int64,
+    'waypoint_x': np.float64, 'waypoint_y': np.float64,  # path[path_index], if path_index < path_len
+    'has_flow': bool, 'flow_x': np.float64, 'flow_y': np.float64,
+    'patrol_count': np.int64, 'patrol_target': np.int64,
+    'wander_timer': np.int64, 'wander_x': np.float64, 'wander_y': np.float64,
+    'wander_x0': np.int64, 'wander_y0': np.int64, 'wander_x1': np.int64, 'wander_y1': np.int64,
+}
+
+class _PathOwner:
+    """Stands in for one NPC of a store when a path scheduler hands back its path"""
+    __slots__ = ('store', 'index')
+
+    def __init__(self, store, index):
+        self.store, self.index = store, index
+
+    def set_path(self, path):
+        self.store.set_path(self.index, path)
+
+class NPCStore:
+    """A population of NPCs in parallel NumPy arrays, updated together each tick.
+
+    update() does for every NPC what NPC.update_ai does for one, with the
+    floating-point operations in the same order. It isn't bit-for-bit: a
+    square is x*x here but libm pow in NPC.update_ai, which can differ in the
+    last bit, and then an NPC right on a range test's boundary goes its own
+    way (bench_suite checks how many do). Movement and the distance tests
+    run in bulk. Python only runs per NPC for the rare events: a re-plan, a
+    reached waypoint, a chaser's next flow-field step, a wanderer's new target.
+    Paths themselves stay Python lists, one per NPC.
+    """
+    def __init__(self, capacity=64, patrol_slots=4):
+        self.count = 0
+        self.capacity = 0
+        self.patrol_slots = 0
+        self.rngs = []  # Per NPC: source of wander targets, as NPC.rng
+        self.paths = []  # Per NPC: the path being followed (world pixel waypoints)
+        self.owners = []  # Per NPC: _PathOwner passed to path schedulers
+        self._resize(capacity, patrol_slots)
+
+    @classmethod
+    def from_npcs(cls, npcs):
+        """A store holding the state of a list of NPC objects, in list order"""
+        store = cls(max(len(npcs), 1), max([len(npc.patrol_points) for npc in npcs] + [1]))
+        for npc in npcs:
+            i = store.add(npc.x, npc.y, npc.ai_type, npc.speed, npc.rng, npc.patrol_points,
+                          npc.detection_range, getattr(npc, 'is_enemy', False), npc.wander_area)
+            store.visible[i] = npc.visible
+            store.cooldown[i] = npc.ai_update_cooldown
+            store.set_path(i, npc.path)
+            store.path_index[i] = npc.path_index
+            store._load_waypoint(i)
+            if npc.flow_target is not None:
+                store.has_flow[i] = True
+                store.flow_x[i], store.flow_y[i] = npc.flow_target
+            store.patrol_target[i] = npc.current_patrol_target
+            store.wander_timer[i] = npc.wander_timer
+            store.wander_x[i], store.wander_y[i] = npc.wander_target
+        return store
+
+    def sync_to(self, npcs):
+        """Copy positions and AI state back onto the NPC objects the store was made from.
+        Unchanged values are left alone, so they keep their types (state_hash goes by repr)."""
+        for i, npc in enumerate(npcs):
+            x, y = float(self.x[i]), float(self.y[i])
+            if (npc.x, npc.y) != (x, y):
+                npc.x, npc.y = x, y
+            npc.rect.topleft = (npc.x, npc.y)
+            npc.ai_update_cooldown = int(self.cooldown[i])
+            npc.path, npc.path_index = self.paths[i], int(self.path_index[i])
+            npc.flow_target = (float(self.flow_x[i]), float(self.flow_y[i])) if self.has_flow[i] else None
+            npc.current_patrol_target = int(self.patrol_target[i])
+            npc.wander_timer = int(self.wander_timer[i])
+            if npc.wander_target != (self.wander_x[i], self.wander_y[i]):
+                npc.wander_target = (int(self.wander_x[i]), int(self.wander_y[i]))  # From randint
+
+    def _resize(self, capacity, patrol_slots):
+        old, n = self.count, self.count
+        for name, dtype in FIELDS.items():
+            array = np.zeros(capacity, dtype=dtype)
+            if old:
+                array[:n] = getattr(self, name)[:n]
+            setattr(self, name, array)
+        for name in ('patrol_x', 'patrol_y'):
+            array = np.zeros((capacity, patrol_slots), dtype=np.float64)
+            if old:
+                array[:n, :self.patrol_slots] = getattr(self, name)[:n]
+            setattr(self, name, array)
+        self.capacity, self.patrol_slots = capacity, patrol_slots
+
+    def add(self, x, y, ai_type='static', speed=0.8, rng=None, patrol_points=(), detection_range=150,
+            enemy=False, wander_area=(50, 50, SCREEN_WIDTH - 50, SCREEN_HEIGHT - 50)):
+        """Add an NPC with NPC's defaults; returns its index"""
+        if self.count == self.capacity or len(patrol_points) > self.patrol_slots:
+            self._resize(max(self.capacity * 2, self.count + 1), max(self.patrol_slots, len(patrol_points)))
+        i = self.count
+        self.count += 1
+        self.x[i], self.y[i], self.speed[i] = x, y, speed
+        self.code[i] = AI_CODES[ai_type]
+        self.visible[i], self.enemy[i] = True, enemy
+        self.detection_range[i] = detection_range
+        for k, (px, py) in enumerate(patrol_points):
+            self.patrol_x[i, k], self.patrol_y[i, k] = px, py
+        self.patrol_count[i] = len(patrol_points)
+        self.wander_x[i], self.wander_y[i] = x, y
+        self.wander_x0[i], self.wander_y0[i], self.wander_x1[i], self.wander_y1[i] = wander_area
+        self.rngs.append(rng or random)
+        self.paths.append([])
+        self.owners.append(_PathOwner(self, i))
+        return i
+
+    def set_path(self, i, path):
+        self.paths[i] = path
+        self.path_index[i] = 0
+        self.path_len[i] = len(path)
+        self._load_waypoint(i)
+
+    def _load_waypoint(self, i):
+        path, index = self.paths[i], self.path_index[i]
+        if index < len(path):
+            self.waypoint_x[i], self.waypoint_y[i] = path[index]
+
+    def update(self, player_pos, collision_grid, flow_field=None, scheduler=None):
+        """One tick of AI for every visible NPC; returns True if an enemy caught the player"""
+        n = self.count
+        if n == 0:
+            return False
+        x, y, speed, code, live = self.x[:n], self.y[:n], self.speed[:n], self.code[:n], self.visible[:n]
+        cooldown = self.cooldown[:n]
+        cooldown -= live
+        px, py = player_pos
+        player_dist = np.sqrt((x - px)**2 + (y - py)**2)
+        follow = np.zeros(n, dtype=bool)
+
+        # Chase: flow-field steps toward the player, or a path re-planned every 30 ticks
+        chase = live & (code == CHASE)
+        in_range = chase & (player_dist < self.detection_range[:n])
+        has_flow = self.has_flow[:n]
+        has_flow &= ~(chase & ~in_range)
+        if flow_field is not None:
+            for i in np.flatnonzero(in_range & ~has_flow):
+                target = flow_field.next_waypoint((float(x[i]), float(y[i])))
+                if target:
+                    has_flow[i] = True
+                    self.flow_x[i], self.flow_y[i] = target
+            flowing = in_range & has_flow
+            replan_chase = np.zeros(n, dtype=bool)
+        else:
+            flowing = np.zeros(n, dtype=bool)
+            replan_chase = in_range & (cooldown <= 0)
+            follow |= in_range
+
+        # Patrol: walk a path to the current waypoint, re-planned every 45 ticks
+        patrol = live & (code == PATROL) & (self.patrol_count[:n] > 0)
+        patrol_target = self.patrol_target[:n]
+        rows = np.arange(n)
+        target_x, target_y = self.patrol_x[rows, patrol_target], self.patrol_y[rows, patrol_target]
+        arrived = patrol & (np.sqrt((target_x - x)**2 + (target_y - y)**2) < 10)
+        patrol_target[arrived] = (patrol_target[arrived] + 1) % self.patrol_count[:n][arrived]
+        patrolling = patrol & ~arrived
+        replan_patrol = patrolling & (cooldown <= 0)
+        follow |= patrolling
+
+        # Re-plans, in index order so a scheduler's budget goes the same way as NPC by NPC
+        for i in np.flatnonzero(replan_chase | replan_patrol):
+            i = int(i)
+            if replan_chase[i]:
+                goal, priority = player_pos, (0, float(player_dist[i]))
+            else:
+                goal, priority = (float(target_x[i]), float(target_y[i])), (1, float(player_dist[i]))
+            start = (float(x[i]), float(y[i]))
+            if scheduler is None:
+                self.set_path(i, astar_path(collision_grid, start, goal))
+            else:
+                scheduler.request(self.owners[i], collision_grid, start, goal, priority)
+        cooldown[replan_chase] = 30
+        cooldown[replan_patrol] = 45
+
+        # Path following: a reached waypoint costs the tick, otherwise step toward it
+        follow &= self.path_index[:n] < self.path_len[:n]
+        dx, dy = self.waypoint_x[:n] - x, self.waypoint_y[:n] - y
+        dist = np.sqrt(dx**2 + dy**2)
+        for i in np.flatnonzero(follow & (dist < 5)):
+            self.path_index[i] += 1
+            self._load_waypoint(i)
+        step_x, step_y = self._steps(follow & (dist >= 5), dx, dy, dist, speed)
+
+        # Chasers on the flow field: same, toward the next tile
+        dx, dy = self.flow_x[:n] - x, self.flow_y[:n] - y
+        dist = np.sqrt(dx**2 + dy**2)
+        has_flow &= ~(flowing & (dist < 5))
+        flow_step_x, flow_step_y = self._steps(flowing & (dist >= 5), dx, dy, dist, speed)
+        step_x += flow_step_x
+        step_y += flow_step_y
+
+        # Wander: a new random target every 120-300 ticks, walked toward at half speed
+        wander = live & (code == WANDER)
+        wander_timer = self.wander_timer[:n]
+        wander_timer -= wander
+        for i in np.flatnonzero(wander & (wander_timer <= 0)):
+            rng = self.rngs[i]
+            self.wander_x[i] = rng.randint(int(self.wander_x0[i]), int(self.wander_x1[i]))
+            self.wander_y[i] = rng.randint(int(self.wander_y0[i]), int(self.wander_y1[i]))
+            wander_timer[i] = rng.randint(120, 300)
+        dx, dy = self.wander_x[:n] - x, self.wander_y[:n] - y
+        dist = np.sqrt(dx**2 + dy**2)
+        wander_x, wander_y = self._steps(wander & (dist > 10), dx, dy, dist, speed, 0.5)
+        step_x += wander_x
+        step_y += wander_y
+
+        # Each NPC moved in at most one of the above; adding its one step keeps NPC.update_ai's rounding
+        x += step_x
+        y += step_y
+        caught = live & self.enemy[:n] & (np.sqrt((x - px)**2 + (y - py)**2) < CATCH_DISTANCE)
+        return bool(caught.any())
+
+    @staticmethod
+    def _steps(moving, dx, dy, dist, speed, scale=1.0):
+        """Per-NPC step dx / dist * speed * scale where moving, else 0 (scaling by 1.0 is exact)"""
+        safe = np.where(moving, dist, 1.0)
+        return np.where(moving, dx / safe * speed * scale, 0.0), np.where(moving, dy / safe * speed * scale, 0.0)
@@ -0,0 +1,1037 @@
+import heapq
+from collections import OrderedDict, defaultdict, deque
+
+try:
+    import numpy as np
+except ImportError:  # Optional: only speeds up full grid rebuilds
+    np = None
+
+from settings import TILE_SIZE
+from profiler import PROFILER
+
+# ============================================
+# GRID HELPERS
+# ============================================
+
+def world_to_grid(x, y):
+    """Convert world coordinates to grid coordinates"""
+    return int(x // TILE_SIZE), int(y // TILE_SIZE)
+
+def grid_to_world(gx, gy):
+    """Convert grid coordinates to world coordinates"""
+    return gx * TILE_SIZE, gy * TILE_SIZE
+
+# ============================================
+# COLLISION GRID
+# ============================================
+
+# Byte translation tables: add/subtract one from every tile of a slice in a single C call.
+# Counts saturate at 255 overlapping stamps, far more than any map has.
+_INCREMENT = bytes(range(1, 256)) + b'\xff'
+_DECREMENT = b'\x00' + bytes(range(255))
+
+class CollisionGrid:
+    """Walkable/unwalkable tiles, kept up to date as obstacles are added, removed or moved.
+
+    A grid can cover just a window of a bigger map: (gx0, gy0) is the map tile
+    stored at cells[0]. Methods taking tiles or pixels take map coordinates;
+    `cells` and the search functions below work in grid-local tiles.
+    """
+    def __init__(self, width, height, origin=(0, 0)):
+        self.grid_w = width // TILE_SIZE
+        self.grid_h = height // TILE_SIZE
+        self.gx0, self.gy0 = origin
+        # Number of obstacle stamps covering each tile, one byte per tile in a flat
+        # row-major bytearray: cells[gy * grid_w + gx]; 0 = walkable
+        self.cells = bytearray(self.grid_w * self.grid_h)
+        self.stamps = {}  # id(obj) -> tile the obstacle was stamped at
+        # Bumped whenever a tile changes between walkable and blocked, so caches
+        # built on this grid (flow fields, paths) know when they are stale
+        self.version = 0
+        self.hierarchy = None  # HierarchicalGraph for long searches, made on first use (see get_hierarchy)
+        self.path_cache = None  # PathCache in front of astar_path, if the grid's owner sets one
+
+    def is_blocked(self, gx, gy):
+        return self.cells[(gy - self.gy0) * self.grid_w + gx - self.gx0] != 0
+
+    def area_clear(self, x, y, width, height):
+        """True if every tile under the pixel rect is inside the grid and walkable"""
+        left, top = int(x), int(y)
+        gx0, gy0 = left // TILE_SIZE - self.gx0, top // TILE_SIZE - self.gy0
+        gx1, gy1 = (left + width - 1) // TILE_SIZE - self.gx0, (top + height - 1) // TILE_SIZE - self.gy0
+        if gx0 < 0 or gy0 < 0 or gx1 >= self.grid_w or gy1 >= self.grid_h:
+            return False
+        cells, grid_w = self.cells, self.grid_w
+        for gy in range(gy0, gy1 + 1):
+            row = gy * grid_w
+            if any(cells[row + gx0:row + gx1 + 1]):
+                return False
+        return True
+
+    def _stamp(self, gx, gy, table):
+        """Apply a translation table to the 4x4 tiles around map tile (gx, gy); returns True if any tile flipped"""
+        gx, gy = gx - self.gx0, gy - self.gy0
+        gx0, gx1 = max(gx - 1, 0), min(gx + 3, self.grid_w)
+        gy0, gy1 = max(gy - 1, 0), min(gy + 3, self.grid_h)
+        if gx0 >= gx1 or gy0 >= gy1:
+            return False
+        flipped = False
+        cells, grid_w = self.cells, self.grid_w
+        # Mark surrounding tiles as blocked, one row slice at a time
+        for row in range(gy0 * grid_w, gy1 * grid_w, grid_w):
+            before = cells[row + gx0:row + gx1]
+            after = before.translate(table)
+            cells[row + gx0:row + gx1] = after
+            if not flipped and before.count(0) != after.count(0):
+                flipped = True
+        if flipped and self.hierarchy is not None:
+            self.hierarchy.invalidate(gx0, gy0, gx1 - 1, gy1 - 1)
+        return flipped
+
+    def add(self, obj):
+        """Stamp a solid obstacle onto the grid (no-op if already present)"""
+        if not obj.solid or id(obj) in self.stamps:
+            return
+        tile = world_to_grid(obj.x, obj.y)
+        self.stamps[id(obj)] = tile
+        if self._stamp(tile[0], tile[1], _INCREMENT):
+            self.version += 1
+
+    def remove(self, obj):
+        """Clear an obstacle's stamp; tiles still covered by other obstacles stay blocked"""
+        tile = self.stamps.pop(id(obj), None)
+        if tile is not None and self._stamp(tile[0], tile[1], _DECREMENT):
+            self.version += 1
+
+    def move(self, obj):
+        """Re-stamp an obstacle after its position changed"""
+        old_tile = self.stamps.get(id(obj))
+        if old_tile is None:
+            self.add(obj)
+            return
+        tile = world_to_grid(obj.x, obj.y)
+        if tile == old_tile:
+            return
+        self.stamps[id(obj)] = tile
+        flipped = self._stamp(old_tile[0], old_tile[1], _DECREMENT)
+        flipped = self._stamp(tile[0], tile[1], _INCREMENT) or flipped
+        if flipped:
+            self.version += 1
+
+    def recenter(self, origin, fill=None):
+        """Move the window so map tile `origin` is at cells[0]. fill(grid), if given,
+        writes the static tiles first; every stamped obstacle is then stamped again."""
+        hierarchy, self.hierarchy = self.hierarchy, None  # Reset once below, not per stamp
+        self.gx0, self.gy0 = origin
+        if fill is not None:
+            fill(self)
+        else:
+            self.cells[:] = bytes(len(self.cells))
+        for gx, gy in self.stamps.values():
+            self._stamp(gx, gy, _INCREMENT)
+        self.version += 1
+        if hierarchy is not None:
+            hierarchy.reset()
+            self.hierarchy = hierarchy
+
+    def rebuild(self, obstacles):
+        """Clear the grid and stamp every solid obstacle again"""
+        hierarchy, self.hierarchy = self.hierarchy, None
+        stamps = self.stamps
+        stamps.clear()
+        for obj in obstacles:
+            if obj.solid:
+                stamps[id(obj)] = (int(obj.x // TILE_SIZE), int(obj.y // TILE_SIZE))
+        if np is not None and stamps:
+            self._rebuild_vectorized()
+        else:
+            self.cells[:] = bytes(len(self.cells))
+            for gx, gy in stamps.values():
+                self._stamp(gx, gy, _INCREMENT)
+        self.version += 1
+        if hierarchy is not None:
+            hierarchy.reset()
+            self.hierarchy = hierarchy
+
+    def _rebuild_vectorized(self):
+        """Count stamps per tile with NumPy: scatter one seed per obstacle, then a 4x4 box sum"""
+        grid_w, grid_h = self.grid_w, self.grid_h
+        tiles = np.array(list(self.stamps.values()), dtype=np.int64) - (self.gx0, self.gy0)
+        # A stamp at (gx, gy) covers gx-1..gx+2, so tile x sums seeds at gx = x-2..x+1.
+        # Seeds are offset by 2 so every obstacle whose stamp touches the grid fits.
+        sx, sy = tiles[:, 0] + 2, tiles[:, 1] + 2
+        keep = (sx >= 0) & (sx <= grid_w + 2) & (sy >= 0) & (sy <= grid_h + 2)
+        seeds = np.zeros((grid_h + 3, grid_w + 3), dtype=np.int32)
+        np.add.at(seeds, (sy[keep], sx[keep]), 1)
+        counts = np.zeros((grid_h, grid_w), dtype=np.int32)
+        for dy in range(4):
+            for dx in range(4):
+                counts += seeds[dy:dy + grid_h, dx:dx + grid_w]
+        self.cells[:] = np.minimum(counts, 255).astype(np.uint8).tobytes()
+
+def create_collision_grid(obstacles, width, height):
+    """Create a grid representing walkable/unwalkable tiles"""
+    grid = CollisionGrid(width, height)
+    grid.rebuild(obstacles)
+    return grid
+
+# ============================================
+# A* SEARCH ENGINE
+# ============================================
+
+# Neighbor order matters: it decides which of several equal-cost paths wins
+NEIGHBOR_OFFSETS = ((0, 1), (1, 0), (0, -1), (-1, 0))
+
+# Past this many tiles, per-tile scratch lists would cost more memory than a search
+# ever touches, so searches use dicts holding only the tiles they reach
+DENSE_SEARCH_TILES = 1 << 20
+
+class SearchBuffers:
+    """Flat per-tile scratch arrays, reused by every search on a grid of this size"""
+    def __init__(self, size):
+        self.size = size
+        self.sparse = size > DENSE_SEARCH_TILES
+        if self.sparse:
+            self.cost, self.came_from = defaultdict(int), defaultdict(int)
+            self.seen, self.closed = defaultdict(int), defaultdict(int)
+        else:
+            self.cost = [0] * size
+            self.came_from = [0] * size
+            # A tile's cost/came_from entry is only valid if seen[tile] == search_id,
+            # so the arrays never need clearing between searches
+            self.seen = [0] * size
+            self.closed = [0] * size
+        self.search_id = 0
+        self.expanded = 0  # Nodes popped by the last search, for the profiler
+
+    def begin(self):
+        """Start a new search; returns its id"""
+        self.search_id += 1
+        if self.sparse:
+            for table in (self.cost, self.came_from, self.seen, self.closed):
+                table.clear()
+        return self.search_id
+
+_search_buffers = {}
+
+def get_search_buffers(size):
+    """Return the shared scratch buffers for grids with `size` tiles"""
+    buffers = _search_buffers.get(size)
+    if buffers is None:
+        buffers = _search_buffers[size] = SearchBuffers(size)
+    return buffers
+
+def find_walkable_goal(grid, goal_gx, goal_gy):
+    """If the goal tile is blocked, return the nearest walkable tile within 4 tiles (grid-local tiles)"""
+    grid_w, grid_h, cells = grid.grid_w, grid.grid_h, grid.cells
+    if cells[goal_gy * grid_w + goal_gx] != 0:
+        for r in range(1, 5):
+            for dx in range(-r, r+1):
+                for dy in range(-r, r+1):
+                    ngx, ngy = goal_gx + dx, goal_gy + dy
+                    if 0 <= ngx < grid_w and 0 <= ngy < grid_h and cells[ngy * grid_w + ngx] == 0:
+                        return ngx, ngy
+    return goal_gx, goal_gy
+
+def astar_search(grid, start_tile, goal_tile):
+    """Heap-based A* between two grid-local tiles; returns the list of tiles or None"""
+    grid_w, grid_h, cells = grid.grid_w, grid.grid_h, grid.cells
+    goal_gx, goal_gy = goal_tile
+
+    buffers = get_search_buffers(grid_w * grid_h)
+    search_id = buffers.begin()
+    cost, came_from = buffers.cost, buffers.came_from
+    seen, closed = buffers.seen, buffers.closed
+
+    # Tiles are flat row-major indices, the same layout as grid.cells
+    start = start_tile[1] * grid_w + start_tile[0]
+    goal = goal_gy * grid_w + goal_gx
+    seen[start] = search_id
+    cost[start] = 0
+    came_from[start] = -1
+
+    # Entries are (priority, insertion order, tile). The insertion counter breaks
+    # ties the same way the old stable sort + pop(0) frontier did.
+    frontier = [(0, 0, start)]
+    counter = 0
+    heappush, heappop = heapq.heappush, heapq.heappop
+    steps = [(dx, dy, dy * grid_w + dx) for dx, dy in NEIGHBOR_OFFSETS]
+
+    while frontier:
+        current = heappop(frontier)[2]
+        if closed[current] == search_id:
+            continue  # Stale duplicate, already expanded at a lower cost
+
+        if current == goal:
+            tiles = []
+            while current != -1:
+                cy, cx = divmod(current, grid_w)
+                tiles.append((cx, cy))
+                current = came_from[current]
+            tiles.reverse()
+            buffers.expanded = counter + 1 - len(frontier)
+            return tiles
+
+        closed[current] = search_id
+        cy, cx = divmod(current, grid_w)
+        new_cost = cost[current] + 1
+
+        for dx, dy, step in steps:
+            nx, ny = cx + dx, cy + dy
+            if 0 <= nx < grid_w and 0 <= ny < grid_h:
+                neighbor = current + step
+                if cells[neighbor] != 0 or closed[neighbor] == search_id:
+                    continue
+                if seen[neighbor] != search_id or new_cost < cost[neighbor]:
+                    seen[neighbor] = search_id
+                    cost[neighbor] = new_cost
+                    came_from[neighbor] = current
+                    counter += 1
+                    priority = new_cost + abs(nx - goal_gx) + abs(ny - goal_gy)
+                    heappush(frontier, (priority, counter, neighbor))
+
+    buffers.expanded = counter + 1
+    return None
+
+class IncrementalSearch:
+    """astar_search that can stop after any number of node expansions and carry on
+    later. It keeps its own state, so many can be part-done at once, and it finds
+    the same path astar_search would."""
+    def __init__(self, grid, start_tile, goal_tile):
+        self.grid = grid
+        self.version = grid.version  # The search is only good while the grid is unchanged
+        self.goal_tile = goal_tile
+        start = start_tile[1] * grid.grid_w + start_tile[0]
+        self.cost = {start: 0}
+        self.came_from = {start: -1}
+        self.closed = set()
+        self.frontier = [(0, 0, start)]  # Same (priority, insertion order, tile) entries as astar_search
+        self.counter = 0
+        self.done = False
+        self.tiles = None  # Tiles from start to goal once done, or None if there is no path
+
+    def run(self, max_nodes):
+        """Expand up to max_nodes more nodes; returns how many it expanded"""
+        grid = self.grid
+        grid_w, grid_h, cells = grid.grid_w, grid.grid_h, grid.cells
+        goal_gx, goal_gy = self.goal_tile
+        goal = goal_gy * grid_w + goal_gx
+        cost, came_from, closed, frontier = self.cost, self.came_from, self.closed, self.frontier
+        counter = self.counter
+        heappush, heappop = heapq.heappush, heapq.heappop
+        steps = [(dx, dy, dy * grid_w + dx) for dx, dy in NEIGHBOR_OFFSETS]
+        expanded = 0
+
+        while frontier and expanded < max_nodes:
+            current = heappop(frontier)[2]
+            if current in closed:
+                continue
+            expanded += 1
+
+            if current == goal:
+                tiles = []
+                while current != -1:
+                    cy, cx = divmod(current, grid_w)
+                    tiles.append((cx, cy))
+                    current = came_from[current]
+                tiles.reverse()
+                self.tiles = tiles
+                self.done = True
+                break
+
+            closed.add(current)
+            cy, cx = divmod(current, grid_w)
+            new_cost = cost[current] + 1
+
+            for dx, dy, step in steps:
+                nx, ny = cx + dx, cy + dy
+                if 0 <= nx < grid_w and 0 <= ny < grid_h:
+                    neighbor = current + step
+                    if cells[neighbor] != 0 or neighbor in closed:
+                        continue
+                    if new_cost < cost.get(neighbor, new_cost + 1):
+                        cost[neighbor] = new_cost
+                        came_from[neighbor] = current
+                        counter += 1
+                        priority = new_cost + abs(nx - goal_gx) + abs(ny - goal_gy)
+                        heappush(frontier, (priority, counter, neighbor))
+
+        self.counter = counter
+        if not frontier:
+            self.done = True  # Searched everything reachable (tiles stay None if the goal wasn't)
+        return expanded
+
+def astar_path(grid, start, goal, hierarchical=True, cached=True):
+    """A* pathfinding algorithm. Long searches on big grids go through HPA* (see
+    HierarchicalGraph) unless hierarchical is False; the grid's path_cache, if
+    it has one, answers repeats unless cached is False."""
+    if not PROFILER.enabled:
+        return _astar_path(grid, start, goal, hierarchical, cached)
+    start_time = PROFILER.clock()
+    buffers = get_search_buffers(grid.grid_w * grid.grid_h) if grid is not None else None
+    if buffers:
+        buffers.expanded = 0
+    path = _astar_path(grid, start, goal, hierarchical, cached)
+    nodes = buffers.expanded if buffers else 0
+    PROFILER.count('astar_calls')
+    PROFILER.count('astar_nodes', nodes)
+    PROFILER.lap('astar_path', start_time, {'nodes_expanded': nodes, 'path_length': len(path)})
+    return path
+
+def _astar_path(grid, start, goal, hierarchical=True, cached=True):
+    if grid is None:
+        return []
+    query = _path_query(grid, start, goal)
+    if query is None:
+        return []
+    start_tile, raw_goal = query
+
+    cache = grid.path_cache if cached else None
+    if cache is not None:
+        path = cache.get(grid.version, start_tile, raw_goal)
+        if path is not None:
+            return path
+
+    # If goal is blocked, find nearest walkable tile
+    goal_tile = find_walkable_goal(grid, *raw_goal)
+
+    if hierarchical and _use_hierarchy(grid, start_tile, goal_tile):
+        tiles = get_hierarchy(grid).path(start_tile, goal_tile)
+    else:
+        tiles = astar_search(grid, start_tile, goal_tile)
+    return _finish_path(grid, cache, start_tile, raw_goal, goal_tile, tiles)
+
+def _path_query(grid, start, goal):
+    """Grid-local (start tile, goal tile) for two world positions, or None if either is off the grid"""
+    grid_w, grid_h = grid.grid_w, grid.grid_h
+    start_gx, start_gy = world_to_grid(start[0], start[1])
+    goal_gx, goal_gy = world_to_grid(goal[0], goal[1])
+    start_gx, start_gy, goal_gx, goal_gy = start_gx - grid.gx0, start_gy - grid.gy0, goal_gx - grid.gx0, goal_gy - grid.gy0
+
+    # Bounds checking
+    if not (0 <= start_gx < grid_w and 0 <= start_gy < grid_h):
+        return None
+    if not (0 <= goal_gx < grid_w and 0 <= goal_gy < grid_h):
+        return None
+    return (start_gx, start_gy), (goal_gx, goal_gy)
+
+def _use_hierarchy(grid, start_tile, goal_tile):
+    """True if a search is long enough, on a big enough grid, to go through HPA*"""
+    return (grid.grid_w * grid.grid_h >= HPA_MIN_TILES
+            and abs(goal_tile[0] - start_tile[0]) + abs(goal_tile[1] - start_tile[1]) >= HPA_MIN_DISTANCE)
+
+def _finish_path(grid, cache, start_tile, raw_goal, goal_tile, tiles):
+    """Waypoints (tile centres in world pixels) for the tiles a search found, remembered in cache if given"""
+    if tiles is None:
+        path, tiles = [], ()  # No path found
+    else:
+        half = TILE_SIZE // 2
+        gx0, gy0 = grid.gx0, grid.gy0
+        path = [((gx + gx0) * TILE_SIZE + half, (gy + gy0) * TILE_SIZE + half) for gx, gy in tiles[1:]]  # Skip starting position
+    if cache is not None:
+        # HPA* routes may stop short of the goal; only whole paths can lend their suffixes
+        cache.put(grid.version, start_tile, raw_goal, path, tiles if tiles and tiles[-1] == goal_tile else ())
+    return path
+
+# ============================================
+# PATH CACHE
+# ============================================
+
+PATH_CACHE_SIZE = 256  # Paths kept per grid
+
+class PathCache:
+    """LRU memo of astar_path results on one grid, keyed on (grid version, start tile, goal tile).
+
+    A search starting on a tile of a cached path to the same goal gets the rest
+    of that path, since every suffix of a shortest path is a shortest path.
+    Entries from an older grid version can never hit again, so they are all
+    dropped when the version changes. Tiles are grid-local.
+    """
+    def __init__(self, max_entries=PATH_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # (version, start tile, goal tile) -> (path, tiles), most recently used last
+        self.on_path = {}  # (goal tile, tile on a cached path) -> (its key, index of the tile's waypoint)
+        self.version = None
+        self.hits = self.suffix_hits = self.misses = self.evictions = 0
+
+    def get(self, version, start_tile, goal_tile):
+        """A copy of the cached path, or None on a miss"""
+        if version != self.version:
+            self.clear()
+            self.version = version
+        key = (version, start_tile, goal_tile)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return list(entry[0])
+        found = self.on_path.get((goal_tile, start_tile))
+        if found is not None:
+            key, index = found
+            self.entries.move_to_end(key)
+            self.suffix_hits += 1
+            return list(self.entries[key][0][index + 1:])
+        self.misses += 1
+        return None
+
+    def put(self, version, start_tile, goal_tile, path, tiles):
+        """Remember a search's path; `tiles` (start first) are indexed for suffix reuse if given"""
+        if version != self.version:
+            self.clear()
+            self.version = version
+        key = (version, start_tile, goal_tile)
+        self.entries[key] = (tuple(path), tuple(tiles))
+        on_path = self.on_path
+        for index, tile in enumerate(tiles[1:]):
+            on_path.setdefault((goal_tile, tile), (key, index))
+        if len(self.entries) > self.max_entries:
+            old_key, (_, old_tiles) = self.entries.popitem(last=False)
+            self.evictions += 1
+            for tile in old_tiles[1:]:
+                if on_path.get((old_key[2], tile), (None,))[0] == old_key:
+                    del on_path[old_key[2], tile]
+
+    def clear(self):
+        self.entries.clear()
+        self.on_path.clear()
+
+    def stats(self):
+        """Hit/miss/eviction counters, in the same shape as rendering.text_cache_stats()"""
+        lookups = self.hits + self.suffix_hits + self.misses
+        return {
+            'hits': self.hits,
+            'suffix_hits': self.suffix_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self.entries),
+            'max_size': self.max_entries,
+            'hit_rate': (self.hits + self.suffix_hits) / lookups if lookups else 0.0,
+        }
+
+# ============================================
+# PATH SCHEDULER
+# ============================================
+
+PATH_BUDGET_US = 2000  # Pathfinding time allowed per tick
+EXPANSION_US = 2.0  # Nominal cost of expanding one A* node, for turning the budget into a node count
+HPA_NODE_EXPANSIONS = 1.5  # What an HPA* abstract node costs in A* expansions, floods and refining included
+
+class _PathRequest:
+    __slots__ = ('owner', 'grid', 'start', 'goal', 'tick', 'query', 'search', 'path')
+
+    def __init__(self, owner, grid, start, goal, tick):
+        self.owner, self.grid, self.start, self.goal, self.tick = owner, grid, start, goal, tick
+        self.query = self.search = self.path = None
+
+class PathScheduler:
+    """Path requests worked through a slice at a time, most urgent first, within a
+    per-tick budget, so a crowd re-planning at once can't blow up a frame.
+
+    request() answers at once (with the path astar_path would give) while the
+    tick's budget lasts. Past that the request waits its turn, its search
+    carrying on from where it stopped each tick, and the owner keeps its old
+    path until owner.set_path() hands it the new one. Lower priorities go first.
+
+    The budget is counted in node expansions at a nominal EXPANSION_US each, not
+    timed with a clock, so the same inputs always get their paths on the same
+    tick and replays stay exact.
+    """
+    def __init__(self, budget_us=PATH_BUDGET_US):
+        self.budget = max(1, int(budget_us / EXPANSION_US))  # Node expansions per tick
+        self.allowance = self.budget  # Left this tick; goes negative if an HPA* search overran
+        self.queue = []  # Heap of (priority, order, _PathRequest)
+        self.pending = {}  # id(owner) -> its queued _PathRequest
+        self.order = 0
+        self.tick = 0
+        self.served = self.deferred = self.expanded = self.max_wait = 0
+
+    def begin_tick(self):
+        """Give a new tick its budget (less any overrun) and spend it on the waiting requests"""
+        self.tick += 1
+        self.allowance = min(self.allowance, 0) + self.budget
+        queue = self.queue
+        while queue and self.allowance > 0:
+            request = queue[0][2]
+            if not self._work(request):
+                break  # Out of budget part-way through; it carries on next tick
+            heapq.heappop(queue)
+            del self.pending[id(request.owner)]
+            self.max_wait = max(self.max_wait, self.tick - request.tick)
+            self._deliver(request)
+
+    def request(self, owner, grid, start, goal, priority=0):
+        """Ask for a path from start to goal (world pixels) for owner. If a request of
+        the owner's is still waiting, that one stands and this one is dropped."""
+        if id(owner) in self.pending:
+            return
+        request = _PathRequest(owner, grid, start, goal, self.tick)
+        if not self.queue and self.allowance > 0 and self._work(request):
+            self._deliver(request)
+            return
+        self.order += 1
+        heapq.heappush(self.queue, (priority, self.order, request))
+        self.pending[id(owner)] = request
+        self.deferred += 1
+
+    def clear(self):
+        """Drop every waiting request (their owners keep the paths they have)"""
+        self.queue.clear()
+        self.pending.clear()
+        self.allowance = self.budget
+
+    def stats(self):
+        return {
+            'served': self.served,
+            'deferred': self.deferred,
+            'waiting': len(self.queue),
+            'max_wait': self.max_wait,
+            'expanded': self.expanded,
+            'budget': self.budget,
+        }
+
+    def _deliver(self, request):
+        self.served += 1
+        request.owner.set_path(request.path)
+
+    def _charge(self, nodes):
+        self.allowance -= nodes
+        self.expanded += nodes
+        if PROFILER.enabled:
+            PROFILER.count('astar_nodes', nodes)
+
+    def _work(self, request):
+        """Spend this tick's allowance on a request; True once request.path is ready"""
+        grid = request.grid
+        search = request.search
+        if search is None or search.version != grid.version:
+            # First go, or the grid changed under a part-done search: start over
+            query = _path_query(grid, request.start, request.goal)
+            if query is None:
+                request.path = []
+                return True
+            start_tile, raw_goal = query
+            cache = grid.path_cache
+            if cache is not None:
+                path = cache.get(grid.version, start_tile, raw_goal)
+                if path is not None:
+                    request.path = path
+                    return True
+            goal_tile = find_walkable_goal(grid, *raw_goal)
+            request.query = (start_tile, raw_goal, goal_tile)
+            if _use_hierarchy(grid, start_tile, goal_tile):
+                # HPA* can't be paused, but it's cheap next to a long flat search.
+                # Any overrun comes out of the next tick's budget.
+                hierarchy = get_hierarchy(grid)
+                tiles = hierarchy.path(start_tile, goal_tile)
+                self._charge(1 + int(hierarchy.expanded * HPA_NODE_EXPANSIONS))
+                request.path = _finish_path(grid, cache, start_tile, raw_goal, goal_tile, tiles)
+                return True
+            search = request.search = IncrementalSearch(grid, start_tile, goal_tile)
+
+        self._charge(search.run(self.allowance))
+        if not search.done:
+            return False
+        request.path = _finish_path(grid, grid.path_cache, *request.query, search.tiles)
+        return True
+
+# ============================================
+# HIERARCHICAL A* (HPA*)
+# ============================================
+
+CLUSTER_TILES = 16  # Side of an HPA* cluster, in tiles
+HPA_MIN_TILES = 192 * 192  # Smaller grids are always searched tile by tile (HPA* only pays off from about here)
+HPA_MIN_DISTANCE = 2 * CLUSTER_TILES  # Shorter searches (Manhattan tiles) stay tile by tile too
+ENTRANCE_SPLIT = 6  # Border openings this wide get a transition at each end instead of one in the middle
+REFINE_TILES = CLUSTER_TILES  # Long routes come back refined at least this many tiles ahead
+# Weight on the abstract search's estimate: routes up to 20% longer (about 5% on average)
+# for a fraction of the expansions
+HPA_WEIGHT = 1.2
+
+class HierarchicalGraph:
+    """HPA* over a CollisionGrid: the grid cut into square clusters, with an abstract
+    graph whose nodes are transition tiles on the cluster borders.
+
+    Each open stretch of a border gets one or two transitions, a tile on each
+    side one step apart; inside a cluster, transitions are joined by their
+    in-cluster distance. A search runs on this graph and only the start of the
+    route is refined into tiles, since callers re-plan long before the end.
+    Borders and clusters are worked out the first time a search reaches them
+    and forgotten when their tiles change, so a moved block only costs the
+    clusters around it. Tiles are flat grid-local indices, as in astar_search.
+    """
+    def __init__(self, grid, cluster_tiles=CLUSTER_TILES):
+        self.grid = grid
+        self.size = cluster_tiles
+        self.cols = -(-grid.grid_w // cluster_tiles)
+        self.rows = -(-grid.grid_h // cluster_tiles)
+        self.reset()
+
+    def reset(self):
+        """Forget everything (after the whole grid changed)"""
+        self.borders = {}  # (cx, cy, dx, dy) -> transition pairs between cluster (cx, cy) and (cx+dx, cy+dy)
+        self.partners = {}  # Transition tile -> the tiles one step across a border from it
+        self.clusters = {}  # (cx, cy) -> the cluster's transition tiles, once worked out
+        self.links = {}  # Transition tile -> [(tile, steps)]: its cluster's other transitions, then its partners
+        self.expanded = 0  # Abstract nodes popped by the last search
+        self.builds = 0  # Clusters worked out so far
+
+    def invalidate(self, x0, y0, x1, y1):
+        """Forget the clusters holding tiles x0..x1, y0..y1, their borders and their neighbours' edges"""
+        size = self.size
+        for cy in range(y0 // size, y1 // size + 1):
+            for cx in range(x0 // size, x1 // size + 1):
+                for key in ((cx, cy, 1, 0), (cx - 1, cy, 1, 0), (cx, cy, 0, 1), (cx, cy - 1, 0, 1)):
+                    for a, b in self.borders.pop(key, ()):
+                        self._unlink(a, b)
+                        self._unlink(b, a)
+                for key in ((cx, cy), (cx + 1, cy), (cx - 1, cy), (cx, cy + 1), (cx, cy - 1)):
+                    for node in self.clusters.pop(key, ()):
+                        del self.links[node]
+
+    def _unlink(self, a, b):
+        partners = self.partners[a]
+        partners.remove(b)
+        if not partners:
+            del self.partners[a]
+
+    def build_all(self):
+        """Work out every cluster now instead of on demand"""
+        for cy in range(self.rows):
+            for cx in range(self.cols):
+                self._cluster((cx, cy))
+
+    def cluster_of(self, tile):
+        grid_w = self.grid.grid_w
+        return tile % grid_w // self.size, tile // grid_w // self.size
+
+    def _border(self, key):
+        """Transition pairs across one border, as (tile on this side, tile on the other)"""
+        pairs = self.borders.get(key)
+        if pairs is not None:
+            return pairs
+        cx, cy, dx, _ = key
+        size, grid = self.size, self.grid
+        cells, grid_w = grid.cells, grid.grid_w
+        if dx:  # Between a cluster and the one to its right
+            x = (cx + 1) * size - 1
+            line, step = [y * grid_w + x for y in range(cy * size, min((cy + 1) * size, grid.grid_h))], 1
+        else:  # Between a cluster and the one below
+            row = ((cy + 1) * size - 1) * grid_w
+            line, step = [row + x for x in range(cx * size, min((cx + 1) * size, grid_w))], grid_w
+        pairs, run = [], []
+        for tile in line + [None]:
+            if tile is not None and cells[tile] == 0 and cells[tile + step] == 0:
+                run.append(tile)
+                continue
+            if run:
+                picks = (run[0], run[-1]) if len(run) >= ENTRANCE_SPLIT else (run[len(run) // 2],)
+                pairs += [(tile, tile + step) for tile in picks]
+                run = []
+        for a, b in pairs:
+            self.partners.setdefault(a, []).append(b)
+            self.partners.setdefault(b, []).append(a)
+        self.borders[key] = pairs
+        return pairs
+
+    def _cluster(self, key):
+        """A cluster's transition tiles, linking each to the others by in-cluster steps"""
+        nodes = self.clusters.get(key)
+        if nodes is not None:
+            return nodes
+        cx, cy = key
+        nodes = []
+        if cx + 1 < self.cols:
+            nodes += [a for a, _ in self._border((cx, cy, 1, 0))]
+        if cx > 0:
+            nodes += [b for _, b in self._border((cx - 1, cy, 1, 0))]
+        if cy + 1 < self.rows:
+            nodes += [a for a, _ in self._border((cx, cy, 0, 1))]
+        if cy > 0:
+            nodes += [b for _, b in self._border((cx, cy - 1, 0, 1))]
+        nodes = list(dict.fromkeys(nodes))  # A corner tile can sit on two borders
+        links = {node: [] for node in nodes}
+        # Steps are symmetric, so each flood only needs the transitions after its own
+        for i, node in enumerate(nodes[:-1]):
+            steps = self._flood(key, node, nodes[i + 1:])[0]
+            for other in nodes[i + 1:]:
+                if other in steps:
+                    links[node].append((other, steps[other]))
+                    links[other].append((node, steps[other]))
+        for node in nodes:
+            links[node] += [(other, 1) for other in self.partners.get(node, ())]
+        self.links.update(links)
+        self.clusters[key] = nodes
+        self.builds += 1
+        return nodes
+
+    def _flood(self, key, start, targets=()):
+        """Breadth-first search from `start` that stays inside cluster `key`, stopping
+        early once every tile in `targets` is reached: (steps, came_from) by tile"""
+        size, grid = self.size, self.grid
+        cells, grid_w = grid.cells, grid.grid_w
+        x0, y0 = key[0] * size, key[1] * size
+        x1, y1 = min(x0 + size, grid_w) - 1, min(y0 + size, grid.grid_h) - 1
+        steps, came_from = {start: 0}, {start: -1}
+        targets = set(targets)
+        targets.discard(start)
+        wanted = len(targets) or float('inf')  # No targets: flood the whole cluster
+        queue = deque([start])
+        popleft, append = queue.popleft, queue.append
+        found = []
+        while queue and wanted > len(found):
+            current = popleft()
+            cy, cx = divmod(current, grid_w)
+            next_steps = steps[current] + 1
+            # Same neighbour order as NEIGHBOR_OFFSETS, unrolled: this loop is most of a search
+            if cy < y1:
+                neighbor = current + grid_w
+                if neighbor not in steps and cells[neighbor] == 0:
+                    steps[neighbor], came_from[neighbor] = next_steps, current
+                    append(neighbor)
+                    if neighbor in targets:
+                        found.append(neighbor)
+            if cx < x1:
+                neighbor = current + 1
+                if neighbor not in steps and cells[neighbor] == 0:
+                    steps[neighbor], came_from[neighbor] = next_steps, current
+                    append(neighbor)
+                    if neighbor in targets:
+                        found.append(neighbor)
+            if cy > y0:
+                neighbor = current - grid_w
+                if neighbor not in steps and cells[neighbor] == 0:
+                    steps[neighbor], came_from[neighbor] = next_steps, current
+                    append(neighbor)
+                    if neighbor in targets:
+                        found.append(neighbor)
+            if cx > x0:
+                neighbor = current - 1
+                if neighbor not in steps and cells[neighbor] == 0:
+                    steps[neighbor], came_from[neighbor] = next_steps, current
+                    append(neighbor)
+                    if neighbor in targets:
+                        found.append(neighbor)
+        return steps, came_from
+
+    def path(self, start_tile, goal_tile):
+        """Like astar_search, but the tiles only run as far as the route has been refined
+        (at least REFINE_TILES, or to the goal); None if there is no path"""
+        grid, grid_w = self.grid, self.grid.grid_w
+        start = start_tile[1] * grid_w + start_tile[0]
+        goal = goal_tile[1] * grid_w + goal_tile[0]
+        if grid.cells[goal] != 0:
+            return None  # Like astar_search: a blocked goal is never reached
+        if grid.cells[start] != 0 and start != goal:
+            # Standing on a blocked tile: step off it first, toward the goal if that side
+            # leads anywhere. The step may cross a border where no transition is.
+            sx, sy = start_tile
+            exits = sorted((abs(sx + dx - goal_tile[0]) + abs(sy + dy - goal_tile[1]), i, (sx + dx, sy + dy))
+                           for i, (dx, dy) in enumerate(NEIGHBOR_OFFSETS)
+                           if 0 <= sx + dx < grid_w and 0 <= sy + dy < grid.grid_h
+                           and grid.cells[(sy + dy) * grid_w + sx + dx] == 0)
+            for _, _, exit_tile in exits:
+                tiles = self.path(exit_tile, goal_tile)
+                if tiles is not None:
+                    return [start_tile] + tiles
+            return None
+        start_key, goal_key = self.cluster_of(start), self.cluster_of(goal)
+        start_nodes, goal_nodes = self._cluster(start_key), self._cluster(goal_key)
+        start_steps, start_from = self._flood(start_key, start, start_nodes + [goal] * (start_key == goal_key))
+        goal_steps, goal_from = self._flood(goal_key, goal, goal_nodes)
+
+        if goal not in start_steps and not (any(node in start_steps for node in start_nodes)
+                                            and any(node in goal_steps for node in goal_nodes)):
+            return None  # The start or the goal is shut in inside its cluster
+        route = self._search(start, start_key, start_steps, goal, goal_key, goal_steps)
+        if route is None:
+            return None
+
+        # Refine the route a leg at a time: within a cluster by a flood, across a border in one step
+        tiles = [start]
+        for a, b in zip(route, route[1:]):
+            if len(tiles) > REFINE_TILES:
+                break
+            if self.cluster_of(a) != self.cluster_of(b):
+                leg = [b]
+            elif a == start:
+                leg = []
+                while b != start:
+                    leg.append(b)
+                    b = start_from[b]
+                leg.reverse()
+            elif b == goal:
+                leg = []
+                while a != goal:
+                    a = goal_from[a]
+                    leg.append(a)
+            else:
+                came_from = self._flood(self.cluster_of(a), a, (b,))[1]
+                leg = []
+                while b != a:
+                    leg.append(b)
+                    b = came_from[b]
+                leg.reverse()
+            tiles += leg
+        return [(tile % grid_w, tile // grid_w) for tile in tiles]
+
+    def _search(self, start, start_key, start_steps, goal, goal_key, goal_steps):
+        """A* over the abstract graph plus the start and goal; returns the route of tiles"""
+        grid_w = self.grid.grid_w
+        goal_x, goal_y = goal % grid_w, goal // grid_w
+        goal_links = {node: goal_steps[node] for node in self._cluster(goal_key) if node in goal_steps}
+        cost, came_from = {}, {}
+        frontier = []
+        counter = 0
+        heappush, heappop = heapq.heappush, heapq.heappop
+
+        # Entries are (weighted estimate, steps left, insertion order, tile): among equal estimates
+        # the one nearest the goal goes first, which keeps the search from widening over open ground
+        first = [(node, start_steps[node]) for node in self._cluster(start_key) if node in start_steps]
+        if start_key == goal_key and goal in start_steps:
+            first.append((goal, start_steps[goal]))
+        for node, steps in first:
+            if steps < cost.get(node, steps + 1):
+                cost[node], came_from[node] = steps, start
+                remaining = abs(node % grid_w - goal_x) + abs(node // grid_w - goal_y)
+                counter += 1
+                heappush(frontier, (steps + HPA_WEIGHT * remaining, remaining, counter, node))
+
+        links = self.links
+        closed = set()
+        while frontier:
+            node = heappop(frontier)[3]
+            if node in closed:
+                continue
+            if node == goal:
+                self.expanded = len(closed)
+                route = [goal]
+                while node != start:
+                    node = came_from[node]
+                    route.append(node)
+                route.reverse()
+                return route
+            closed.add(node)
+            node_links = links.get(node)
+            if node_links is None:  # Reached across a border into a cluster not worked out yet
+                self._cluster(self.cluster_of(node))
+                node_links = links[node]
+            if node in goal_links:
+                node_links = node_links + [(goal, goal_links[node])]
+            node_cost = cost[node]
+            for other, steps in node_links:
+                new_cost = node_cost + steps
+                if new_cost < cost.get(other, new_cost + 1) and other not in closed:
+                    cost[other], came_from[other] = new_cost, node
+                    remaining = abs(other % grid_w - goal_x) + abs(other // grid_w - goal_y)
+                    counter += 1
+                    heappush(frontier, (new_cost + HPA_WEIGHT * remaining, remaining, counter, other))
+        self.expanded = len(closed)
+        return None
+
+def get_hierarchy(grid):
+    """The grid's HierarchicalGraph, made on first use and kept up to date by the grid"""
+    if grid.hierarchy is None:
+        grid.hierarchy = HierarchicalGraph(grid)
+    return grid.hierarchy
+
+# ============================================
+# FLOW FIELD (SHARED CHASE TARGET)
+# ============================================
+
+class _Distances(dict):
+    """Sparse distance table: tiles the BFS never reached read as -1"""
+    __slots__ = ()
+
+    def __missing__(self, tile):
+        return -1
+
+class FlowField:
+    """Dijkstra map toward one target, shared by every NPC chasing it"""
+    def __init__(self, max_distance=None):
+        self.max_distance = max_distance  # BFS radius in tiles (None = whole grid)
+        self.grid = None
+        self.grid_version = -1
+        self.grid_w = self.grid_h = 0
+        self.gx0 = self.gy0 = 0
+        self.target_tile = None
+        # Step counts by flat row-major tile, -1 = unreachable: a list over the whole
+        # grid, or with a max_distance a dict of the tiles within reach only, so the
+        # cost of a rebuild doesn't grow with the map
+        self.distance = None
+        self.builds = 0
+
+    def update(self, grid, target_pos):
+        """Rebuild the field only if the grid or the target's tile changed"""
+        if grid is None:
+            self.grid, self.distance = None, None
+            return
+        grid_w, grid_h = grid.grid_w, grid.grid_h
+        gx, gy = world_to_grid(target_pos[0], target_pos[1])
+        gx, gy = gx - grid.gx0, gy - grid.gy0
+        if not (0 <= gx < grid_w and 0 <= gy < grid_h):
+            self.grid, self.target_tile, self.distance = grid, None, None
+            return
+        tile = find_walkable_goal(grid, gx, gy)
+        if (grid is self.grid and grid.version == self.grid_version
+                and tile == self.target_tile and self.distance is not None):
+            return
+        self.grid, self.grid_version = grid, grid.version
+        self.grid_w, self.grid_h = grid_w, grid_h
+        self.gx0, self.gy0 = grid.gx0, grid.gy0
+        self.target_tile = tile
+        self.distance = self._build(grid, grid_w, grid_h, tile)
+        self.builds += 1
+
+    def _build(self, grid, grid_w, grid_h, tile):
+        """Breadth-first search outward from the target tile"""
+        cells = grid.cells
+        max_distance = self.max_distance
+        distance = [-1] * (grid_w * grid_h) if max_distance is None else _Distances()
+        start = tile[1] * grid_w + tile[0]
+        if cells[start] != 0:
+            return distance  # Target is walled in: nothing can reach it
+        distance[start] = 0
+        steps = [(dx, dy, dy * grid_w + dx) for dx, dy in NEIGHBOR_OFFSETS]
+        queue = deque([start])
+        while queue:
+            current = queue.popleft()
+            next_distance = distance[current] + 1
+            if max_distance is not None and next_distance > max_distance:
+                continue
+            cy, cx = divmod(current, grid_w)
+            for dx, dy, step in steps:
+                nx, ny = cx + dx, cy + dy
+                if 0 <= nx < grid_w and 0 <= ny < grid_h:
+                    neighbor = current + step
+                    if cells[neighbor] == 0 and distance[neighbor] == -1:
+                        distance[neighbor] = next_distance
+                        queue.append(neighbor)
+        return distance
+
+    def next_waypoint(self, pos):
+        """World-space centre of the next tile toward the target, or None if already there/unreachable"""
+        distance = self.distance
+        if distance is None:
+            return None
+        grid_w, grid_h = self.grid_w, self.grid_h
+        gx, gy = world_to_grid(pos[0], pos[1])
+        gx, gy = gx - self.gx0, gy - self.gy0
+        if not (0 <= gx < grid_w and 0 <= gy < grid_h):
+            return None
+        here = distance[gy * grid_w + gx]
+        if here == 0:
+            return None
+
+        # Step to the neighbor closest to the target. This also works when the NPC
+        # stands on a blocked tile (here == -1), like A* leaving a blocked start.
+        best, best_tile = -1, None
+        for dx, dy in NEIGHBOR_OFFSETS:
+            nx, ny = gx + dx, gy + dy
+            if 0 <= nx < grid_w and 0 <= ny < grid_h:
+                d = distance[ny * grid_w + nx]
+                if d != -1 and (best == -1 or d < best):
+                    best, best_tile = d, (nx, ny)
+        if best_tile is None or (here != -1 and best >= here):
+            return None
+        half = TILE_SIZE // 2
+        return (best_tile[0] + self.gx0) * TILE_SIZE + half, (best_tile[1] + self.gy0) * TILE_SIZE + half
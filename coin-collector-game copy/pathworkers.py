@@ -0,0 +1,173 @@
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+
+from settings import TILE_SIZE
+from pathfinding import CollisionGrid, astar_path
+from profiler import PROFILER
+
+# ============================================
+# WORKER SIDE
+# ============================================
+
+_worker = {}  # Per-process view of the newest grid block seen: 'name', 'block', 'grid'
+
+def _init_worker():
+    PROFILER.enabled = False  # A forked worker may inherit an enabled profiler it has no use for
+
+def _worker_grid(header):
+    """A CollisionGrid over a published block, attached once per block rather than per batch"""
+    name, grid_w, grid_h, gx0, gy0, version = header
+    if _worker.get('name') != name:
+        if 'block' in _worker:
+            _worker['grid'].cells.release()
+            _worker['block'].close()
+        # The pool owns and unlinks every block. Before Python 3.13 attaching registers the
+        # block with the resource tracker again, harmlessly: it's the pool's tracker (see PathWorkerPool)
+        try:
+            block = shared_memory.SharedMemory(name, track=False)
+        except TypeError:
+            block = shared_memory.SharedMemory(name)
+        grid = CollisionGrid(grid_w * TILE_SIZE, grid_h * TILE_SIZE, (gx0, gy0))
+        grid.cells = block.buf[:grid_w * grid_h]  # Read in place: the searches only index it
+        grid.version = version
+        _worker.update(name=name, block=block, grid=grid)
+    return _worker['grid']
+
+def _find_paths(header, queries):
+    grid = _worker_grid(header)
+    return [astar_path(grid, start, goal) for start, goal in queries]
+
+# ============================================
+# POOL
+# ============================================
+
+class PathWorkerPool:
+    """NPC path searches on a pool of worker processes, with the same request() as PathScheduler.
+
+    Requests made during a tick go out when dispatch() is called, split into
+    one batch per worker, and the next begin_tick() hands the paths to their
+    owners (waiting for any batch not back yet). Paths always land exactly
+    one tick after they were asked for, however busy the workers are, so
+    replays stay exact.
+
+    Workers read the collision grid straight out of shared memory. The grid
+    is copied into a new block only when its version changes, and a block is
+    unlinked once no batch in flight still reads it.
+    """
+    def __init__(self, processes=None):
+        self.processes = processes or os.cpu_count() or 1
+        # Fork on Linux, which is quick and safe while this process has no threads yet (make
+        # the pool before pygame.init()). macOS libraries aren't fork-safe, so there and on
+        # Windows workers are spawned, and re-import the main script: it must be guarded
+        method = 'fork' if sys.platform.startswith('linux') else 'spawn'
+        self.executor = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context(method),
+                                            initializer=_init_worker)
+        # Workers must share this process's resource tracker, not start their own:
+        # a tracker of their own would unlink every block they touched when they exit
+        resource_tracker.ensure_running()
+        # Start the workers now, before the game has threads of its own to fork
+        for future in [self.executor.submit(os.getpid) for _ in range(self.processes)]:
+            future.result()
+        self.published = None  # (grid, version, block name, header) of the newest copy
+        self.blocks = {}  # Block name -> [SharedMemory, batches in flight reading it]
+        self.batch = []  # (owner, grid, start, goal) asked for since the last dispatch()
+        self.in_flight = []  # (owners, block name, future) per dispatched batch, in order
+        self.pending = set()  # id() of owners with a request batched or in flight
+        self.served = self.batches = self.republished = 0
+        self.wait_time = 0.0  # Seconds begin_tick() spent waiting on workers
+
+    def begin_tick(self):
+        """Hand out the paths dispatched last tick, waiting for any still being searched"""
+        if not self.in_flight:
+            return
+        start = time.perf_counter()
+        results = [future.result() for _, _, future in self.in_flight]
+        self.wait_time += time.perf_counter() - start
+        in_flight, self.in_flight = self.in_flight, []
+        for (owners, name, _), paths in zip(in_flight, results):
+            for owner, path in zip(owners, paths):
+                self.pending.discard(id(owner))
+                owner.set_path(path)
+            self.served += len(owners)
+            self._release(name)
+
+    def request(self, owner, grid, start, goal, priority=0):
+        """Ask for a path from start to goal (world pixels) for owner. Priority doesn't
+        matter here, as every request is answered next tick; like PathScheduler, a
+        request from an owner whose last one is still out is dropped."""
+        if id(owner) in self.pending:
+            return
+        self.pending.add(id(owner))
+        self.batch.append((owner, grid, start, goal))
+
+    def dispatch(self):
+        """Send the requests made this tick to the workers"""
+        if not self.batch:
+            return
+        batch, self.batch = self.batch, []
+        by_grid = {}
+        for request in batch:
+            by_grid.setdefault(id(request[1]), []).append(request)
+        for requests in by_grid.values():
+            name, header = self._publish(requests[0][1])
+            size = -(-len(requests) // self.processes)
+            for i in range(0, len(requests), size):
+                chunk = requests[i:i + size]
+                future = self.executor.submit(_find_paths, header, [(start, goal) for _, _, start, goal in chunk])
+                self.in_flight.append(([owner for owner, _, _, _ in chunk], name, future))
+                self.blocks[name][1] += 1
+                self.batches += 1
+
+    def clear(self):
+        """Drop every request (their owners keep the paths they have)"""
+        for _, name, future in self.in_flight:
+            future.result()  # Let the worker finish with the block before it can go
+            self._release(name)
+        self.in_flight = []
+        self.batch = []
+        self.pending.clear()
+
+    def close(self):
+        self.clear()
+        self.executor.shutdown()
+        self.published = None
+        for name in list(self.blocks):
+            self._release(name, 0)
+
+    def stats(self):
+        return {
+            'served': self.served,
+            'batches': self.batches,
+            'republished': self.republished,
+            'waited_ms': self.wait_time * 1000,
+            'processes': self.processes,
+        }
+
+    def _publish(self, grid):
+        """Name and header of a shared copy of grid's current cells, copying them only if they changed"""
+        published = self.published
+        if published is not None and published[0] is grid and published[1] == grid.version:
+            return published[2], published[3]
+        cells = grid.cells
+        block = shared_memory.SharedMemory(create=True, size=max(len(cells), 1))
+        block.buf[:len(cells)] = cells
+        header = (block.name, grid.grid_w, grid.grid_h, grid.gx0, grid.gy0, grid.version)
+        self.blocks[block.name] = [block, 0]
+        self.published = (grid, grid.version, block.name, header)
+        self.republished += 1
+        if published is not None:
+            self._release(published[2], 0)
+        return block.name, header
+
+    def _release(self, name, batches=1):
+        """One batch reading a block is done; unlink the block if it's unused and superseded"""
+        entry = self.blocks[name]
+        entry[1] -= batches
+        if entry[1] <= 0 and (self.published is None or self.published[2] != name):
+            entry[0].close()
+            entry[0].unlink()
+            del self.blocks[name]
@@ -0,0 +1,90 @@
+import json
+from collections import deque
+from time import perf_counter
+
+# ============================================
+# FRAME PROFILER
+# ============================================
+
+FRAME_HISTORY = 240  # Frames kept for the overlay graph (4 seconds)
+MAX_TRACE_EVENTS = 1_000_000
+
+class FrameProfiler:
+    """Per-phase frame timings, with an optional Chrome trace of every phase.
+
+    Instrumented code checks `enabled` first and then calls lap(), so a
+    disabled profiler costs one attribute test per phase:
+
+        profiler = PROFILER if PROFILER.enabled else None
+        if profiler: t = profiler.clock()
+        ...
+        if profiler: t = profiler.lap('ai', t)
+    """
+    clock = staticmethod(perf_counter)
+
+    def __init__(self, history=FRAME_HISTORY):
+        self.enabled = False
+        self.history = deque(maxlen=history)  # One {phase: seconds} dict per frame, plus 'frame'
+        self.counters_history = deque(maxlen=history)
+        self.current = {}
+        self.counters = {}
+        self.frame_start = None
+        self.trace = None  # List of trace events while capturing
+        self.origin = perf_counter()
+
+    def lap(self, name, start, args=None):
+        """Record the phase that ran from `start` until now; returns now for the next phase"""
+        end = perf_counter()
+        self.current[name] = self.current.get(name, 0.0) + (end - start)
+        if self.trace is not None and len(self.trace) < MAX_TRACE_EVENTS:
+            event = {'name': name, 'ph': 'X', 'pid': 1, 'tid': 1,
+                     'ts': (start - self.origin) * 1e6, 'dur': (end - start) * 1e6}
+            if args:
+                event['args'] = args
+            self.trace.append(event)
+        return end
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def begin_frame(self):
+        self.frame_start = perf_counter()
+
+    def end_frame(self):
+        """Close the frame's timings (call before the frame-rate wait, so idle time isn't counted)"""
+        if self.frame_start is not None:
+            self.lap('frame', self.frame_start)
+        self.history.append(self.current)
+        self.counters_history.append(self.counters)
+        self.current, self.counters = {}, {}
+        self.frame_start = None
+
+    def averages(self):
+        """Mean milliseconds per frame for each phase over the history"""
+        totals = {}
+        for frame in self.history:
+            for name, seconds in frame.items():
+                totals[name] = totals.get(name, 0.0) + seconds
+        frames = len(self.history) or 1
+        return {name: total * 1000 / frames for name, total in totals.items()}
+
+    def counter_averages(self):
+        totals = {}
+        for counters in self.counters_history:
+            for name, amount in counters.items():
+                totals[name] = totals.get(name, 0) + amount
+        frames = len(self.counters_history) or 1
+        return {name: total / frames for name, total in totals.items()}
+
+    def start_trace(self):
+        self.trace = []
+
+    def save_trace(self, path):
+        """Write the captured events as Chrome trace-event JSON (chrome://tracing, Perfetto) and stop capturing"""
+        events, self.trace = self.trace or [], None
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        return len(events)
+
+# The one profiler shared by the main loop, World and pathfinding
+PROFILER = FrameProfiler()
@@ -0,0 +1,172 @@
+from collections import OrderedDict
+from functools import lru_cache
+
+import pygame
+
+# ============================================
+# CACHED LAYERS
+# ============================================
+
+class CachedLayer:
+    """A surface drawn once and reused until its key changes (static world, HUD bar)"""
+    def __init__(self, size, draw_fn):
+        self.size = size
+        self.draw_fn = draw_fn  # draw_fn(surface) paints the layer
+        self.surface = None
+        self.key = None
+        self.rebuilds = 0
+
+    def invalidate(self):
+        """Force a rebuild next frame (call when the layer's content changes)"""
+        self.surface = None
+
+    def get(self, key=None):
+        """Return the baked surface, redrawing it if invalidated or `key` changed.
+        Returns (surface, rebuilt)."""
+        if self.surface is not None and key == self.key:
+            return self.surface, False
+        surface = pygame.Surface(self.size)
+        if pygame.display.get_surface() is not None:
+            surface = surface.convert()  # Match the display format for fast blits
+        self.draw_fn(surface)
+        self.surface, self.key = surface, key
+        self.rebuilds += 1
+        return surface, True
+
+class ChunkedLayer:
+    """A static layer for a map bigger than the screen, baked one chunk at a time.
+    Only the chunks in view are drawn; past `max_chunks` the least recently used are dropped."""
+    def __init__(self, chunk_size, draw_fn, max_chunks=64):
+        self.chunk_size = chunk_size
+        self.draw_fn = draw_fn  # draw_fn(surface, area) paints the world-space rect `area`
+        self.max_chunks = max_chunks
+        self.surfaces = OrderedDict()  # (cx, cy) -> surface, most recently used last
+        self.key = None
+        self.rebuilds = 0
+
+    def invalidate(self):
+        self.surfaces.clear()
+
+    def draw(self, target, camera, key=None):
+        """Blit the chunks under the camera, baking any that are missing (all of them
+        if `key` changed). Returns True if anything was baked."""
+        if key != self.key:
+            self.surfaces.clear()
+            self.key = key
+        size = self.chunk_size
+        surfaces = self.surfaces
+        view = camera.rect
+        baked = False
+        for cy in range(view.top // size, (view.bottom - 1) // size + 1):
+            for cx in range(view.left // size, (view.right - 1) // size + 1):
+                surface = surfaces.get((cx, cy))
+                if surface is None:
+                    surface = pygame.Surface((size, size))
+                    if pygame.display.get_surface() is not None:
+                        surface = surface.convert()
+                    self.draw_fn(surface, pygame.Rect(cx * size, cy * size, size, size))
+                    surfaces[cx, cy] = surface
+                    self.rebuilds += 1
+                    baked = True
+                    if len(surfaces) > self.max_chunks:
+                        surfaces.popitem(last=False)
+                else:
+                    surfaces.move_to_end((cx, cy))
+                target.blit(surface, (cx * size - view.x, cy * size - view.y))
+        return baked
+
+# ============================================
+# DIRTY RECTANGLES
+# ============================================
+
+class DirtyRects:
+    """Collects the screen areas drawn this frame and pushes only those that changed
+    to the display.
+
+    add() takes what was drawn as well as where: a rect drawn with the same
+    content (e.g. the same Surface) as on the last frame shows the same pixels
+    and isn't pushed again. Rects that appear, and rects from the last frame
+    that weren't drawn again, are pushed, so whatever moved away gets cleared
+    too. A rect with no content given always counts as changed.
+    """
+    def __init__(self, enabled=True, max_rects=64):
+        self.enabled = enabled
+        self.max_rects = max_rects  # Past this many rects a full flip is cheaper
+        self.previous = {}  # (x, y, w, h, content) -> rect, as drawn last frame
+        self.current = {}
+        self.full = True
+        self.was_full = False
+        self.partial_frames = self.full_frames = 0
+
+    def add(self, rect, content=None):
+        if self.enabled and rect:
+            self.current[rect.x, rect.y, rect.w, rect.h, object() if content is None else content] = rect
+        return rect
+
+    def invalidate_all(self):
+        """Push the whole screen this frame (overlays, static layer rebuilds)"""
+        self.full = True
+
+    def present(self):
+        if not self.enabled:
+            pygame.display.flip()
+            return
+        previous, current = self.previous, self.current
+        rects = [rect for key, rect in current.items() if key not in previous]
+        rects += [rect for key, rect in previous.items() if key not in current]
+        # A full frame may have drawn things nobody tracked (e.g. a closed overlay),
+        # so the frame after it is pushed in full as well
+        if self.full or self.was_full or len(rects) > self.max_rects:
+            pygame.display.flip()
+            self.full_frames += 1
+        else:
+            if rects:
+                pygame.display.update(rects)
+            self.partial_frames += 1
+        self.was_full = self.full
+        self.previous = current
+        self.current = {}
+        self.full = False
+
+# ============================================
+# TEXT CACHE
+# ============================================
+
+TEXT_CACHE_SIZE = 256
+LAYOUT_CACHE_SIZE = 64
+
+@lru_cache(maxsize=TEXT_CACHE_SIZE)
+def render_text(font, text, color):
+    """font.render (no antialiasing) cached on (font, text, colour); don't draw on the result"""
+    return font.render(text, False, color)
+
+@lru_cache(maxsize=LAYOUT_CACHE_SIZE)
+def wrap_text(font, text, max_width):
+    """Word-wrap text into lines narrower than max_width, cached per string"""
+    words = text.split(' ')
+    lines, current_line = [], ""
+    for word in words:
+        test_line = current_line + word + " "
+        if font.size(test_line)[0] < max_width:
+            current_line = test_line
+        else:
+            lines.append(current_line)
+            current_line = word + " "
+    lines.append(current_line)
+    return tuple(lines)
+
+def text_cache_stats():
+    """Hit/miss/eviction counters for the text and layout caches, for sizing them"""
+    stats = {}
+    for name, cached_fn in (('text', render_text), ('layout', wrap_text)):
+        info = cached_fn.cache_info()
+        lookups = info.hits + info.misses
+        stats[name] = {
+            'hits': info.hits,
+            'misses': info.misses,
+            'evictions': info.misses - info.currsize,
+            'size': info.currsize,
+            'max_size': info.maxsize,
+            'hit_rate': info.hits / lookups if lookups else 0.0,
+        }
+    return stats
@@ -0,0 +1,200 @@
+"""Input recordings: write per-tick action bitmasks to a compact log and replay them headlessly.
+
+Usage: python replay.py RECORDING [--quiet] [--ai-workers N] [--map PATH]
+
+A log is a header (magic, format version, world seed, checkpoint interval,
+map width and height, map seed) followed by varint entries: (count << 1) then the action bitmask for `count`
+ticks with the same input, or 1 then an 8-byte World.state_hash() taken after
+the ticks so far.
+"""
+import argparse
+import os
+import struct
+import sys
+import time
+
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+from settings import SCREEN_WIDTH, SCREEN_HEIGHT
+from world import World
+
+MAGIC = b'CQIN'
+FORMAT_VERSION = 3
+HEADER = struct.Struct('<4sHQIIIQ')
+HEADER_V2 = struct.Struct('<4sHQIII')  # Version 2 logs have no map seed: always map seed 0
+HEADER_V1 = struct.Struct('<4sHQI')  # Version 1 logs have no map size: always the village map
+HASH = struct.Struct('<Q')
+MAX_SEED = 2**64 - 1  # The header stores the seed unsigned
+CHECKPOINT_INTERVAL = 600  # Ticks between state hashes (10s of play)
+FLUSH_BYTES = 64 * 1024
+
+class RecordingError(Exception):
+    pass
+
+# ============================================
+# VARINTS
+# ============================================
+
+def _append_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def _read_varint(data, pos):
+    value = shift = 0
+    while True:
+        if pos >= len(data):
+            raise RecordingError("truncated recording")
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+# ============================================
+# RECORDING
+# ============================================
+
+class InputRecorder:
+    """Run-length encodes one action bitmask per tick into a file, with periodic state hashes"""
+    def __init__(self, path, seed, checkpoint_interval=CHECKPOINT_INTERVAL, world_size=(SCREEN_WIDTH, SCREEN_HEIGHT),
+                 map_seed=0):
+        if not 0 <= seed <= MAX_SEED:
+            raise RecordingError(f"seed {seed} can't be recorded (must be from 0 to {MAX_SEED})")
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, FORMAT_VERSION, seed, checkpoint_interval, *world_size, map_seed))
+        self.checkpoint_interval = checkpoint_interval
+        self.buffer = bytearray()
+        self.actions = None
+        self.count = 0
+        self.ticks = 0
+
+    def _end_run(self):
+        if self.count:
+            _append_varint(self.buffer, self.count << 1)
+            _append_varint(self.buffer, self.actions)
+        self.actions, self.count = None, 0
+
+    def record(self, actions, world):
+        """Log the actions of a tick that just ran on `world`"""
+        if actions != self.actions:
+            self._end_run()
+            self.actions = actions
+        self.count += 1
+        self.ticks += 1
+        if self.ticks % self.checkpoint_interval == 0:
+            self._end_run()
+            _append_varint(self.buffer, 1)
+            self.buffer += HASH.pack(world.state_hash())
+            self.flush()  # A crash still leaves everything up to the last checkpoint
+        elif len(self.buffer) >= FLUSH_BYTES:
+            self.flush()
+
+    def flush(self):
+        self.file.write(self.buffer)
+        self.buffer.clear()
+        self.file.flush()
+
+    def close(self):
+        self._end_run()
+        self.flush()
+        self.file.close()
+
+# ============================================
+# REPLAY
+# ============================================
+
+def read_recording(path):
+    """Return (seed, checkpoint_interval, world_size, map_seed, entries), entries being
+    ('run', count, actions) or ('hash', value)"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < HEADER_V1.size:
+        raise RecordingError("not a recording")
+    magic, version, seed, interval = HEADER_V1.unpack_from(data)
+    if magic != MAGIC:
+        raise RecordingError("not a recording")
+    map_seed = 0
+    if version == 1:
+        world_size, pos = (SCREEN_WIDTH, SCREEN_HEIGHT), HEADER_V1.size
+    elif version == 2:
+        if len(data) < HEADER_V2.size:
+            raise RecordingError("truncated recording")
+        world_size, pos = HEADER_V2.unpack_from(data)[4:], HEADER_V2.size
+    elif version == FORMAT_VERSION:
+        if len(data) < HEADER.size:
+            raise RecordingError("truncated recording")
+        *world_size, map_seed = HEADER.unpack_from(data)[4:]
+        pos = HEADER.size
+    else:
+        raise RecordingError(f"unsupported recording version {version}")
+
+    entries = []
+    while pos < len(data):
+        tag, pos = _read_varint(data, pos)
+        if tag & 1:
+            if pos + HASH.size > len(data):
+                raise RecordingError("truncated recording")
+            entries.append(('hash', HASH.unpack_from(data, pos)[0]))
+            pos += HASH.size
+        else:
+            actions, pos = _read_varint(data, pos)
+            entries.append(('run', tag >> 1, actions))
+    return seed, interval, world_size, map_seed, entries
+
+def replay(path, world=None, ai_workers=0, map_path=None):
+    """Re-run a recording as fast as possible. Returns (world, ticks, checkpoints checked,
+    first tick whose state hash differs or None). A big world's map comes from `map_path`,
+    or the default one for the recorded map seed; a map made with another seed is refused."""
+    seed, _, world_size, map_seed, entries = read_recording(path)
+    if world is None:
+        world = World(seed, width=world_size[0], height=world_size[1], map_seed=map_seed,
+                      map_path=map_path, ai_workers=ai_workers)
+    elif world.wilderness and world.map_seed != map_seed:
+        raise RecordingError(f"recorded on map seed {map_seed}, not this world's {world.map_seed}")
+    else:
+        world.reset(seed)
+
+    ticks = checkpoints = 0
+    mismatch = None
+    tick = world.tick
+    for entry in entries:
+        if entry[0] == 'run':
+            _, count, actions = entry
+            for _ in range(count):
+                tick(actions)
+            world.sounds.clear()
+            ticks += count
+        else:
+            checkpoints += 1
+            if mismatch is None and world.state_hash() != entry[1]:
+                mismatch = ticks
+    return world, ticks, checkpoints, mismatch
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('recording')
+    parser.add_argument('--quiet', action='store_true')
+    parser.add_argument('--ai-workers', type=int, default=0, help="as given to main.py when recording")
+    parser.add_argument('--map', help="map file the game was played on (default: the one under maps/ for its map seed)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    world, ticks, checkpoints, mismatch = replay(args.recording, ai_workers=args.ai_workers, map_path=args.map)
+    elapsed = time.perf_counter() - start
+    world.close()
+    if not args.quiet:
+        print(f"replayed {ticks} ticks ({ticks / 60:.0f}s of play) in {elapsed:.2f}s, "
+              f"{ticks / elapsed if elapsed else 0:.0f} ticks/sec")
+        print(f"final: {world.coins_collected} coins, {world.keys_collected} keys, "
+              f"won={world.game_won}, caught={world.game_over}")
+    if mismatch is not None:
+        print(f"DESYNC: state differs from the recording at the checkpoint after tick {mismatch}")
+        sys.exit(1)
+    if not args.quiet:
+        print(f"{checkpoints} checkpoints matched")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""Parallel headless episodes: run seeded games across a process pool and aggregate the results.
+
+Usage: python runner.py [--episodes N] [--workers N] [--chunk N] [--max-frames N]
+                        [--detection-range R] [--guard-speed S] [--scaling]
+"""
+import argparse
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+from world import World, MOVE_LEFT, MOVE_RIGHT, MOVE_UP, MOVE_DOWN, PRESS_CONFIRM
+
+FPS = 60
+
+# ============================================
+# EPISODES
+# ============================================
+
+def apply_config(world, config):
+    """Tuning overrides for the chasing guards, re-applied after every reset"""
+    for npc in world.npcs:
+        if getattr(npc, 'is_enemy', False):
+            if config.get('detection_range') is not None:
+                npc.detection_range = config['detection_range']
+            if config.get('guard_speed') is not None:
+                npc.speed = config['guard_speed']
+
+def coin_seeker(world, rng, state):
+    """Scripted player: walk to the nearest coin, dismiss dialogue, wiggle free when stuck"""
+    if world.showing_dialogue:
+        return PRESS_CONFIRM
+    position = (world.player_x, world.player_y)
+    if state['wiggle'] > 0:
+        state['wiggle'] -= 1
+        return state['wiggle_actions']
+    if position == state['last_position']:
+        state['stuck'] += 1
+        if state['stuck'] > 8:
+            state['stuck'] = 0
+            state['wiggle'] = rng.randint(10, 30)
+            state['wiggle_actions'] = rng.choice((MOVE_LEFT, MOVE_RIGHT, MOVE_UP, MOVE_DOWN))
+    else:
+        state['stuck'] = 0
+    state['last_position'] = position
+
+    coin = world.find_nearest_coin()
+    if coin is None:
+        return 0
+    actions = 0
+    dx, dy = coin[0] - world.player_x, coin[1] - world.player_y
+    if dx < -world.player_speed: actions |= MOVE_LEFT
+    elif dx > world.player_speed: actions |= MOVE_RIGHT
+    if dy < -world.player_speed: actions |= MOVE_UP
+    elif dy > world.player_speed: actions |= MOVE_DOWN
+    return actions
+
+def run_episode(world, seed, config, max_frames):
+    """Play one seeded game on an existing World and return its result"""
+    world.reset(seed)
+    apply_config(world, config)
+    policy_rng = random.Random(seed)
+    state = {'last_position': None, 'stuck': 0, 'wiggle': 0, 'wiggle_actions': 0}
+
+    frames = 0
+    while frames < max_frames and not world.game_over and not world.game_won:
+        world.step(coin_seeker(world, policy_rng, state))
+        frames += 1
+
+    return {
+        'seed': seed,
+        'coins': world.coins_collected,
+        'won': world.game_won,
+        'caught': world.game_over,
+        'time_to_catch': frames / FPS if world.game_over else None,
+        'frames': frames,
+    }
+
+# ============================================
+# PROCESS POOL
+# ============================================
+
+_worker = {}  # Per-process World and settings, built once by _init_worker
+
+def _init_worker(config, max_frames):
+    _worker['world'] = World()
+    _worker['config'] = config
+    _worker['max_frames'] = max_frames
+
+def _run_chunk(seeds):
+    world, config, max_frames = _worker['world'], _worker['config'], _worker['max_frames']
+    return [run_episode(world, seed, config, max_frames) for seed in seeds]
+
+def run_episodes(seeds, workers=None, chunk_size=16, config=None, max_frames=FPS * 120):
+    """Yield episode results as worker chunks finish (not in seed order)"""
+    seeds = list(seeds)
+    chunks = [seeds[i:i + chunk_size] for i in range(0, len(seeds), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(config or {}, max_frames)) as pool:
+        for future in as_completed([pool.submit(_run_chunk, chunk) for chunk in chunks]):
+            yield from future.result()
+
+def summarize(results):
+    """Aggregate stats over a list of episode results"""
+    count = len(results)
+    if count == 0:
+        return {'episodes': 0}
+    catch_times = [r['time_to_catch'] for r in results if r['caught']]
+    return {
+        'episodes': count,
+        'win_rate': sum(r['won'] for r in results) / count,
+        'catch_rate': len(catch_times) / count,
+        'mean_coins': sum(r['coins'] for r in results) / count,
+        'mean_time_to_catch': sum(catch_times) / len(catch_times) if catch_times else None,
+        'frames': sum(r['frames'] for r in results),
+    }
+
+def timed_run(seeds, workers, chunk_size, config, max_frames, progress=False):
+    start = time.perf_counter()
+    results = []
+    for result in run_episodes(seeds, workers, chunk_size, config, max_frames):
+        results.append(result)
+        if progress and len(results) % 100 == 0:
+            print(f"  {len(results)}/{len(seeds)} episodes")
+    return results, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--episodes', type=int, default=400)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk', type=int, default=16, help="episodes per task sent to a worker")
+    parser.add_argument('--max-frames', type=int, default=FPS * 120, help="episode length cap")
+    parser.add_argument('--first-seed', type=int, default=0)
+    parser.add_argument('--detection-range', type=float, default=None)
+    parser.add_argument('--guard-speed', type=float, default=None)
+    parser.add_argument('--scaling', action='store_true', help="time 1, 2, 4... workers up to --workers")
+    args = parser.parse_args()
+
+    seeds = range(args.first_seed, args.first_seed + args.episodes)
+    config = {'detection_range': args.detection_range, 'guard_speed': args.guard_speed}
+
+    if args.scaling:
+        worker_counts, n = [], 1
+        while n < args.workers:
+            worker_counts.append(n)
+            n *= 2
+        worker_counts.append(args.workers)
+        base_rate = None
+        for workers in worker_counts:
+            results, elapsed = timed_run(seeds, workers, args.chunk, config, args.max_frames)
+            rate = sum(r['frames'] for r in results) / elapsed
+            base_rate = base_rate or rate
+            print(f"{workers:>3} workers: {len(results) / elapsed:8.1f} episodes/sec, "
+                  f"{rate:10.0f} frames/sec, scaling {rate / base_rate:5.2f}x")
+        return
+
+    results, elapsed = timed_run(seeds, args.workers, args.chunk, config, args.max_frames, progress=True)
+    stats = summarize(results)
+    print(f"{stats['episodes']} episodes in {elapsed:.1f}s on {args.workers} workers "
+          f"({stats['frames'] / elapsed:.0f} frames/sec)")
+    print(f"win rate {stats['win_rate']:.1%}, caught {stats['catch_rate']:.1%}, "
+          f"mean coins {stats['mean_coins']:.1f}")
+    if stats['mean_time_to_catch'] is not None:
+        print(f"mean time to catch {stats['mean_time_to_catch']:.1f}s")
+
+if __name__ == '__main__':
+    main()
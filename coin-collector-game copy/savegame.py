@@ -0,0 +1,213 @@
+import os
+import struct
+import threading
+import zlib
+
+# ============================================
+# FILE FORMAT
+# ============================================
+#
+# header  <4sHI  magic, format version, payload length
+# payload        one tagged value: the dict returned by World.snapshot()
+# trailer <I     crc32 of the payload
+#
+# Values are a type byte followed by the data: ints as zigzag varints,
+# floats as little-endian doubles, strings as varint length + UTF-8,
+# tuples and dicts as varint count + items. Long tuples of 32-bit unsigned
+# ints (the RNG states) are packed as a count plus raw uint32s.
+
+MAGIC = b'CQSV'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sHI')
+TRAILER = struct.Struct('<I')
+DOUBLE = struct.Struct('<d')
+PACKED_MIN = 64  # Shortest uint32 tuple worth packing
+
+SAVE_PATH = 'autosave.cqs'
+
+class SaveError(Exception):
+    pass
+
+def _append_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def _all_uint32(values):
+    for value in values:
+        if type(value) is not int or not 0 <= value <= 0xFFFFFFFF:
+            return False
+    return True
+
+def _encode(value, out):
+    # bool before int: True is an int too
+    if value is None:
+        out += b'N'
+    elif value is True:
+        out += b'T'
+    elif value is False:
+        out += b'F'
+    elif isinstance(value, int):
+        out += b'i'
+        _append_varint(out, value << 1 if value >= 0 else ((-value) << 1) - 1)
+    elif isinstance(value, float):
+        out += b'd'
+        out += DOUBLE.pack(value)
+    elif isinstance(value, str):
+        data = value.encode('utf-8')
+        out += b's'
+        _append_varint(out, len(data))
+        out += data
+    elif isinstance(value, (tuple, list)) and len(value) >= PACKED_MIN and _all_uint32(value):
+        out += b'u'
+        _append_varint(out, len(value))
+        out += struct.pack(f'<{len(value)}I', *value)
+    elif isinstance(value, (tuple, list)):
+        out += b't'
+        _append_varint(out, len(value))
+        for item in value:
+            _encode(item, out)
+    elif isinstance(value, dict):
+        out += b'm'
+        _append_varint(out, len(value))
+        for key, item in value.items():
+            _encode(key, out)
+            _encode(item, out)
+    else:
+        raise SaveError(f"can't save a {type(value).__name__}")
+
+class _Reader:
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def varint(self):
+        data = self.data
+        value = shift = 0
+        while True:
+            byte = data[self.pos]
+            self.pos += 1
+            value |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return value
+            shift += 7
+
+    def value(self):
+        tag = self.data[self.pos]
+        self.pos += 1
+        if tag == ord('N'):
+            return None
+        if tag == ord('T'):
+            return True
+        if tag == ord('F'):
+            return False
+        if tag == ord('i'):
+            value = self.varint()
+            return -((value + 1) >> 1) if value & 1 else value >> 1
+        if tag == ord('d'):
+            value = DOUBLE.unpack_from(self.data, self.pos)[0]
+            self.pos += DOUBLE.size
+            return value
+        if tag == ord('s'):
+            length = self.varint()
+            value = self.data[self.pos:self.pos + length].decode('utf-8')
+            self.pos += length
+            return value
+        if tag == ord('t'):
+            return tuple(self.value() for _ in range(self.varint()))
+        if tag == ord('u'):
+            count = self.varint()
+            value = struct.unpack_from(f'<{count}I', self.data, self.pos)
+            self.pos += 4 * count
+            return value
+        if tag == ord('m'):
+            items = {}
+            for _ in range(self.varint()):
+                key = self.value()
+                items[key] = self.value()
+            return items
+        raise SaveError(f"bad value tag {tag!r}")
+
+def encode_snapshot(snapshot):
+    payload = bytearray()
+    _encode(snapshot, payload)
+    return HEADER.pack(MAGIC, FORMAT_VERSION, len(payload)) + payload + TRAILER.pack(zlib.crc32(payload))
+
+def decode_snapshot(data):
+    if len(data) < HEADER.size + TRAILER.size:
+        raise SaveError("not a save file")
+    magic, version, length = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise SaveError("not a save file")
+    if version != FORMAT_VERSION:
+        raise SaveError(f"unsupported save version {version}")
+    payload = data[HEADER.size:HEADER.size + length]
+    if len(payload) != length or len(data) < HEADER.size + length + TRAILER.size:
+        raise SaveError("truncated save file")
+    if TRAILER.unpack_from(data, HEADER.size + length)[0] != zlib.crc32(payload):
+        raise SaveError("corrupt save file")
+    try:
+        return _Reader(payload).value()
+    except (IndexError, UnicodeDecodeError, struct.error) as e:
+        raise SaveError("corrupt save file") from e
+
+# ============================================
+# READING AND WRITING
+# ============================================
+
+def write_snapshot(path, snapshot):
+    """Encode and durably write a snapshot (write to a temp file, fsync, rename over the old save)"""
+    data = encode_snapshot(snapshot)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+def load_snapshot(path):
+    with open(path, 'rb') as f:
+        return decode_snapshot(f.read())
+
+class SaveWriter:
+    """Writes snapshots on a background thread so saving never stalls a frame.
+    Only the newest snapshot handed in since the last write is saved."""
+    def __init__(self, path=SAVE_PATH):
+        self.path = path
+        self.pending = None
+        self.closing = False
+        self.saves = 0
+        self.last_error = None
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="save-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, snapshot):
+        with self.lock:
+            self.pending = snapshot
+        self.wake.set()
+
+    def _run(self):
+        while True:
+            self.wake.wait()
+            self.wake.clear()
+            with self.lock:
+                snapshot, self.pending = self.pending, None
+                closing = self.closing
+            if snapshot is not None:
+                try:
+                    write_snapshot(self.path, snapshot)
+                    self.saves += 1
+                except (OSError, SaveError) as e:
+                    self.last_error = e
+            if closing:
+                return
+
+    def close(self):
+        """Finish writing anything pending and stop the thread"""
+        with self.lock:
+            self.closing = True
+        self.wake.set()
+        self.thread.join()
@@ -0,0 +1,4 @@
+SCREEN_WIDTH = 800
+SCREEN_HEIGHT = 600
+TILE_SIZE = 32
+CHUNK_TILES = 16  # The world is stored and culled in squares of CHUNK_TILES x CHUNK_TILES tiles
@@ -0,0 +1,67 @@
+from settings import TILE_SIZE
+
+# ============================================
+# SPATIAL HASH (BROAD-PHASE COLLISION)
+# ============================================
+
+class SpatialHash:
+    """Uniform grid of buckets so rect queries only look at nearby objects"""
+    def __init__(self, cell_size=TILE_SIZE * 2):
+        self.cell_size = cell_size
+        self.buckets = {}  # (cx, cy) -> list of objects overlapping that cell
+        self.cells_of = {}  # id(obj) -> cells the object is currently filed under
+
+    def __len__(self):
+        return len(self.cells_of)
+
+    def __contains__(self, obj):
+        return id(obj) in self.cells_of
+
+    def _cells(self, rect):
+        """Cells overlapped by a pygame.Rect"""
+        size = self.cell_size
+        cx0, cy0 = rect.left // size, rect.top // size
+        cx1, cy1 = (rect.right - 1) // size, (rect.bottom - 1) // size
+        return tuple((cx, cy) for cx in range(cx0, cx1 + 1) for cy in range(cy0, cy1 + 1))
+
+    def insert(self, obj):
+        if id(obj) in self.cells_of:
+            return
+        cells = self._cells(obj.rect)
+        self.cells_of[id(obj)] = cells
+        for cell in cells:
+            self.buckets.setdefault(cell, []).append(obj)
+
+    def remove(self, obj):
+        cells = self.cells_of.pop(id(obj), None)
+        if cells is None:
+            return
+        for cell in cells:
+            bucket = self.buckets[cell]
+            bucket.remove(obj)
+            if not bucket:
+                del self.buckets[cell]
+
+    def move(self, obj):
+        """Re-file an object after its rect moved"""
+        old_cells = self.cells_of.get(id(obj))
+        if old_cells is not None and old_cells == self._cells(obj.rect):
+            return
+        self.remove(obj)
+        self.insert(obj)
+
+    def query(self, rect):
+        """Objects whose cells overlap rect (candidates only, not an exact overlap test)"""
+        buckets = self.buckets
+        size = self.cell_size
+        cx0, cy0 = rect.left // size, rect.top // size
+        cx1, cy1 = (rect.right - 1) // size, (rect.bottom - 1) // size
+        if cx0 == cx1 and cy0 == cy1:
+            return buckets.get((cx0, cy0), ())
+        # Objects spanning several cells are in each of their buckets; keep the first of each
+        found = {}
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                for obj in buckets.get((cx, cy), ()):
+                    found.setdefault(id(obj), obj)
+        return found.values()
@@ -0,0 +1,322 @@
+"""Procedural sprites, baked once into an atlas file that later launches load instead.
+
+Usage: python sprites.py [--atlas PATH]
+
+Bakes the atlas afresh, then loads it back, and reports both times (a cold
+and a warm startup). An atlas is a header (magic, format version, key,
+atlas width and height, sprite count), one entry per sprite (name, x, y,
+width, height, alpha flag) and the atlas pixels as raw RGBA rows. The key
+is a hash of COLORS, TILE_SIZE and the source of the sprite generators (this
+file), so changing any of them rebakes the atlas on the next launch.
+"""
+import argparse
+import hashlib
+import os
+import random
+import struct
+import time
+
+import pygame
+
+from settings import TILE_SIZE
+from assets import GAME_DIR
+
+COLORS = {
+    'grass_light': (124, 188, 68), 'grass_dark': (88, 160, 64),
+    'dirt': (184, 136, 88), 'stone': (136, 136, 136),
+    'tree_trunk': (104, 72, 48), 'tree_leaves': (48, 136, 48), 'tree_dark': (32, 96, 32),
+    'sky_day': (92, 148, 252), 'sky_night': (24, 24, 72), 'sky_sunset': (200, 100, 80),
+    'roof_red': (216, 40, 0), 'roof_dark': (168, 32, 0),
+    'wall': (248, 184, 120), 'wall_dark': (216, 152, 88),
+    'door': (88, 56, 32), 'window': (88, 168, 248),
+    'player_skin': (248, 200, 168), 'player_shirt': (88, 88, 248), 'player_pants': (56, 56, 136),
+    'npc_shirt': (248, 88, 88), 'coin': (248, 216, 0), 'coin_dark': (200, 168, 0),
+    'ui_bg': (40, 40, 88), 'ui_border': (248, 248, 248), 'text': (248, 248, 248),
+    'shadow': (0, 0, 0, 100), 'dog_brown': (139, 90, 43), 'key': (255, 215, 0),
+    'chest': (139, 90, 43), 'block': (120, 120, 120), 'guard_shirt': (100, 100, 255)
+}
+
+# ============================================
+# SPRITE CREATION
+# ============================================
+
+def create_pixel_grass():
+    surf = pygame.Surface((TILE_SIZE, TILE_SIZE))
+    surf.fill(COLORS['grass_light'])
+    for y in range(TILE_SIZE):
+        for x in range(TILE_SIZE):
+            if (x + y) % 4 == 0:
+                surf.set_at((x, y), COLORS['grass_dark'])
+    for _ in range(8):
+        x, y = random.randint(0, TILE_SIZE-1), random.randint(0, TILE_SIZE-1)
+        surf.set_at((x, y), COLORS['grass_dark'])
+    return surf
+
+def create_pixel_tree():
+    surf = pygame.Surface((TILE_SIZE, TILE_SIZE), pygame.SRCALPHA)
+    shadow = pygame.Surface((20, 6), pygame.SRCALPHA)
+    shadow.fill(COLORS['shadow'])
+    surf.blit(shadow, (6, 26))
+    pygame.draw.rect(surf, COLORS['tree_trunk'], (13, 18, 6, 10))
+    pygame.draw.line(surf, (80, 56, 32), (13, 18), (13, 27), 1)
+    pygame.draw.circle(surf, COLORS['tree_dark'], (16, 12), 11)
+    pygame.draw.circle(surf, COLORS['tree_leaves'], (16, 10), 10)
+    pygame.draw.circle(surf, (64, 168, 64), (14, 8), 5)
+    for dx, dy in [(-3, 10), (4, 9), (0, 12), (-2, 7), (3, 6)]:
+        surf.set_at((16 + dx, 10 + dy), COLORS['tree_dark'])
+    return surf
+
+def create_pixel_house():
+    surf = pygame.Surface((TILE_SIZE*2, TILE_SIZE*2), pygame.SRCALPHA)
+    shadow = pygame.Surface((60, 8), pygame.SRCALPHA)
+    shadow.fill(COLORS['shadow'])
+    surf.blit(shadow, (2, 56))
+    pygame.draw.rect(surf, COLORS['wall'], (6, 22, 52, 38))
+    pygame.draw.rect(surf, COLORS['wall_dark'], (6, 40, 52, 20))
+    pygame.draw.line(surf, (255, 208, 152), (6, 22), (57, 22), 2)
+    roof_points = [(32, 6), (4, 22), (60, 22)]
+    pygame.draw.polygon(surf, COLORS['roof_red'], roof_points)
+    roof_dark_points = [(32, 6), (4, 22), (32, 22)]
+    pygame.draw.polygon(surf, COLORS['roof_dark'], roof_dark_points)
+    pygame.draw.lines(surf, (152, 24, 0), False, [(4, 22), (32, 6), (60, 22)], 2)
+    pygame.draw.rect(surf, COLORS['door'], (26, 42, 12, 18))
+    pygame.draw.rect(surf, (64, 40, 16), (26, 42, 12, 18), 1)
+    surf.set_at((35, 51), COLORS['coin'])
+    for wx, wy in [(14, 32), (40, 32)]:
+        pygame.draw.rect(surf, (72, 48, 24), (wx-1, wy-1, 10, 10))
+        pygame.draw.rect(surf, COLORS['window'], (wx, wy, 8, 8))
+        pygame.draw.line(surf, (64, 128, 200), (wx+4, wy), (wx+4, wy+8), 1)
+        pygame.draw.line(surf, (64, 128, 200), (wx, wy+4), (wx+8, wy+4), 1)
+        pygame.draw.line(surf, (152, 216, 255), (wx+1, wy+1), (wx+3, wy+1), 1)
+    return surf
+
+def create_pixel_player():
+    surf = pygame.Surface((TILE_SIZE, TILE_SIZE), pygame.SRCALPHA)
+    shadow = pygame.Surface((16, 4), pygame.SRCALPHA)
+    shadow.fill(COLORS['shadow'])
+    surf.blit(shadow, (8, 28))
+    pygame.draw.rect(surf, COLORS['player_pants'], (10, 20, 5, 8))
+    pygame.draw.rect(surf, COLORS['player_pants'], (17, 20, 5, 8))
+    pygame.draw.rect(surf, COLORS['player_shirt'], (10, 14, 12, 8))
+    pygame.draw.line(surf, (56, 56, 200), (10, 14), (21, 14), 1)
+    pygame.draw.rect(surf, COLORS['player_skin'], (8, 16, 3, 6))
+    pygame.draw.rect(surf, COLORS['player_skin'], (21, 16, 3, 6))
+    pygame.draw.rect(surf, COLORS['player_skin'], (12, 8, 8, 8))
+    pygame.draw.line(surf, (255, 224, 192), (12, 8), (19, 8), 1)
+    pygame.draw.rect(surf, (88, 56, 24), (12, 7, 8, 3))
+    surf.set_at((14, 11), (0, 0, 0))
+    surf.set_at((17, 11), (0, 0, 0))
+    return surf
+
+def create_pixel_npc():
+    surf = pygame.Surface((TILE_SIZE, TILE_SIZE), pygame.SRCALPHA)
+    shadow = pygame.Surface((16, 4), pygame.SRCALPHA)
+    shadow.fill(COLORS['shadow'])
+    surf.blit(shadow, (8, 28))
+    pygame.draw.rect(surf, (72, 72, 72), (10, 20, 5, 8))
+    pygame.draw.rect(surf, (72, 72, 72), (17, 20, 5, 8))
+    pygame.draw.rect(surf, COLORS['npc_shirt'], (10, 14, 12, 8))
+    pygame.draw.line(surf, (255, 128, 128), (10, 14), (21, 14), 1)
+    pygame.draw.rect(surf, COLORS['player_skin'], (8, 16, 3, 6))
+    pygame.draw.rect(surf, COLORS['player_skin'], (21, 16, 3, 6))
+    pygame.draw.rect(surf, COLORS['player_skin'], (12, 8, 8, 8))
+    pygame.draw.line(surf, (255, 224, 192), (12, 8), (19, 8), 1)
+    pygame.draw.rect(surf, (136, 88, 40), (11, 7, 10, 3))
+    surf.set_at((14, 11), (0, 0, 0))
+    surf.set_at((17, 11), (0, 0, 0))
+    pygame.draw.line(surf, (200, 120, 120), (14, 13), (17, 13), 1)
+    return surf
+
+def create_guard_sprite():
+    """Create a guard NPC sprite (different color)"""
+    surf = pygame.Surface((TILE_SIZE, TILE_SIZE), pygame.SRCALPHA)
+    shadow = pygame.Surface((16, 4), pygame.SRCALPHA)
+    shadow.fill(COLORS['shadow'])
+    surf.blit(shadow, (8, 28))
+    pygame.draw.rect(surf, (40, 40, 40), (10, 20, 5, 8))
+    pygame.draw.rect(surf, (40, 40, 40), (17, 20, 5, 8))
+    pygame.draw.rect(surf, COLORS['guard_shirt'], (10, 14, 12, 8))
+    pygame.draw.line(surf, (150, 150, 255), (10, 14), (21, 14), 1)
+    pygame.draw.rect(surf, COLORS['player_skin'], (8, 16, 3, 6))
+    pygame.draw.rect(surf, COLORS['player_skin'], (21, 16, 3, 6))
+    pygame.draw.rect(surf, COLORS['player_skin'], (12, 8, 8, 8))
+    pygame.draw.line(surf, (255, 224, 192), (12, 8), (19, 8), 1)
+    pygame.draw.rect(surf, (60, 60, 60), (11, 7, 10, 3))
+    surf.set_at((14, 11), (0, 0, 0))
+    surf.set_at((17, 11), (0, 0, 0))
+    return surf
+
+def create_pixel_coin():
+    surf = pygame.Surface((16, 16), pygame.SRCALPHA)
+    shadow = pygame.Surface((12, 3), pygame.SRCALPHA)
+    shadow.fill(COLORS['shadow'])
+    surf.blit(shadow, (2, 13))
+    pygame.draw.circle(surf, COLORS['coin_dark'], (8, 7), 6)
+    pygame.draw.circle(surf, COLORS['coin'], (8, 7), 5)
+    pygame.draw.arc(surf, (255, 248, 128), (4, 3, 8, 8), 0.5, 2.5, 2)
+    pygame.draw.line(surf, COLORS['coin_dark'], (8, 4), (8, 10), 1)
+    pygame.draw.line(surf, COLORS['coin_dark'], (6, 5), (10, 5), 1)
+    pygame.draw.line(surf, COLORS['coin_dark'], (6, 9), (10, 9), 1)
+    return surf
+
+def create_dog():
+    surf = pygame.Surface((TILE_SIZE, TILE_SIZE), pygame.SRCALPHA)
+    pygame.draw.ellipse(surf, COLORS['dog_brown'], (8, 16, 16, 12))
+    pygame.draw.circle(surf, COLORS['dog_brown'], (12, 12), 5)
+    pygame.draw.rect(surf, COLORS['dog_brown'], (6, 22, 3, 6))
+    pygame.draw.rect(surf, COLORS['dog_brown'], (15, 22, 3, 6))
+    surf.set_at((10, 11), (0, 0, 0))
+    surf.set_at((14, 11), (0, 0, 0))
+    pygame.draw.circle(surf, (80, 50, 30), (12, 13), 1)
+    return surf
+
+def create_key():
+    surf = pygame.Surface((16, 16), pygame.SRCALPHA)
+    pygame.draw.circle(surf, COLORS['key'], (6, 6), 4)
+    pygame.draw.circle(surf, (0, 0, 0), (6, 6), 2)
+    pygame.draw.rect(surf, COLORS['key'], (6, 6, 6, 2))
+    return surf
+
+def create_chest():
+    surf = pygame.Surface((TILE_SIZE, TILE_SIZE), pygame.SRCALPHA)
+    pygame.draw.rect(surf, COLORS['chest'], (6, 16, 20, 12))
+    pygame.draw.rect(surf, (100, 65, 30), (6, 10, 20, 8))
+    pygame.draw.rect(surf, COLORS['key'], (14, 18, 4, 4))
+    return surf
+
+def create_pushable_block():
+    surf = pygame.Surface((TILE_SIZE, TILE_SIZE), pygame.SRCALPHA)
+    pygame.draw.rect(surf, COLORS['block'], (2, 2, 28, 28))
+    pygame.draw.rect(surf, (90, 90, 90), (2, 2, 28, 28), 2)
+    for i in range(4, 28, 6):
+        pygame.draw.line(surf, (150, 150, 150), (i, 2), (i, 30), 1)
+        pygame.draw.line(surf, (150, 150, 150), (2, i), (30, i), 1)
+    return surf
+
+def create_shop_sign():
+    surf = pygame.Surface((TILE_SIZE, TILE_SIZE), pygame.SRCALPHA)
+    pygame.draw.rect(surf, COLORS['tree_trunk'], (14, 12, 4, 20))
+    pygame.draw.rect(surf, (200, 180, 140), (4, 8, 24, 12))
+    pygame.draw.rect(surf, (120, 100, 60), (4, 8, 24, 12), 2)
+    return surf
+
+# Name -> generator, in atlas order
+GENERATORS = {
+    'grass': create_pixel_grass, 'tree': create_pixel_tree, 'house': create_pixel_house,
+    'player': create_pixel_player, 'coin': create_pixel_coin, 'npc': create_pixel_npc,
+    'guard': create_guard_sprite, 'dog': create_dog, 'key': create_key, 'chest': create_chest,
+    'block': create_pushable_block, 'shop_sign': create_shop_sign,
+}
+
+# ============================================
+# ATLAS
+# ============================================
+
+MAGIC = b'CQSA'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sH16sHHH')
+ENTRY = struct.Struct('<16sHHHH?')
+
+ATLAS_PATH = os.path.join(GAME_DIR, 'sprites.cqa')
+
+def atlas_key():
+    """Digest of everything the sprites are drawn from. The generators' source is
+    read as this whole file: inspect.getsource() on each costs more than drawing them."""
+    digest = hashlib.blake2b(repr((sorted(COLORS.items()), TILE_SIZE)).encode(), digest_size=16)
+    with open(__file__, 'rb') as f:
+        digest.update(f.read())
+    return digest.digest()
+
+def draw_sprites():
+    """name -> Surface, every sprite freshly drawn"""
+    return {name: create() for name, create in GENERATORS.items()}
+
+def write_atlas(path, sprites, key=None):
+    """Write sprites side by side into an atlas file"""
+    width = sum(surf.get_width() for surf in sprites.values())
+    height = max(surf.get_height() for surf in sprites.values())
+    pixels = bytearray(width * height * 4)
+    entries = []
+    x = 0
+    for name, surf in sprites.items():
+        w, h = surf.get_size()
+        data = pygame.image.tobytes(surf, 'RGBA')
+        for row in range(h):
+            start = (row * width + x) * 4
+            pixels[start:start + w * 4] = data[row * w * 4:(row + 1) * w * 4]
+        entries.append(ENTRY.pack(name.encode(), x, 0, w, h, bool(surf.get_flags() & pygame.SRCALPHA)))
+        x += w
+
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, key or atlas_key(), width, height, len(entries)))
+        f.write(b''.join(entries))
+        f.write(pixels)
+    os.replace(temp_path, path)
+
+def bake_atlas(path=ATLAS_PATH, key=None):
+    """Draw every sprite and write them into an atlas file; returns name -> Surface"""
+    sprites = draw_sprites()
+    write_atlas(path, sprites, key)
+    return sprites
+
+def read_atlas(path=ATLAS_PATH, key=None):
+    """name -> Surface from an atlas file, or None if it's missing, unreadable or baked from other sources"""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    if len(data) < HEADER.size:
+        return None
+    magic, version, atlas_key_, width, height, count = HEADER.unpack_from(data)
+    if magic != MAGIC or version != FORMAT_VERSION or atlas_key_ != (key or atlas_key()):
+        return None
+    pixels_at = HEADER.size + count * ENTRY.size
+    if len(data) != pixels_at + width * height * 4:
+        return None
+    atlas = pygame.image.frombuffer(memoryview(data)[pixels_at:], (width, height), 'RGBA')
+    sprites = {}
+    for i in range(count):
+        name, x, y, w, h, alpha = ENTRY.unpack_from(data, HEADER.size + i * ENTRY.size)
+        sprite = atlas.subsurface((x, y, w, h))
+        if pygame.display.get_surface() is None:
+            sprite = sprite.copy()  # Can't convert without a display
+        else:
+            sprite = sprite.convert_alpha() if alpha else sprite.convert()
+        sprites[name.rstrip(b'\0').decode()] = sprite
+    return sprites
+
+def load_sprites(path=ATLAS_PATH):
+    """(name -> Surface, baked): the sprites from the atlas, baking it first if it's missing or stale.
+    The atlas is only a cache: if it can't be written, the freshly drawn sprites are used as they are."""
+    key = atlas_key()
+    sprites = read_atlas(path, key)
+    if sprites is not None:
+        return sprites, False
+    sprites = draw_sprites()
+    try:
+        write_atlas(path, sprites, key)
+    except OSError as e:
+        print(f"Could not write sprite atlas {path}: {e}")
+    if pygame.display.get_surface() is not None:
+        sprites = {name: sprite.convert_alpha() if sprite.get_flags() & pygame.SRCALPHA else sprite.convert()
+                   for name, sprite in sprites.items()}
+    return sprites, True
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--atlas', default=ATLAS_PATH)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    bake_atlas(args.atlas)
+    cold = time.perf_counter() - start
+    start = time.perf_counter()
+    sprites = read_atlas(args.atlas)
+    warm = time.perf_counter() - start
+    print(f"wrote {args.atlas}: {len(sprites)} sprites, {os.path.getsize(args.atlas) / 1024:.1f} KB")
+    print(f"cold (draw and bake) {cold * 1000:.2f} ms, warm (load) {warm * 1000:.2f} ms")
+
+if __name__ == '__main__':
+    main()
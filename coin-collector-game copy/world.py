@@ -0,0 +1,1074 @@
+import hashlib
+import math
+import random
+
+import pygame
+
+from settings import SCREEN_WIDTH, SCREEN_HEIGHT, TILE_SIZE, CHUNK_TILES
+from pathfinding import (CollisionGrid, PathCache, PathScheduler, PATH_BUDGET_US, create_collision_grid,
+                         astar_path, FlowField)
+from spatial import SpatialHash
+from chunks import ChunkMap, ChunkStreamer, Camera, CHUNK_SIZE
+from coins import CoinStore, VILLAGE, MIDNIGHT, WILD
+from mapfile import VILLAGE as VILLAGE_RECT, open_map_file
+from pathworkers import PathWorkerPool
+from profiler import PROFILER
+
+# ============================================
+# INPUT ACTIONS
+# ============================================
+
+# Held keys, applied on every tick
+MOVE_LEFT = 1 << 0
+MOVE_RIGHT = 1 << 1
+MOVE_UP = 1 << 2
+MOVE_DOWN = 1 << 3
+MOVE_MASK = MOVE_LEFT | MOVE_RIGHT | MOVE_UP | MOVE_DOWN
+
+# Key presses, applied once
+PRESS_INTERACT = 1 << 4  # E: talk, find the dog, open the chest
+PRESS_CONFIRM = 1 << 5   # SPACE: close dialogue, play again
+PRESS_SHOP = 1 << 6      # S: open/close the shop
+PRESS_UP = 1 << 7        # Shop selection
+PRESS_DOWN = 1 << 8
+PRESS_BUY = 1 << 9       # ENTER
+PRESS_CLOSE = 1 << 10    # ESC while the shop is open
+
+# A letter typed this tick (for cheat codes), stored as its ASCII code in bits 16-23
+TEXT_SHIFT = 16
+TEXT_MASK = 0xFF << TEXT_SHIFT
+
+def typed_letter(letter):
+    """Action bits for typing one letter"""
+    return (ord(letter.upper()) & 0xFF) << TEXT_SHIFT
+
+# ============================================
+# GAME OBJECTS
+# ============================================
+
+class GameObject:
+    def __init__(self, x, y, sprite, solid=False):
+        self.x, self.y, self.sprite, self.solid = x, y, sprite, solid
+        self.rect = pygame.Rect(x, y, TILE_SIZE, TILE_SIZE)
+
+class House(GameObject):
+    def __init__(self, x, y, sprite=None):
+        super().__init__(x, y, sprite, True)
+        self.rect = pygame.Rect(x, y, TILE_SIZE*2, TILE_SIZE*2)
+
+class PushableBlock(GameObject):
+    def __init__(self, x, y, sprite=None):
+        super().__init__(x, y, sprite, True)
+        self.pushable = True
+    
+    def push(self, dx, dy, obstacles):
+        new_x, new_y = self.x + dx, self.y + dy
+        new_rect = pygame.Rect(new_x, new_y, TILE_SIZE, TILE_SIZE)
+        if isinstance(obstacles, SpatialHash):
+            obstacles = obstacles.query(new_rect)
+        for obj in obstacles:
+            if obj != self and obj.solid and new_rect.colliderect(obj.rect):
+                return False
+        self.x, self.y = new_x, new_y
+        self.rect.topleft = (new_x, new_y)
+        return True
+
+# ============================================
+# AI NPC CLASS
+# ============================================
+
+class NPC:
+    def __init__(self, x, y, name, sprite=None, ai_type='static', rng=None):
+        self.x, self.y, self.sprite, self.name = x, y, sprite, name
+        self.rng = rng or random  # Source of wander targets
+        self.rect = pygame.Rect(x, y, TILE_SIZE, TILE_SIZE)
+        self.dialogue = []
+        self.dialogue_index = 0
+        self.visible = True
+        self.quest_giver = None
+        
+        # AI properties
+        self.ai_type = ai_type  # 'static', 'chase', 'patrol', 'wander'
+        self.speed = 0.8
+        self.path = []
+        self.path_index = 0
+        self.patrol_points = []
+        self.current_patrol_target = 0
+        self.wander_timer = 0
+        self.wander_target = (x, y)
+        self.wander_area = (50, 50, SCREEN_WIDTH - 50, SCREEN_HEIGHT - 50)  # x0, y0, x1, y1 of wander targets
+        self.detection_range = 150
+        self.ai_update_cooldown = 0
+        self.flow_target = None  # Next waypoint when chasing via a shared FlowField
+        
+    def update_ai(self, player_pos, obstacles, collision_grid, flow_field=None, scheduler=None):
+        """Update NPC AI behavior. With a scheduler (PathScheduler or PathWorkerPool),
+        re-plans are queued on it and the NPC keeps walking its old path until the
+        new one comes back."""
+        self.ai_update_cooldown -= 1
+        
+        if self.ai_type == 'static':
+            return
+        
+        elif self.ai_type == 'chase':
+            # Chase player if within detection range
+            dist = math.sqrt((self.x - player_pos[0])**2 + (self.y - player_pos[1])**2)
+            if dist >= self.detection_range:
+                self.flow_target = None
+            elif flow_field is not None:
+                # Shared flow field: one BFS per player tile serves every chaser
+                if self.flow_target is None:
+                    self.flow_target = flow_field.next_waypoint((self.x, self.y))
+                if self.flow_target:
+                    dx = self.flow_target[0] - self.x
+                    dy = self.flow_target[1] - self.y
+                    dist_to_target = math.sqrt(dx**2 + dy**2)
+                    
+                    if dist_to_target < 5:
+                        self.flow_target = None
+                    else:
+                        dx, dy = dx / dist_to_target, dy / dist_to_target
+                        self.x += dx * self.speed
+                        self.y += dy * self.speed
+            else:
+                # Recalculate path every 30 frames
+                if self.ai_update_cooldown <= 0:
+                    self.request_path(collision_grid, player_pos, scheduler, (0, dist))
+                    self.ai_update_cooldown = 30
+                
+                # Follow path
+                if self.path and self.path_index < len(self.path):
+                    target = self.path[self.path_index]
+                    dx = target[0] - self.x
+                    dy = target[1] - self.y
+                    dist_to_target = math.sqrt(dx**2 + dy**2)
+                    
+                    if dist_to_target < 5:
+                        self.path_index += 1
+                    else:
+                        dx, dy = dx / dist_to_target, dy / dist_to_target
+                        self.x += dx * self.speed
+                        self.y += dy * self.speed
+        
+        elif self.ai_type == 'patrol':
+            # Patrol between waypoints
+            if not self.patrol_points:
+                return
+            
+            target = self.patrol_points[self.current_patrol_target]
+            dx = target[0] - self.x
+            dy = target[1] - self.y
+            dist = math.sqrt(dx**2 + dy**2)
+            
+            if dist < 10:
+                self.current_patrol_target = (self.current_patrol_target + 1) % len(self.patrol_points)
+            else:
+                # Use pathfinding for patrol
+                if self.ai_update_cooldown <= 0:
+                    priority = (1, math.sqrt((self.x - player_pos[0])**2 + (self.y - player_pos[1])**2))
+                    self.request_path(collision_grid, target, scheduler, priority)
+                    self.ai_update_cooldown = 45
+                
+                if self.path and self.path_index < len(self.path):
+                    path_target = self.path[self.path_index]
+                    dx = path_target[0] - self.x
+                    dy = path_target[1] - self.y
+                    dist_to_target = math.sqrt(dx**2 + dy**2)
+                    
+                    if dist_to_target < 5:
+                        self.path_index += 1
+                    else:
+                        dx, dy = dx / dist_to_target, dy / dist_to_target
+                        self.x += dx * self.speed
+                        self.y += dy * self.speed
+        
+        elif self.ai_type == 'wander':
+            # Random wandering
+            self.wander_timer -= 1
+            
+            if self.wander_timer <= 0:
+                # Pick new random target
+                x0, y0, x1, y1 = self.wander_area
+                self.wander_target = (
+                    self.rng.randint(x0, x1),
+                    self.rng.randint(y0, y1)
+                )
+                self.wander_timer = self.rng.randint(120, 300)
+            
+            dx = self.wander_target[0] - self.x
+            dy = self.wander_target[1] - self.y
+            dist = math.sqrt(dx**2 + dy**2)
+            
+            if dist > 10:
+                dx, dy = dx / dist, dy / dist
+                self.x += dx * self.speed * 0.5
+                self.y += dy * self.speed * 0.5
+        
+        # Update rect
+        self.rect.topleft = (self.x, self.y)
+
+    def request_path(self, collision_grid, goal, scheduler, priority):
+        """Re-plan to goal: right away without a scheduler, else whenever the scheduler
+        gets to it (priorities are (0, distance) for chasers, (1, distance to the player) for patrols)"""
+        if scheduler is None:
+            self.set_path(astar_path(collision_grid, (self.x, self.y), goal))
+        else:
+            scheduler.request(self, collision_grid, (self.x, self.y), goal, priority)
+
+    def set_path(self, path):
+        self.path = path
+        self.path_index = 0
+
+# ============================================
+# COLLISION
+# ============================================
+
+def check_collision(x, y, objects, grid=None):
+    # Every solid object lies inside its (larger) grid stamp, so all-clear tiles mean no hit
+    if grid is not None and grid.area_clear(x, y, TILE_SIZE, TILE_SIZE):
+        return False
+    player_rect = pygame.Rect(x, y, TILE_SIZE, TILE_SIZE)
+    if isinstance(objects, SpatialHash):
+        objects = objects.query(player_rect)
+    for obj in objects:
+        if obj.solid and player_rect.colliderect(obj.rect):
+            return True
+    return False
+
+# ============================================
+# WORLD
+# ============================================
+
+# Independent random streams, so one subsystem drawing more numbers never shifts another
+RNG_STREAMS = ('coins', 'bob', 'wander')
+
+AUTOSAVE_TICKS = 60 * 30  # A retry checkpoint every 30 seconds of play, when safe
+
+# Bigger worlds than the village surround it with wilderness, streamed in from a
+# map file (see mapfile.py) a chunk at a time as the player comes near.
+ACTIVE_MARGIN = CHUNK_SIZE  # AI runs, and wilderness is loaded, this far past the edges of the view
+CHASE_RADIUS = 16  # Chase flow-field radius in tiles on big maps (stays inside the active chunks)
+WINDOW_CHUNKS = 5  # On big maps the collision grid covers this many chunks square, enough for the active chunks
+PREFETCH_CHUNKS = 2  # Rows/columns of chunks read ahead of the window in the direction the view moves
+CHUNK_MEMORY = 16 * 2**20  # Default budget for loaded wilderness chunks, in bytes
+LOADED_CHUNK_BYTES = 8 * 1024  # About what one loaded chunk costs: its record, trees, coins and index entries
+
+def make_rngs(seed):
+    """One random.Random per subsystem, all derived from `seed` (None = unseeded)"""
+    return {name: random.Random(None if seed is None else f"{seed}:{name}") for name in RNG_STREAMS}
+
+class World:
+    """The whole Coin Quest simulation, with no window, audio or frame cap.
+
+    `sprites` maps sprite names ('tree', 'house', ...) to surfaces; leave it out
+    to run headless. Sound cues are collected and returned by step().
+    `width` and `height` are the map size in pixels (never smaller than the
+    village); `map_seed` lays out the wilderness beyond the village. The
+    wilderness streams from the map file at `map_path` (by default one under
+    maps/, generated on first use), keeping about `chunk_memory` bytes of it loaded.
+    A map file made with another seed is refused; with `map_seed` None any is
+    taken, and map_seed is then the file's.
+    NPC path searches run on `ai_workers` worker processes, or on the
+    PathWorkerPool `path_workers` when the caller had to start one earlier
+    (main.py starts it before pygame); with neither they're time-sliced here.
+    Call close() when done with a big world (it closes the pool too).
+    """
+    def __init__(self, seed=None, sprites=None, width=SCREEN_WIDTH, height=SCREEN_HEIGHT, map_seed=None,
+                 map_path=None, chunk_memory=CHUNK_MEMORY, path_budget=PATH_BUDGET_US, ai_workers=0,
+                 path_workers=None):
+        # Worker processes for NPC path searches, if any; started first, before the chunk streamer's thread
+        self.path_workers = path_workers or (PathWorkerPool(ai_workers) if ai_workers else None)
+        self.sprites = sprites or {}
+        sprite = self.sprites.get
+        self.width, self.height = max(width, VILLAGE_RECT.width), max(height, VILLAGE_RECT.height)
+        self.wilderness = self.width > VILLAGE_RECT.width or self.height > VILLAGE_RECT.height
+
+        # World setup
+        tree = sprite('tree')
+        self.trees = [
+            GameObject(120, 80, tree, True), GameObject(160, 80, tree, True),
+            GameObject(280, 120, tree, True), GameObject(520, 180, tree, True),
+            GameObject(180, 420, tree, True), GameObject(620, 320, tree, True),
+            GameObject(140, 520, tree, True), GameObject(720, 460, tree, True),
+            GameObject(60, 240, tree, True), GameObject(740, 120, tree, True),
+            GameObject(380, 480, tree, True), GameObject(560, 80, tree, True),
+        ]
+
+        self.houses = [House(220, 160, sprite('house')), House(520, 360, sprite('house'))]
+        self.shop_sign = GameObject(200, 130, sprite('shop_sign'), False)
+        self.pushable_blocks = [PushableBlock(400, 200, sprite('block')), PushableBlock(432, 200, sprite('block'))]
+        self.block_starts = [(block.x, block.y) for block in self.pushable_blocks]
+
+        self.secret_tree = GameObject(740, 120, tree, True)
+        self.dog = GameObject(180, 420, sprite('dog'), False)
+        self.chest = GameObject(650, 450, sprite('chest'), True)
+
+        self.key_objects = [
+            GameObject(100, 500, sprite('key'), False),
+            GameObject(300, 100, sprite('key'), False),
+            GameObject(700, 200, sprite('key'), False)
+        ]
+
+        # Create collision grid for pathfinding (updated in place as obstacles change)
+        self.all_obstacles = self.trees + self.houses + self.pushable_blocks + [self.chest]
+        if self.wilderness:
+            # Just a window of the map, moved along with the view (see _stream_chunks)
+            window = WINDOW_CHUNKS * CHUNK_SIZE
+            self.collision_grid = CollisionGrid(min(window, self.width), min(window, self.height))
+            self.collision_grid.rebuild(self.all_obstacles)
+        else:
+            self.collision_grid = create_collision_grid(self.all_obstacles, self.width, self.height)
+        self.collision_grid.path_cache = PathCache()
+
+        # Broad-phase index of everything the player and pushed blocks collide with
+        self.solid_objects = SpatialHash()
+        for obj in self.trees + self.houses + self.pushable_blocks:
+            self.solid_objects.insert(obj)
+
+        # Trees and NPCs filed by chunk, so each tick only looks near the view
+        self.chunks = ChunkMap(self.width, self.height)
+        for tree in self.trees:
+            self.chunks.add('trees', tree)
+        self.camera = Camera(SCREEN_WIDTH, SCREEN_HEIGHT, self.width, self.height)
+        # Every coin is a slot in the coin store; these lists hold the slots of the
+        # village's coins and tonight's midnight coins, in the order they were made
+        self.coin_store = CoinStore()
+        self.coins, self.midnight_coins, self.npcs = [], [], []
+
+        # Wilderness streaming
+        self.streamer = (ChunkStreamer(open_map_file(self.width, self.height, map_seed, map_path))
+                         if self.wilderness else None)
+        self.map_seed = self.streamer.map_file.map_seed if self.streamer else map_seed or 0
+        self.max_loaded = max(WINDOW_CHUNKS ** 2, chunk_memory // LOADED_CHUNK_BYTES)
+        self.loaded = {}  # Chunk key -> (ChunkData, trees, coin slots) for wilderness chunks in memory
+        self.wild_collected = {}  # Chunk key -> collected flag per coin, for unloaded chunks with any collected
+        self.window_origin = None  # Map tile at the collision grid's top-left corner
+        self.window_keys = []  # Chunks under the collision grid
+
+        # All chasers share one distance map toward the player
+        self.chase_field = FlowField(CHASE_RADIUS if self.wilderness else None)
+        # NPC re-plans share a per-tick pathfinding budget (microseconds)
+        self.path_scheduler = PathScheduler(path_budget)
+
+        self.reset(seed)
+
+    def reset(self, seed=None):
+        """Start a brand-new game from `seed`, keeping the map, collision grid and spatial hash"""
+        self.seed = seed
+        self.rngs = make_rngs(seed)
+        self.collision_grid.path_cache.clear()  # Suffix hits depend on what was cached, so start empty
+        self.path_scheduler.clear()
+        if self.path_workers:
+            self.path_workers.clear()
+        sprite = self.sprites.get
+        rngs = self.rngs
+
+        # Game state
+        self.player_x, self.player_y = 400, 300
+        self.base_speed = 2
+        self.player_speed = self.base_speed
+        self.coins_collected = 0
+        self.keys_collected = 0
+        self.game_time = 0
+        self.frame_count = 0
+        self.inventory = []
+        self.cheat_buffer = ""
+
+        self.quests = {
+            'tom_coins': {'active': False, 'complete': False, 'progress': 0, 'required': 5},
+            'deliver_letter': {'active': False, 'complete': False, 'has_letter': False},
+            'find_dog': {'active': False, 'complete': False}
+        }
+
+        self.shop_items = {
+            'speed_boots': {'name': 'Speed Boots', 'price': 10, 'owned': False, 'desc': 'Walk faster!'},
+            'magnet': {'name': 'Coin Magnet', 'price': 15, 'owned': False, 'desc': 'Auto-collect coins'},
+            'detector': {'name': 'Coin Detector', 'price': 12, 'owned': False, 'desc': 'Shows nearest coin'},
+        }
+
+        self.showing_dialogue = False
+        self.current_dialogue = ""
+        self.current_npc_name = ""
+        self.showing_shop = False
+        self.selected_shop_item = 0
+        self.game_won = False
+        self.game_over = False
+        self.sounds = []  # Sound cues since the last step()
+        self.checkpoint = None  # Latest autosave snapshot (see savegame.py for the file format)
+
+        # Take the last game's NPCs out of the chunks and drop its coins; wilderness
+        # chunks load again, with this seed's coins, as they become active
+        chunks = self.chunks
+        for npc in self.npcs:
+            chunks.remove('npcs', npc)
+        self._unload_chunks()
+        self.coin_store.clear()
+        self.wild_collected = {}
+        self.active_keys = self.active_view = None
+
+        # Put pushed blocks back and the chest back into the grid
+        for block, (x, y) in zip(self.pushable_blocks, self.block_starts):
+            if (block.x, block.y) != (x, y):
+                block.x, block.y = x, y
+                block.rect.topleft = (x, y)
+                self.collision_grid.move(block)
+                self.solid_objects.move(block)
+        self.collision_grid.add(self.chest)
+
+        self.secret_tree.has_treasure = True
+        self.dog.found = False
+        self.chest.opened = False
+        for key in self.key_objects:
+            key.collected = False
+
+        # Create NPCs with AI
+        npc, guard = sprite('npc'), sprite('guard')
+        self.npcs = [
+            NPC(360, 260, "OLD MAN TOM", npc, 'static', rngs['wander']),
+            NPC(460, 420, "LITTLE SUSIE", npc, 'wander', rngs['wander']),
+            NPC(240, 140, "SHOPKEEPER JOE", npc, 'static', rngs['wander']),
+            NPC(600, 100, "GUARD PATROL", guard, 'patrol', rngs['wander']),
+            NPC(100, 300, "FRIENDLY GUARD", guard, 'chase', rngs['wander']),
+        ]
+        npcs = self.npcs
+
+        # Set NPC dialogues
+        npcs[0].dialogue = [
+            "Hello traveler! I lost some coins...",
+            "Can you find 5 coins for me? I'll give you a treasure map!"
+        ]
+        npcs[0].quest_giver = 'tom_coins'
+
+        npcs[1].dialogue = [
+            "Hi! My dog ran away! Can you find him?",
+            "He likes to hide behind trees!"
+        ]
+        npcs[1].quest_giver = 'find_dog'
+
+        npcs[2].dialogue = [
+            "Welcome to my shop! Press S to browse!",
+            "I have useful items for sale!"
+        ]
+
+        npcs[3].dialogue = ["I'm on patrol duty!", "Stay out of trouble!"]
+        npcs[3].patrol_points = [(600, 100), (700, 100), (700, 250), (600, 250)]
+        npcs[3].speed = 1.5  # Faster patrol speed
+
+        npcs[4].dialogue = ["I'll catch you!", "You can't escape!"]
+        npcs[4].speed = 2.0  # Faster chase speed
+        npcs[4].is_enemy = True  # Mark as enemy
+        self._file_npcs()
+
+        self.coins = []
+        coin_rng = rngs['coins']
+        for _ in range(25):
+            x, y = coin_rng.randint(50, SCREEN_WIDTH - 50), coin_rng.randint(50, SCREEN_HEIGHT - 50)
+            self.coins.append(self.coin_store.spawn(x, y, rngs['bob']))
+
+        self.midnight_coins = []
+        self.follow_player()
+        self.update_active_chunks()
+
+    def refile(self):
+        """Rebuild the chunk index from the object lists (after replacing them wholesale)"""
+        self.chunks = ChunkMap(self.width, self.height)
+        self.camera = Camera(SCREEN_WIDTH, SCREEN_HEIGHT, self.width, self.height)
+        for tree in self.trees:
+            self.chunks.add('trees', tree)
+        for _, trees, _ in self.loaded.values():
+            for tree in trees:
+                self.chunks.add('trees', tree)
+        self._file_npcs()
+        self.active_keys = self.active_view = None
+        self.follow_player()
+
+    def _file_npcs(self):
+        for order, npc in enumerate(self.npcs):
+            npc.order = order  # Active NPCs update in this order, wherever they are filed
+            self.chunks.add('npcs', npc)
+
+    # ============================================
+    # CHUNKS
+    # ============================================
+
+    def follow_player(self):
+        self.camera.follow(self.player_x + TILE_SIZE // 2, self.player_y + TILE_SIZE // 2)
+
+    def update_active_chunks(self):
+        """Find the chunks near the view, streaming in any wilderness that just came into reach"""
+        camera = self.camera
+        view = (camera.x, camera.y)
+        if view == self.active_view:
+            return
+        self.active_view = view
+        self.active_rect = camera.rect.inflate(2 * ACTIVE_MARGIN, 2 * ACTIVE_MARGIN)
+        keys = self.chunks.keys_in_rect(self.active_rect)
+        if keys == self.active_keys:
+            return
+        previous, self.active_keys = self.active_keys, keys
+        if self.streamer is not None:
+            self._stream_chunks(keys, previous)
+
+    def _stream_chunks(self, keys, previous):
+        """Load the chunks under the collision grid window, move the window over them,
+        queue the chunks ahead for the streamer and unload the farthest if over budget"""
+        grid = self.collision_grid
+        cx0, cy0 = keys[0]
+        # The window starts at the active chunks, backed off the map's far edges so it stays full
+        origin = (min(cx0 * CHUNK_TILES, self.width // TILE_SIZE - grid.grid_w),
+                  min(cy0 * CHUNK_TILES, self.height // TILE_SIZE - grid.grid_h))
+        if origin != self.window_origin:
+            self.window_keys = self.chunks.keys_in_rect(pygame.Rect(
+                origin[0] * TILE_SIZE, origin[1] * TILE_SIZE, grid.grid_w * TILE_SIZE, grid.grid_h * TILE_SIZE))
+        for key in self.window_keys:
+            if key not in self.loaded:
+                self._load_chunk(key)
+        if origin != self.window_origin:
+            self.window_origin = origin
+            grid.recenter(origin, self._fill_window)
+
+        if previous:
+            dx, dy = (cx0 > previous[0][0]) - (cx0 < previous[0][0]), (cy0 > previous[0][1]) - (cy0 < previous[0][1])
+        else:
+            dx = dy = 0
+        self.streamer.prefetch([key for key in self._keys_ahead(dx, dy) if key not in self.loaded])
+        # Records read ahead stay wanted while they're near the window, whichever way the view turns
+        wx0, wy0 = self.window_keys[0]
+        wx1, wy1 = self.window_keys[-1]
+        near = PREFETCH_CHUNKS
+        self.streamer.discard({(x, y) for y in range(wy0 - near, wy1 + near + 1)
+                               for x in range(wx0 - near, wx1 + near + 1)})
+        self._evict_chunks()
+
+    def _keys_ahead(self, dx, dy):
+        """Chunks past the window in the direction (dx, dy), nearest first; all
+        four sides, one deep, when the view hasn't moved"""
+        wx0, wy0 = self.window_keys[0]
+        wx1, wy1 = self.window_keys[-1]
+        if dx or dy:
+            sides, depth = [side for side in ((dx, 0), (0, dy)) if side != (0, 0)], PREFETCH_CHUNKS
+        else:
+            sides, depth = ((1, 0), (-1, 0), (0, 1), (0, -1)), 1
+        cols, rows = self.chunks.cols, self.chunks.rows
+        keys = []
+        for step in range(1, depth + 1):
+            for sx, sy in sides:
+                if sx:
+                    x = wx1 + step if sx > 0 else wx0 - step
+                    if 0 <= x < cols:
+                        keys += [(x, y) for y in range(wy0, wy1 + 1)]
+                else:
+                    y = wy1 + step if sy > 0 else wy0 - step
+                    if 0 <= y < rows:
+                        keys += [(x, y) for x in range(wx0, wx1 + 1)]
+        return keys
+
+    def _fill_window(self, grid):
+        """Copy the static tiles under the collision grid out of the loaded chunk records"""
+        cells, grid_w, grid_h = grid.cells, grid.grid_w, grid.grid_h
+        gx0, gy0 = grid.gx0, grid.gy0
+        for key in self.window_keys:
+            tiles = self.loaded[key][0].tiles
+            left, top = key[0] * CHUNK_TILES, key[1] * CHUNK_TILES
+            x0, x1 = max(left, gx0), min(left + CHUNK_TILES, gx0 + grid_w)
+            for ty in range(max(top, gy0), min(top + CHUNK_TILES, gy0 + grid_h)):
+                src = (ty - top) * CHUNK_TILES - left
+                dst = (ty - gy0) * grid_w - gx0
+                cells[dst + x0:dst + x1] = tiles[src + x0:src + x1]
+
+    def _load_chunk(self, key):
+        """Bring one wilderness chunk's trees and this game's coins into the world"""
+        data = self.streamer.take(key)
+        chunks, tree_sprite = self.chunks, self.sprites.get('tree')
+        trees = [GameObject(x, y, tree_sprite, True) for x, y in data.trees]
+        for tree in trees:
+            self.solid_objects.insert(tree)
+            chunks.add('trees', tree)
+        # Trees are already in the map's static tiles, so they don't go on the collision
+        # grid. Coins bob from an RNG of the chunk's own, so load order doesn't matter.
+        rng = random.Random(None if self.seed is None else f"{self.seed}:coins:{key[0]}:{key[1]}")
+        collected = self.wild_collected.pop(key, ())
+        store = self.coin_store
+        coins = [store.spawn(x, y, rng, WILD) for x, y in data.coins]
+        store.set_collected([slot for slot, flag in zip(coins, collected) if flag], True)
+        self.loaded[key] = (data, trees, coins)
+
+    def _unload_chunk(self, key):
+        """Drop a wilderness chunk, remembering which of its coins were collected"""
+        _, trees, coins = self.loaded.pop(key)
+        for tree in trees:
+            self.solid_objects.remove(tree)
+            self.chunks.remove('trees', tree)
+        collected = tuple(self.coin_store.collected[coins].tolist())
+        self.coin_store.release(coins)
+        if any(collected):
+            self.wild_collected[key] = collected
+
+    def _unload_chunks(self):
+        for key in list(self.loaded):
+            self._unload_chunk(key)
+
+    def _evict_chunks(self):
+        """Unload the chunks farthest from the view until back under max_loaded"""
+        excess = len(self.loaded) - self.max_loaded
+        if excess <= 0:
+            return
+        camera = self.camera
+        cx, cy = self.chunks.key_at(camera.x + camera.view_w // 2, camera.y + camera.view_h // 2)
+        window = set(self.window_keys)
+        far = sorted((key for key in self.loaded if key not in window),
+                     key=lambda key: (-max(abs(key[0] - cx), abs(key[1] - cy)), key))
+        for key in far[:excess]:
+            self._unload_chunk(key)
+
+    def _wild_coins(self):
+        return [slot for _, _, coins in self.loaded.values() for slot in coins]
+
+    def _wild_collected(self):
+        """Chunk key -> collected flag per coin, for every wilderness chunk with any collected"""
+        collected = dict(self.wild_collected)
+        for key, (_, _, coins) in self.loaded.items():
+            flags = tuple(self.coin_store.collected[coins].tolist())
+            if any(flags):
+                collected[key] = flags
+        return collected
+
+    def close(self):
+        """Stop the chunk streamer and AI workers and close the map file"""
+        if self.streamer is not None:
+            self.streamer.close()
+            self.streamer = None
+        if self.path_workers is not None:
+            self.path_workers.close()
+            self.path_workers = None
+
+    # ============================================
+    # QUERIES
+    # ============================================
+
+    def get_time_of_day(self):
+        game_time = self.game_time
+        if game_time < 360: return 'night'
+        elif game_time < 420: return 'sunrise'
+        elif game_time < 1080: return 'day'
+        elif game_time < 1140: return 'sunset'
+        else: return 'night'
+
+    def find_nearest_coin(self):
+        """(x, y) of the nearest uncollected coin, not counting midnight coins, or None"""
+        store = self.coin_store
+        slots = store.nearest(self.player_x, self.player_y)
+        if not slots:
+            return None
+        if len(slots) > 1:
+            # Equally near: the first found searching outward a ring of chunks at a time, row by row
+            key_at = self.chunks.key_at
+            cx, cy = key_at(self.player_x, self.player_y)
+            def search_order(slot):
+                kx, ky = key_at(store.x[slot], store.y[slot])
+                return max(abs(kx - cx), abs(ky - cy)), ky, kx, slot
+            slots = [min(slots, key=search_order)]
+        return int(store.x[slots[0]]), int(store.y[slots[0]])
+
+    def state_hash(self):
+        """64-bit digest of the simulation state, compared at replay checkpoints"""
+        state = (
+            self.frame_count, self.game_time, self.player_x, self.player_y, self.player_speed,
+            self.coins_collected, self.keys_collected, self.cheat_buffer,
+            self.showing_dialogue, self.current_dialogue, self.showing_shop, self.selected_shop_item,
+            self.game_won, self.game_over,
+            [tuple(quest.values()) for quest in self.quests.values()],
+            [item['owned'] for item in self.shop_items.values()],
+            [(block.x, block.y) for block in self.pushable_blocks],
+            hasattr(self.secret_tree, 'has_treasure'), self.dog.found, self.chest.opened,
+            [key.collected for key in self.key_objects],
+            [(npc.x, npc.y, npc.dialogue_index, npc.wander_target) for npc in self.npcs],
+            [state[:3] for state in self.coin_store.states(self.coins + self.midnight_coins)],
+        )
+        wild_collected = self._wild_collected()
+        if wild_collected:  # Only once wilderness coins are collected, so village recordings keep their hashes
+            state += (sorted(wild_collected.items()),)
+        digest = hashlib.blake2b(repr(state).encode(), digest_size=8).digest()
+        return int.from_bytes(digest, 'little')
+
+    # ============================================
+    # SIMULATION
+    # ============================================
+
+    def step(self, actions=0, n_ticks=1):
+        """Advance the simulation and return the sound cues it produced.
+
+        `actions` is either one bitmask, whose movement keys are held for all
+        n_ticks and whose key presses happen on the first tick, or a sequence
+        with one bitmask per tick (n_ticks is then ignored).
+        """
+        if isinstance(actions, int):
+            held = actions & MOVE_MASK
+            for i in range(n_ticks):
+                self.tick(actions if i == 0 else held)
+        else:
+            for tick_actions in actions:
+                self.tick(tick_actions)
+        sounds, self.sounds = self.sounds, []
+        return sounds
+
+    def tick(self, actions=0):
+        """One frame of game logic"""
+        profiler = PROFILER if PROFILER.enabled else None
+        if profiler: t = profiler.clock()
+        self.frame_count += 1
+        self.game_time = (self.game_time + 0.5) % 1440
+
+        self.update_active_chunks()
+        chunks = self.chunks
+
+        # Spawn midnight coins (somewhere on screen), in the slots last night's coins gave back
+        if self.get_time_of_day() == 'night' and self.game_time > 1200 and len(self.midnight_coins) == 0:
+            coin_rng = self.rngs['coins']
+            view_x, view_y = self.camera.x, self.camera.y
+            for _ in range(5):
+                x = coin_rng.randint(view_x + 50, view_x + SCREEN_WIDTH - 50)
+                y = coin_rng.randint(view_y + 50, view_y + SCREEN_HEIGHT - 50)
+                self.midnight_coins.append(self.coin_store.spawn(x, y, self.rngs['bob'], MIDNIGHT))
+        elif self.get_time_of_day() != 'night' and self.midnight_coins:
+            self.coin_store.release(self.midnight_coins)
+            self.midnight_coins.clear()
+
+        # Update speed
+        self.player_speed = self.base_speed * (2 if self.shop_items['speed_boots']['owned'] else 1)
+
+        if profiler: t = profiler.lap('time', t)
+
+        # Update NPC AI (only NPCs in the chunks around the view)
+        player_pos = (self.player_x, self.player_y)
+        self.chase_field.update(self.collision_grid, player_pos)
+        scheduler = self.path_workers or self.path_scheduler
+        scheduler.begin_tick()
+        active_npcs = chunks.query('npcs', self.active_rect)
+        active_npcs.sort(key=lambda npc: npc.order)
+        for npc in active_npcs:
+            if npc.visible:
+                npc.update_ai(player_pos, self.all_obstacles, self.collision_grid, self.chase_field, scheduler)
+                chunks.move('npcs', npc)
+
+                # Check if enemy NPC caught the player
+                if hasattr(npc, 'is_enemy') and npc.is_enemy:
+                    dist = math.sqrt((npc.x - self.player_x)**2 + (npc.y - self.player_y)**2)
+                    if dist < 30:  # Caught!
+                        self.game_over = True
+        if self.path_workers:
+            self.path_workers.dispatch()
+        if profiler: profiler.count('paths_waiting', len(self.path_scheduler.queue))
+        if profiler: t = profiler.lap('ai', t)
+
+        self.handle_presses(actions)
+        if profiler: t = profiler.lap('input', t)
+
+        if not self.showing_dialogue and not self.game_won and not self.showing_shop and not self.game_over:
+            self.update_player(actions)
+            self.follow_player()
+            if profiler: t = profiler.lap('player', t)
+
+        if self.frame_count % AUTOSAVE_TICKS == 0 and self.safe_to_checkpoint():
+            self.checkpoint = self.snapshot()
+            if profiler: profiler.lap('autosave', t)
+
+    def show_dialogue(self, name, text):
+        self.showing_dialogue = True
+        self.current_dialogue = text
+        self.current_npc_name = name
+
+    def handle_presses(self, actions):
+        """Apply this tick's key presses"""
+        letter = (actions & TEXT_MASK) >> TEXT_SHIFT
+        if letter:
+            # Cheat code handling
+            self.cheat_buffer += chr(letter).upper()
+            self.cheat_buffer = self.cheat_buffer[-5:]
+            if self.cheat_buffer == "SPEED":
+                self.shop_items['speed_boots']['owned'] = True
+                self.show_dialogue("SYSTEM", "CHEAT ACTIVATED: Speed Boots!")
+
+        if actions & PRESS_CLOSE and self.showing_shop:
+            self.showing_shop = False
+
+        if actions & PRESS_CONFIRM:
+            if self.showing_dialogue:
+                self.showing_dialogue = False
+            if self.game_over and self.checkpoint is not None:
+                self.restore(self.checkpoint)  # Retry from the last autosave
+            elif self.game_won or self.game_over:
+                self.restart()
+
+        if actions & PRESS_SHOP and not self.showing_dialogue and not self.game_won:
+            shopkeeper = self.npcs[2]
+            dist_x, dist_y = abs(self.player_x - shopkeeper.x), abs(self.player_y - shopkeeper.y)
+            if dist_x < 60 and dist_y < 60:
+                self.showing_shop = not self.showing_shop
+
+        if self.showing_shop:
+            if actions & PRESS_UP:
+                self.selected_shop_item = (self.selected_shop_item - 1) % len(self.shop_items)
+            elif actions & PRESS_DOWN:
+                self.selected_shop_item = (self.selected_shop_item + 1) % len(self.shop_items)
+            elif actions & PRESS_BUY:
+                item_key = list(self.shop_items.keys())[self.selected_shop_item]
+                item = self.shop_items[item_key]
+                if not item['owned'] and self.coins_collected >= item['price']:
+                    self.coins_collected -= item['price']
+                    item['owned'] = True
+                    self.sounds.append('purchase')
+                    self.show_dialogue("SHOPKEEPER", f"Purchased {item['name']}!")
+                    self.showing_shop = False
+
+        if actions & PRESS_INTERACT and not self.showing_dialogue and not self.showing_shop:
+            self.interact()
+
+    def interact(self):
+        """E key: talk to a nearby NPC, pick up the dog, open the chest"""
+        player_x, player_y = self.player_x, self.player_y
+
+        # Check NPC interaction
+        for npc in self.npcs:
+            if not npc.visible:
+                continue
+            dist_x, dist_y = abs(player_x - npc.x), abs(player_y - npc.y)
+            if dist_x < 50 and dist_y < 50:
+                if npc.dialogue_index < len(npc.dialogue):
+                    self.show_dialogue(npc.name, npc.dialogue[npc.dialogue_index])
+                else:
+                    self.show_dialogue(npc.name, npc.dialogue[-1])
+                npc.dialogue_index += 1
+
+                if npc.quest_giver and not self.quests[npc.quest_giver]['active']:
+                    self.quests[npc.quest_giver]['active'] = True
+                break
+
+        # Check dog interaction
+        dog = self.dog
+        if not dog.found:
+            dist_x, dist_y = abs(player_x - dog.x), abs(player_y - dog.y)
+            if dist_x < 40 and dist_y < 40:
+                dog.found = True
+                self.quests['find_dog']['complete'] = True
+                self.sounds.append('dog')
+                self.show_dialogue("DOG", "You found the dog! Susie will be happy!")
+
+        # Check chest
+        chest = self.chest
+        if self.keys_collected >= 3 and not chest.opened:
+            dist_x, dist_y = abs(player_x - chest.x), abs(player_y - chest.y)
+            if dist_x < 40 and dist_y < 40:
+                chest.opened = True
+                self.collision_grid.remove(chest)
+                self.coins_collected += 50
+                self.sounds.append('treasure')
+                self.show_dialogue("TREASURE", "You unlocked the chest! +50 coins!")
+
+    # ============================================
+    # SNAPSHOTS
+    # ============================================
+
+    def safe_to_checkpoint(self):
+        """A retry point is only useful if no chasing guard can see the player"""
+        if self.game_over or self.game_won:
+            return False
+        for npc in self.npcs:
+            if getattr(npc, 'is_enemy', False):
+                dist = math.sqrt((npc.x - self.player_x)**2 + (npc.y - self.player_y)**2)
+                if dist < npc.detection_range:
+                    return False
+        return True
+
+    def snapshot(self):
+        """Copy of every piece of mutable game state, made of plain values only"""
+        return {
+            'seed': self.seed,
+            'player': (self.player_x, self.player_y, self.player_speed),
+            'progress': (self.coins_collected, self.keys_collected, self.game_time, self.frame_count),
+            'cheat_buffer': self.cheat_buffer,
+            'inventory': tuple(self.inventory),
+            'ui': (self.showing_dialogue, self.current_dialogue, self.current_npc_name,
+                   self.showing_shop, self.selected_shop_item, self.game_won, self.game_over),
+            'quests': {name: dict(quest) for name, quest in self.quests.items()},
+            'shop': {name: item['owned'] for name, item in self.shop_items.items()},
+            'blocks': tuple((block.x, block.y) for block in self.pushable_blocks),
+            'flags': (hasattr(self.secret_tree, 'has_treasure'), self.dog.found, self.chest.opened),
+            'keys': tuple(key.collected for key in self.key_objects),
+            'npcs': tuple((npc.x, npc.y, npc.speed, npc.detection_range, npc.visible, npc.dialogue_index,
+                           tuple(npc.path), npc.path_index, npc.current_patrol_target, npc.wander_timer,
+                           npc.wander_target, npc.ai_update_cooldown, npc.flow_target) for npc in self.npcs),
+            'coins': self.coin_store.states(self.coins),
+            'midnight_coins': self.coin_store.states(self.midnight_coins),
+            'wild_coins': self._wild_collected(),
+            'size': (self.width, self.height),
+            'rngs': {name: rng.getstate() for name, rng in self.rngs.items()},
+        }
+
+    def restore(self, snapshot):
+        """Put the world back into the state captured by snapshot()"""
+        self.seed = snapshot['seed']
+        self.collision_grid.path_cache.clear()
+        self.path_scheduler.clear()
+        if self.path_workers:
+            self.path_workers.clear()
+        self.player_x, self.player_y, self.player_speed = snapshot['player']
+        self.coins_collected, self.keys_collected, self.game_time, self.frame_count = snapshot['progress']
+        self.cheat_buffer = snapshot['cheat_buffer']
+        self.inventory = list(snapshot['inventory'])
+        (self.showing_dialogue, self.current_dialogue, self.current_npc_name,
+         self.showing_shop, self.selected_shop_item, self.game_won, self.game_over) = snapshot['ui']
+        for name, quest in snapshot['quests'].items():
+            self.quests[name].update(quest)
+        for name, owned in snapshot['shop'].items():
+            self.shop_items[name]['owned'] = owned
+
+        for block, (x, y) in zip(self.pushable_blocks, snapshot['blocks']):
+            if (block.x, block.y) != (x, y):
+                block.x, block.y = x, y
+                block.rect.topleft = (x, y)
+                self.collision_grid.move(block)
+                self.solid_objects.move(block)
+
+        has_treasure, self.dog.found, self.chest.opened = snapshot['flags']
+        if has_treasure:
+            self.secret_tree.has_treasure = True
+        elif hasattr(self.secret_tree, 'has_treasure'):
+            delattr(self.secret_tree, 'has_treasure')
+        if self.chest.opened:
+            self.collision_grid.remove(self.chest)
+        else:
+            self.collision_grid.add(self.chest)
+        for key, collected in zip(self.key_objects, snapshot['keys']):
+            key.collected = collected
+
+        for npc, state in zip(self.npcs, snapshot['npcs']):
+            (npc.x, npc.y, npc.speed, npc.detection_range, npc.visible, npc.dialogue_index,
+             path, npc.path_index, npc.current_patrol_target, npc.wander_timer,
+             npc.wander_target, npc.ai_update_cooldown, npc.flow_target) = state
+            npc.path = list(path)
+            npc.rect.topleft = (npc.x, npc.y)
+            self.chunks.move('npcs', npc)
+
+        self._restore_coins(self.coins, snapshot['coins'])
+        self._restore_coins(self.midnight_coins, snapshot['midnight_coins'], MIDNIGHT)
+
+        # Wilderness chunks load again from the map file; only which coins were collected is saved
+        self._unload_chunks()
+        self.wild_collected = dict(snapshot.get('wild_coins', {}))
+        self.active_keys = self.active_view = None
+        self.follow_player()
+        self.update_active_chunks()
+
+        # Last, since spawning coins above draws from the 'bob' stream
+        for name, state in snapshot['rngs'].items():
+            self.rngs[name].setstate(state)
+
+    def _restore_coins(self, coins, states, kind=VILLAGE):
+        """Resize a list of coin slots to match the saved states, then load them"""
+        store = self.coin_store
+        while len(coins) < len(states):
+            coins.append(store.spawn(0, 0, self.rngs['bob'], kind))
+        store.release(coins[len(states):])
+        del coins[len(states):]
+        store.set_states(coins, states)
+
+    def restart(self):
+        """Play again after winning or getting caught"""
+        self.coins_collected, self.keys_collected = 0, 0
+        self.game_won = False
+        self.game_over = False
+        self.checkpoint = None  # The last game's autosave isn't a retry point for this one
+        self.player_x, self.player_y = 400, 300  # Reset player position
+        self.coin_store.set_collected(self.coins + self._wild_coins(), False)
+        self.wild_collected.clear()
+        for key in self.key_objects:
+            key.collected = False
+        self.chest.opened = False
+        self.collision_grid.add(self.chest)
+        self.dog.found = False
+        for quest in self.quests.values():
+            quest['active'], quest['complete'] = False, False
+
+    def update_player(self, actions):
+        """Movement, block pushing and pickups for one tick"""
+        player_x, player_y = self.player_x, self.player_y
+        player_speed = self.player_speed
+        new_x, new_y = player_x, player_y
+        moved = False
+
+        if actions & MOVE_LEFT:
+            new_x -= player_speed
+            moved = True
+        if actions & MOVE_RIGHT:
+            new_x += player_speed
+            moved = True
+        if actions & MOVE_UP:
+            new_y -= player_speed
+            moved = True
+        if actions & MOVE_DOWN:
+            new_y += player_speed
+            moved = True
+
+        # Check if pushing a block
+        if moved:
+            player_rect = pygame.Rect(new_x, new_y, TILE_SIZE, TILE_SIZE)
+            for block in self.pushable_blocks:
+                if player_rect.colliderect(block.rect):
+                    dx = player_speed if actions & MOVE_RIGHT else (-player_speed if actions & MOVE_LEFT else 0)
+                    dy = player_speed if actions & MOVE_DOWN else (-player_speed if actions & MOVE_UP else 0)
+                    if block.push(dx * 8, dy * 8, self.solid_objects):
+                        self.collision_grid.move(block)
+                        self.solid_objects.move(block)
+                    else:
+                        new_x, new_y = player_x, player_y
+                    break
+
+        if not check_collision(new_x, new_y, self.solid_objects, self.collision_grid):
+            player_x, player_y = new_x, new_y
+
+        player_x = max(0, min(player_x, self.width - TILE_SIZE))
+        player_y = max(0, min(player_y, self.height - TILE_SIZE))
+        self.player_x, self.player_y = player_x, player_y
+
+        # Collect coins: the ones touched, or pulled in by the magnet
+        profiler = PROFILER if PROFILER.enabled else None
+        if profiler: t = profiler.clock()
+        magnet_range = 80 if self.shop_items['magnet']['owned'] else 0
+        for _ in range(len(self.coin_store.collect(player_x, player_y, magnet_range))):
+            self.collect_coin()
+        if profiler: profiler.lap('coins', t)
+        player_rect = pygame.Rect(player_x, player_y, TILE_SIZE, TILE_SIZE)
+
+        # Collect keys
+        for key in self.key_objects:
+            if not key.collected and player_rect.colliderect(key.rect):
+                key.collected = True
+                self.keys_collected += 1
+                self.sounds.append('key')
+                self.show_dialogue("KEY", f"Found a key! ({self.keys_collected}/3)")
+
+        # Secret treasure
+        secret_tree = self.secret_tree
+        if self.quests['tom_coins']['complete'] and hasattr(secret_tree, 'has_treasure'):
+            dist_x, dist_y = abs(player_x - secret_tree.x), abs(player_y - secret_tree.y)
+            if dist_x < 40 and dist_y < 40:
+                self.coins_collected += 50
+                self.sounds.append('treasure')
+                self.show_dialogue("SECRET", "SECRET FOUND! +50 coins hidden behind the tree!")
+                delattr(secret_tree, 'has_treasure')
+
+        # Win condition
+        if self.coins_collected >= 100:
+            self.game_won = True
+
+    def collect_coin(self):
+        self.coins_collected += 1
+        self.sounds.append('coin')
+        quest = self.quests['tom_coins']
+        if quest['active'] and not quest['complete']:
+            quest['progress'] += 1
+            if quest['progress'] >= quest['required']:
+                quest['complete'] = True
+                self.sounds.append('quest')
+                self.show_dialogue("QUEST", "Quest complete! You found 5 coins for Tom! Check behind the big tree!")